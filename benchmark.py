@@ -0,0 +1,428 @@
+import argparse
+import contextlib
+import functools
+import importlib.util
+import io
+import itertools
+import json
+import math
+import random
+import re
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import asdict, dataclass, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+
+import config
+import download_files
+
+
+# Engines that take (data_config, download_config) and return (elapsed_time, download_status).
+# New engines are added here to be part of the sweep.
+ENGINES: dict[str, Callable[[config.DataConfig, config.DownloadConfig], tuple[float, dict]]] = {
+    "sequential": download_files.main_sequential,
+    "concurrent": download_files.main_concurrent,
+}
+if importlib.util.find_spec("aiohttp") is not None:
+    ENGINES["async"] = download_files.main_async
+
+# Read-idle timeout used by the benchmark, the fake server hangs longer than this for its timeouts
+READ_TIMEOUT = 1.0
+
+# Same check as download_files.clean_url_column, applied one URL at a time
+URL_PATTERN = re.compile(r"(?i)https?://[^\s/]+")
+
+
+@dataclass(frozen=True)
+class ServerProfile:
+    """How the fake PDF server answers.
+
+    Every path gets its outcome, latency and payload size from a random generator seeded
+    with seed and the path, so the same URL is answered the same way in every run and by
+    every engine.
+
+    Attributes:
+        latency: Distribution of the delay before the response headers are sent,
+            one of "fixed", "uniform", "exponential" or "lognormal".
+        latency_mean: Mean delay in seconds.
+        latency_spread: Half-width for "uniform", sigma for "lognormal", unused otherwise.
+        payload_min: Smallest PDF body in bytes.
+        payload_max: Largest PDF body in bytes.
+        forbidden_rate: Share of paths answered with 403.
+        missing_rate: Share of paths answered with 404.
+        timeout_rate: Share of paths that never send a response.
+        not_pdf_rate: Share of paths answered with an HTML page.
+        hang_seconds: How long a timed out path keeps the connection open.
+        seed: Seed of the per-path random generators.
+    """
+    latency: str = "fixed"
+    latency_mean: float = 0.05
+    latency_spread: float = 0.0
+    payload_min: int = 16 * 1024
+    payload_max: int = 256 * 1024
+    forbidden_rate: float = 0.05
+    missing_rate: float = 0.1
+    timeout_rate: float = 0.02
+    not_pdf_rate: float = 0.1
+    hang_seconds: float = READ_TIMEOUT + 1.0
+    seed: int = 0
+
+    def outcome(self, path: str) -> tuple[str, float, int]:
+        """Returns what the server does for path.
+
+        Args:
+            path: The request path, e.g. "/12.pdf".
+
+        Returns:
+            tuple: The outcome ("pdf", "forbidden", "missing", "timeout" or "not_pdf"),
+                   the delay before the headers in seconds and the body size in bytes.
+        """
+        rng = random.Random(f"{self.seed}:{path}")
+        draw = rng.random()
+        outcome = "pdf"
+        for name, rate in [("forbidden", self.forbidden_rate), ("missing", self.missing_rate),
+                           ("timeout", self.timeout_rate), ("not_pdf", self.not_pdf_rate)]:
+            if draw < rate:
+                outcome = name
+                break
+            draw -= rate
+
+        if self.latency == "fixed":
+            delay = self.latency_mean
+        elif self.latency == "uniform":
+            delay = rng.uniform(self.latency_mean - self.latency_spread, self.latency_mean + self.latency_spread)
+        elif self.latency == "exponential":
+            delay = rng.expovariate(1 / self.latency_mean) if self.latency_mean > 0 else 0.0
+        elif self.latency == "lognormal":
+            # mu is chosen so the distribution has the requested mean
+            mu = math.log(self.latency_mean) - self.latency_spread ** 2 / 2 if self.latency_mean > 0 else 0.0
+            delay = rng.lognormvariate(mu, self.latency_spread) if self.latency_mean > 0 else 0.0
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.latency}")
+
+        return outcome, max(delay, 0.0), rng.randint(self.payload_min, self.payload_max)
+
+    def expected_code(self, path: str) -> int:
+        """Returns the status code download_files should log for a row whose only URL is path."""
+        return {"pdf": 200, "forbidden": 403, "missing": 404, "timeout": 408, "not_pdf": 415}[self.outcome(path)[0]]
+
+
+def pdf_body(size: int) -> bytes:
+    """Returns a PDF-like body of size bytes with a header and an %%EOF trailer."""
+    header, trailer = b"%PDF-1.4\n", b"\n%%EOF\n"
+    return header + b"0" * max(size - len(header) - len(trailer), 0) + trailer
+
+
+@contextlib.contextmanager
+def fake_pdf_server(profile: ServerProfile) -> Iterator[str]:
+    """Runs a local HTTP server that answers every path according to profile.
+
+    Args:
+        profile: ServerProfile deciding the outcome, latency and size per path.
+
+    Yields:
+        str: The base URL of the server, e.g. "http://127.0.0.1:54321".
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args, **kwargs):
+            pass
+
+        def do_GET(self):
+            outcome, delay, size = profile.outcome(self.path)
+            time.sleep(delay)
+            if outcome == "timeout":
+                time.sleep(profile.hang_seconds)
+                self.close_connection = True
+                return
+            if outcome in ("forbidden", "missing"):
+                self.send_response(403 if outcome == "forbidden" else 404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            body = pdf_body(size) if outcome == "pdf" else b"<!doctype html><html><body>Annual reports</body></html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf" if outcome == "pdf" else "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except OSError:
+                pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def write_sheet(path: Path, base_url: str, rows: int, data_config: config.DataConfig, secondary_rate: float = 0.3, seed: int = 0) -> None:
+    """Writes an input sheet whose rows point at the fake server.
+
+    Row i has the primary URL /i.pdf, and a share of the rows has the secondary URL /i-b.pdf.
+
+    Args:
+        path: The Excel file to write.
+        base_url: Base URL of the fake server.
+        rows: Number of rows.
+        data_config: DataConfig giving the column names.
+        secondary_rate: Share of rows with a secondary URL.
+        seed: Seed deciding which rows have a secondary URL.
+    """
+    rng = random.Random(seed)
+    df = pd.DataFrame({
+        data_config.id_column: [f"BR{i}" for i in range(rows)],
+        data_config.pdf_url_column: [f"{base_url}/{i}.pdf" for i in range(rows)],
+        data_config.secondary_pdf_url_column: [
+            f"{base_url}/{i}-b.pdf" if rng.random() < secondary_rate else None for i in range(rows)
+        ],
+    })
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        df.to_excel(writer, sheet_name="Sheet1", index=False)
+
+
+def run_once(engine: str, workers: int, batch_size: int, sheet: Path, work_dir: Path, download_config: config.DownloadConfig) -> dict:
+    """Runs one engine on a fresh status log and downloads directory.
+
+    Args:
+        engine: Name of the engine in ENGINES.
+        workers: Worker threads (and async_concurrency for the async engine).
+        batch_size: Rows downloaded by the run.
+        sheet: The input sheet written by write_sheet.
+        work_dir: Empty directory for the status log and the downloads.
+        download_config: DownloadConfig the run's settings are derived from.
+
+    Returns:
+        dict: elapsed_time, batch_size, workers, engine and download_status of the run.
+    """
+    downloads_dir = work_dir / "downloads"
+    downloads_dir.mkdir(parents=True)
+    data_cfg = config.DataConfig(
+        data_file=sheet,
+        log_file=work_dir / "status.db",
+        sheet_name="Sheet1",
+        id_column=config.ID_COLUMN,
+        pdf_url_column=config.PDF_URL_COLUMN,
+        secondary_pdf_url_column=config.SECONDARY_PDF_URL_COLUMN,
+        # Shared between runs, so parsing the sheet is only timed once
+        cache_dir=sheet.parent / "cache",
+    )
+    # Every URL is on one host, the politeness limits would cap all engines at max_per_host
+    dl_cfg = replace(
+        download_config,
+        downloads_dir=downloads_dir,
+        workers=workers,
+        async_concurrency=workers,
+        batch_size=batch_size,
+        max_per_host=workers,
+        min_host_interval=0,
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed_time, download_status = ENGINES[engine](data_cfg, dl_cfg)
+    return {
+        "elapsed_time": elapsed_time,
+        "batch_size": batch_size,
+        "workers": workers,
+        "engine": engine,
+        "download_status": {str(index): list(state) for index, state in download_status.items()},
+    }
+
+
+def benchmark_config() -> config.DownloadConfig:
+    """Returns the project's DownloadConfig with the settings that make runs comparable.
+
+    Retries are off because their backoff is randomized, and autotuning is off so every
+    run uses the number of workers it is labelled with. Probe results are kept in memory,
+    so no run profits from the probes of an earlier one. The circuit breaker is off, since
+    every URL is on the one fake host and its simulated timeouts would open its circuit.
+    """
+    return replace(
+        download_files.download_config,
+        connect_timeout=READ_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        max_retries=0,
+        autotune=False,
+        hedge_delay=None,
+        probe_cache_file=None,
+        circuit_breaker=False,
+    )
+
+
+def sweep(profile: ServerProfile, engines: list[str], workers: list[int], batch_sizes: list[int], repeats: int = 1, download_config: config.DownloadConfig | None = None) -> dict:
+    """Runs every engine for every combination of workers and batch_size against a fake server.
+
+    Args:
+        profile: ServerProfile of the fake server.
+        engines: Names of the engines in ENGINES.
+        workers: Worker counts to try.
+        batch_sizes: Batch sizes to try, the sheet has as many rows as the largest one.
+        repeats: Runs per combination.
+        download_config: DownloadConfig the runs are derived from, defaults to benchmark_config().
+
+    Returns:
+        dict: The runs keyed "0", "1", ..., in the shape of the benchmarks_*.json files.
+    """
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        raise ValueError(f"Unknown engines: {sorted(unknown)}, available: {sorted(ENGINES)}")
+    download_config = download_config or benchmark_config()
+
+    results = {}
+    with fake_pdf_server(profile) as base_url, tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        sheet = tmp_dir / "data.xlsx"
+        data_cfg = replace(download_files.data_config, sheet_name="Sheet1")
+        write_sheet(sheet, base_url, max(batch_sizes), data_cfg, seed=profile.seed)
+
+        runs = itertools.product(engines, workers, batch_sizes, range(repeats))
+        for run, (engine, worker_count, batch_size, _) in enumerate(runs):
+            result = run_once(engine, worker_count, batch_size, sheet, tmp_dir / f"run{run}", download_config)
+            result["profile"] = asdict(profile)
+            results[str(run)] = result
+            print(f"{engine}: {batch_size} rows with {worker_count} workers in {result['elapsed_time']:.2f} seconds")
+    return results
+
+
+def extract_urls_apply(df: pd.DataFrame, data_config: config.DataConfig) -> pd.Series:
+    """Row-wise reference for download_files.extract_urls, the apply it replaced, with the same cleaning."""
+    def row_urls(row: pd.Series) -> list[str]:
+        urls = []
+        for url in row:
+            if pd.isna(url):
+                continue
+            url = str(url).strip()
+            if URL_PATTERN.match(url) and url not in urls:
+                urls.append(url)
+        return urls
+
+    return df[[data_config.pdf_url_column, data_config.secondary_pdf_url_column]].apply(row_urls, axis=1)
+
+
+# Implementations of extract_urls compared by extract_urls_benchmark
+EXTRACT_URLS_METHODS: dict[str, Callable[[pd.DataFrame, config.DataConfig], object]] = {
+    "apply": extract_urls_apply,
+    "vectorized": download_files.extract_urls,
+    "vectorized_compact": functools.partial(download_files.extract_urls, compact=True),
+}
+
+
+def url_frame(rows: int, data_config: config.DataConfig, seed: int = 0) -> pd.DataFrame:
+    """Returns an input sheet with the kinds of values extract_urls has to clean.
+
+    About half the primary URLs have surrounding whitespace, and a share of the values is
+    missing, blank, without an http(s) scheme, or a secondary URL repeating the primary one.
+
+    Args:
+        rows: Number of rows.
+        data_config: DataConfig giving the column names.
+        seed: Seed of the random generator.
+
+    Returns:
+        pd.DataFrame: The sheet, indexed by row id.
+    """
+    rng = random.Random(seed)
+
+    def messy(url: str) -> str | None:
+        draw = rng.random()
+        if draw < 0.1:
+            return None
+        if draw < 0.15:
+            return "   "
+        if draw < 0.2:
+            return url.replace("https://", "www.")
+        return f"  {url} " if draw < 0.6 else url
+
+    primary = [messy(f"https://reports{i % 50}.example/{i}.pdf") for i in range(rows)]
+    secondary = [url if rng.random() < 0.1 else messy(f"https://mirror.example/{i}.pdf") for i, url in enumerate(primary)]
+    return pd.DataFrame(
+        {data_config.pdf_url_column: primary, data_config.secondary_pdf_url_column: secondary},
+        index=pd.Index([f"BR{i}" for i in range(rows)], name=data_config.id_column),
+    )
+
+
+def extract_urls_benchmark(rows: list[int], repeats: int = 5, seed: int = 0) -> dict:
+    """Times every method in EXTRACT_URLS_METHODS on synthetic sheets, as in benchmarks_extract_urls.json.
+
+    Args:
+        rows: Sheet sizes to try.
+        repeats: Runs per method and size.
+        seed: Seed of the sheets, see url_frame.
+
+    Returns:
+        dict: The runs keyed "0", "1", ..., each with elapsed_time, method and rows.
+    """
+    data_cfg = download_files.data_config
+    results = {}
+    for row_count in rows:
+        df = url_frame(row_count, data_cfg, seed)
+        for method, extract in EXTRACT_URLS_METHODS.items():
+            for _ in range(repeats):
+                started = time.perf_counter()
+                extract(df, data_cfg)
+                results[str(len(results))] = {"elapsed_time": time.perf_counter() - started, "method": method, "rows": row_count}
+            print(f"{method}: {row_count} rows in {results[str(len(results) - 1)]['elapsed_time']:.4f} seconds")
+    return results
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="Benchmarks the download engines against a local fake PDF server.")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--workers", nargs="+", type=int, default=[4, 16, 32])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[100, 500])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--latency-mean", type=float, default=0.05)
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--payload-min", type=int, default=16 * 1024)
+    parser.add_argument("--payload-max", type=int, default=256 * 1024)
+    parser.add_argument("--forbidden-rate", type=float, default=0.05)
+    parser.add_argument("--missing-rate", type=float, default=0.1)
+    parser.add_argument("--timeout-rate", type=float, default=0.02)
+    parser.add_argument("--not-pdf-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="defaults to benchmarks/benchmarks_fake_server.json, or benchmarks_extract_urls.json with --extract-urls")
+    parser.add_argument("--extract-urls", action="store_true", help="time extract_urls against the row-wise apply instead of running the engines")
+    parser.add_argument("--rows", nargs="+", type=int, default=[1000, 10000, 100000], help="sheet sizes for --extract-urls")
+    args = parser.parse_args(argv)
+
+    if args.extract_urls:
+        output = args.output or config.BASE_DIR / "benchmarks" / "benchmarks_extract_urls.json"
+        results = extract_urls_benchmark(args.rows, args.repeats, args.seed)
+        output.write_text(json.dumps(results, indent=2))
+        print(f"Wrote {len(results)} runs to {output}")
+        return results
+
+    profile = ServerProfile(
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_spread=args.latency_spread,
+        payload_min=args.payload_min,
+        payload_max=args.payload_max,
+        forbidden_rate=args.forbidden_rate,
+        missing_rate=args.missing_rate,
+        timeout_rate=args.timeout_rate,
+        not_pdf_rate=args.not_pdf_rate,
+        seed=args.seed,
+    )
+    output = args.output or config.BASE_DIR / "benchmarks" / "benchmarks_fake_server.json"
+    results = sweep(profile, args.engines, args.workers, args.batch_sizes, args.repeats)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Wrote {len(results)} runs to {output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+
+# Status code logged for a URL that was not requested because the circuit of its host is open.
+# Outside the HTTP range, so it can't be confused with a 521 sent by a server such as Cloudflare.
+OPEN_CODE = 921
+
+# Attempt codes that count against a host when no response arrived: connection errors and timeouts
+FAILURE_CODES = frozenset({408, 503})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS open_circuits (
+    host TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    opened_at REAL NOT NULL
+);
+"""
+
+
+def host_failed(code: int, responded: bool) -> bool | None:
+    """Returns what an attempt says about the health of its host.
+
+    Args:
+        code: Status code of the attempt, as in the status log.
+        responded: Whether response headers arrived.
+
+    Returns:
+        bool | None: True for a connection failure or timeout without a response, False if
+            the host responded, None if the attempt never reached the host, e.g. an invalid URL.
+    """
+    if responded:
+        return False
+    if code in FAILURE_CODES:
+        return True
+    return None
+
+
+class CircuitBreaker:
+    """Per-host circuit breaker shared by the workers of a run.
+
+    The circuit of a host opens after threshold consecutive attempts that failed to get a
+    response, and allow() then returns False so its URLs fail fast instead of each waiting
+    for the timeout. After cooldown seconds the circuit is half-open: a single attempt is
+    let through as a probe, which closes the circuit if the host responds and opens it for
+    another cooldown if not.
+
+    Open circuits are stored in SQLite, so the next run skips hosts known to be down until
+    their cooldown has passed. Safe to use from several threads.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 600.0, path: Path | str | None = None, clock=time.time):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        if path is None:
+            self._connection = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        else:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+        self._failures: Counter[str] = Counter()
+        self._opened_at: dict[str, float] = dict(self._connection.execute("SELECT host, opened_at FROM open_circuits"))
+        # Half-open hosts whose probe attempt is in flight
+        self._probing: set[str] = set()
+
+    def __enter__(self) -> "CircuitBreaker":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    @property
+    def open_hosts(self) -> list[str]:
+        """Hosts whose circuit is open or half-open."""
+        with self._lock:
+            return sorted(self._opened_at)
+
+    def state(self, host: str) -> str:
+        """Returns "closed", "open" or "half-open" for host."""
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+        if opened_at is None:
+            return "closed"
+        return "half-open" if self._clock() - opened_at >= self.cooldown else "open"
+
+    def allow(self, host: str) -> bool:
+        """Returns whether an attempt against host may start.
+
+        A half-open host allows one attempt, until its result is recorded or it is released.
+
+        Args:
+            host: The host name, an empty host is always allowed.
+
+        Returns:
+            bool: False if the circuit of host is open, or half-open with the probe in flight.
+        """
+        if not host:
+            return True
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return True
+            if host in self._probing or self._clock() - opened_at < self.cooldown:
+                return False
+            self._probing.add(host)
+            return True
+
+    def release(self, host: str) -> None:
+        """Ends an attempt allowed against host that says nothing about its health.
+
+        A half-open host stays half-open, and its next attempt is let through as the probe.
+
+        Args:
+            host: The host name.
+        """
+        with self._lock:
+            self._probing.discard(host)
+
+    def record(self, host: str, failed: bool) -> None:
+        """Adds the result of an attempt against host.
+
+        Args:
+            host: The host name, attempts without a host are ignored.
+            failed: True for a connection failure or timeout, False if the host responded, see host_failed.
+        """
+        if not host:
+            return
+        with self._lock:
+            was_probe = host in self._probing
+            self._probing.discard(host)
+            if not failed:
+                self._failures.pop(host, None)
+                if self._opened_at.pop(host, None) is not None:
+                    self._connection.execute("DELETE FROM open_circuits WHERE host = ?", (host,))
+                return
+
+            self._failures[host] += 1
+            if was_probe or (host not in self._opened_at and self._failures[host] >= self.threshold):
+                self._opened_at[host] = self._clock()
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO open_circuits (host, failures, opened_at) VALUES (?, ?, ?)",
+                    (host, self._failures[host], self._opened_at[host]),
+                )
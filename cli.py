@@ -0,0 +1,179 @@
+import argparse
+import json
+import sys
+from dataclasses import replace
+
+import config
+import input_cache
+import status_log
+
+
+# Engines for the run subcommand, by name of their function in download_files
+RUN_ENGINES = {
+    "concurrent": "main_concurrent",
+    "sequential": "main_sequential",
+    "async": "main_async",
+}
+
+
+def remaining_row_ids(data_config: config.DataConfig) -> set[str] | None:
+    """Returns the ids of rows with a URL that have no entry in the status log yet, without pandas.
+
+    Args:
+        data_config: DataConfig specifying the data file, columns, cache directory and log file.
+
+    Returns:
+        set | None: The unprocessed row ids, or None if the parsed sheet isn't cached or is out of date.
+    """
+    if data_config.cache_dir is None:
+        return None
+    usecols = [data_config.id_column, data_config.pdf_url_column, data_config.secondary_pdf_url_column]
+    row_ids = input_cache.cached_row_ids(data_config.data_file, data_config.cache_dir, data_config.sheet_name, data_config.id_column, usecols)
+    if row_ids is None:
+        return None
+    # Without a status log there is nothing to skip, and download_files may still import an old log.json
+    if not data_config.log_file.exists():
+        return set(row_ids)
+    with status_log.StatusLog(data_config.log_file) as log:
+        return set(row_ids) - log.processed_ids()
+
+
+def download_config_from(args: argparse.Namespace) -> config.DownloadConfig:
+    """Returns the project's DownloadConfig with the options given on the command line."""
+    import download_files
+
+    overrides = {
+        name: getattr(args, name)
+        for name in ("workers", "batch_size", "processes")
+        if getattr(args, name, None) is not None
+    }
+    return replace(download_files.download_config, **overrides)
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    import download_files
+
+    main = getattr(download_files, RUN_ENGINES[args.engine])
+    main(download_files.data_config, download_config_from(args))
+    return 0
+
+
+def cmd_resume(args: argparse.Namespace) -> int:
+    data_config = default_data_config()
+    remaining = remaining_row_ids(data_config)
+    if remaining is not None and not remaining:
+        print("Nothing to resume, every row with a URL is in the status log")
+        return 0
+
+    import download_files
+
+    download_config = download_config_from(args)
+    if download_config.processes > 1:
+        download_files.main_sharded(download_files.data_config, download_config)
+    else:
+        download_files.main_pipeline(download_files.data_config, download_config)
+    return 0
+
+
+def cmd_retry_failed(args: argparse.Namespace) -> int:
+    import download_files
+
+    download_files.main_retry_failed(download_files.data_config, download_config_from(args))
+    return 0
+
+
+def cmd_refresh(args: argparse.Namespace) -> int:
+    import download_files
+
+    download_files.main_refresh(download_files.data_config, download_config_from(args))
+    return 0
+
+
+def cmd_status(args: argparse.Namespace) -> int:
+    data_config = default_data_config()
+    codes = {}
+    if data_config.log_file.exists():
+        with status_log.StatusLog(data_config.log_file) as log:
+            codes = log.code_counts()
+    remaining = remaining_row_ids(data_config)
+
+    status = {
+        "rows_logged": sum(codes.values()),
+        "rows_remaining": None if remaining is None else len(remaining),
+        "status_codes": dict(sorted(codes.items())),
+    }
+    if args.json:
+        print(json.dumps(status, indent=2))
+        return 0
+
+    print(f"Rows in the status log: {status['rows_logged']}")
+    for code, count in status["status_codes"].items():
+        print(f"  {code}: {count}")
+    if remaining is None:
+        print("Rows remaining: unknown until the sheet has been read by a run")
+    else:
+        print(f"Rows remaining: {len(remaining)}")
+    return 0
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    import benchmark
+
+    benchmark.main(args.bench_args)
+    return 0
+
+
+def default_data_config() -> config.DataConfig:
+    """Returns the same DataConfig as download_files.data_config, without importing download_files."""
+    return config.DataConfig(
+        data_file=config.DATA_FILE,
+        log_file=config.LOG_FILE,
+        sheet_name=config.SHEET_NAME,
+        id_column=config.ID_COLUMN,
+        pdf_url_column=config.PDF_URL_COLUMN,
+        secondary_pdf_url_column=config.SECONDARY_PDF_URL_COLUMN,
+        cache_dir=config.CACHE_DIR,
+        metrics_dir=config.METRICS_DIR,
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Downloads the PDFs listed in the input sheet.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="download the next batch of unprocessed rows")
+    run.add_argument("--engine", choices=list(RUN_ENGINES), default="concurrent")
+    run.add_argument("--batch-size", type=int, help=f"rows in the batch (default {config.BATCH_SIZE})")
+    run.add_argument("--workers", type=int, help=f"worker threads (default {config.WORKERS})")
+    run.set_defaults(handler=cmd_run)
+
+    resume = commands.add_parser("resume", help="download every row that is not in the status log yet")
+    resume.add_argument("--workers", type=int, help=f"worker threads per process (default {config.WORKERS})")
+    resume.add_argument("--processes", type=int, help=f"worker processes, more than 1 runs the sharded mode (default {config.PROCESSES})")
+    resume.set_defaults(handler=cmd_resume)
+
+    retry_failed = commands.add_parser("retry-failed", help="download again the rows whose last attempt failed with a transient code")
+    retry_failed.add_argument("--workers", type=int, help=f"worker threads (default {config.WORKERS})")
+    retry_failed.set_defaults(handler=cmd_retry_failed)
+
+    refresh = commands.add_parser("refresh", help="revalidate the downloaded rows with conditional GETs, only changed PDFs are downloaded again")
+    refresh.add_argument("--workers", type=int, help=f"worker threads (default {config.WORKERS})")
+    refresh.set_defaults(handler=cmd_refresh)
+
+    status = commands.add_parser("status", help="summarize the status log")
+    status.add_argument("--json", action="store_true", help="print the summary as JSON")
+    status.set_defaults(handler=cmd_status)
+
+    bench = commands.add_parser("bench", help="benchmark the engines against a local fake server, see benchmark.py --help", add_help=False)
+    bench.add_argument("bench_args", nargs=argparse.REMAINDER)
+    bench.set_defaults(handler=cmd_bench)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from dataclasses import dataclass, replace
 
@@ -5,16 +6,25 @@ from dataclasses import dataclass, replace
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 LOGS_DIR = BASE_DIR / "logs"
-DOWNLOADS_DIR = BASE_DIR / "downloads"
-DATA_DIR.mkdir(exist_ok=True)
-LOGS_DIR.mkdir(exist_ok=True)
-DOWNLOADS_DIR.mkdir(exist_ok=True)
+DOWNLOADS_DIR = BASE_DIR / "downloads"  # created by the download functions, importing config has no side effects
 
 # Input data file
 DATA_FILE = DATA_DIR / "GRI_2017_2020.xlsx"
 
-# Output log file
-LOG_FILE = LOGS_DIR / "log.json"
+# Parsed copies of the input sheet, so later runs don't parse the Excel file again
+CACHE_DIR = DATA_DIR / "cache"
+
+# Append-only status log (SQLite), an old logs/log.json is imported on first use
+LOG_FILE = LOGS_DIR / "status.db"
+
+# Timing summary of each run, as JSON and in the Prometheus text format
+METRICS_DIR = LOGS_DIR / "metrics"
+
+# Results of probing URLs for PDF content, so known landing pages are skipped on later runs
+PROBE_CACHE_FILE = LOGS_DIR / "probes.db"
+
+# Hosts whose circuit breaker is open, so later runs skip hosts that are down
+BREAKER_FILE = LOGS_DIR / "circuits.db"
 
 # Dataframe columns
 SHEET_NAME = 0  
@@ -23,9 +33,52 @@ PDF_URL_COLUMN = "Pdf_URL"
 SECONDARY_PDF_URL_COLUMN = "Report Html Address"
 
 # Download settings
-DOWNLOAD_TIMEOUT = 5  # seconds
+DOWNLOAD_TIMEOUT = 5  # seconds, used for connecting and reading when CONNECT_TIMEOUT / READ_TIMEOUT are None
+CONNECT_TIMEOUT = 3  # seconds to establish a connection, dead hosts fail fast
+READ_TIMEOUT = 15  # seconds without receiving any bytes, before the headers or during the body
+DOWNLOAD_DEADLINE = 300  # seconds for a whole streamed download, from sending the request to the last byte
+MIN_THROUGHPUT = 8 * 1024  # bytes per second a streamed download must average, None disables the check
+THROUGHPUT_GRACE = 5  # seconds of body transfer before MIN_THROUGHPUT is enforced
 BATCH_SIZE = 20
 WORKERS = 32
+STREAM_DOWNLOADS = True  # Stream response bodies to disk instead of buffering whole PDFs in memory
+CHUNK_SIZE = 64 * 1024  # bytes held in memory per worker when streaming
+PROBE = True  # Ask URLs not ending in .pdf for their first bytes before a full download, and skip non-PDFs
+PROBE_MAX_AGE = 30 * 24 * 3600  # seconds a probe result is trusted
+VALIDATE_PDF = True  # Check the %%EOF trailer and Content-Length of every PDF while it is written
+RESUME_PARTIAL = True  # Keep the bytes of a streamed download that failed mid-body and continue it with a Range request
+ASYNC_CONCURRENCY = 1000  # requests in flight at once in main_async
+DNS_PREFETCH = True  # Resolve every host of the run up front, and fail rows on hosts that don't exist without a request
+DNS_TTL = 300  # seconds a resolved host name is cached
+DNS_WORKERS = 64  # host names resolved at once by the prefetch
+POOL_CONNECTIONS = 64  # distinct hosts each worker keeps connections open to
+POOL_MAXSIZE = 1  # connections kept alive per host and worker
+KEEP_ALIVE = True
+MAX_PER_HOST = 4  # rows in flight at once against the host of their first URL, fallback hosts are not limited
+MIN_HOST_INTERVAL = 0.1  # seconds between starting two rows with the same first-URL host
+CIRCUIT_BREAKER = True  # Stop requesting a host after BREAKER_THRESHOLD connection failures or timeouts in a row
+BREAKER_THRESHOLD = 5  # consecutive attempts without a response that open a host's circuit
+BREAKER_COOLDOWN = 600  # seconds before an open host is probed again
+QUEUE_SIZE = WORKERS * 4  # rows queued ahead of the workers in run_downloads
+PROGRESS_INTERVAL = 10  # seconds between progress lines
+PROCESSES = os.cpu_count() or 1  # worker processes in main_sharded, each running WORKERS threads
+DEDUP = True  # Download each URL once per run and store PDFs by content hash
+CONDITIONAL_REQUESTS = True  # Revalidate earlier downloads with ETag / Last-Modified instead of downloading them again
+STORAGE_BACKEND = "local"  # "local", or "s3" to upload the PDFs to S3_BUCKET (requires boto3)
+SHARDED_LAYOUT = False  # Save PDFs in 256 hash-prefix subdirectories of DOWNLOADS_DIR instead of one flat directory; PDFs saved in the other layout are not found
+STORAGE_WRITERS = 4  # threads that fsync or upload finished PDFs, so the download workers don't wait on it
+FSYNC = True  # Flush saved PDFs and their directories to disk, in batches on the writer threads
+FSYNC_BATCH = 64  # PDFs flushed together
+S3_BUCKET = None
+S3_PREFIX = "pdfs/"  # prepended to the object keys
+S3_ENDPOINT_URL = None  # for S3-compatible stores such as MinIO, None for AWS
+AUTOTUNE = True  # Adapt the number of busy workers (up to WORKERS) to observed latency, throughput and errors
+MIN_WORKERS = 2  # lower bound for the autotuner
+HEDGE_DELAY = None  # seconds to wait for PDF bytes from the primary URL before racing the secondary, None disables hedging
+MAX_RETRIES = 3  # extra attempts for rows failing with 408, 429 or 5xx
+RETRY_BASE_DELAY = 1.0  # seconds, the backoff ceiling doubles with every retry of a row
+RETRY_MAX_DELAY = 60.0  # seconds, longest backoff; a longer Retry-After gives up on the row for this run
+RETRY_BUDGET_RATIO = 0.2  # retries allowed per fresh row, so retries can't starve new work
 REQUEST_HEADERS = {
     "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36" # To mimic a real browser and not a web scraper
 } 
@@ -38,6 +91,8 @@ class DataConfig:
     id_column: str 
     pdf_url_column: str 
     secondary_pdf_url_column: str
+    cache_dir: Path | None = None
+    metrics_dir: Path | None = None
 
 @dataclass(frozen=True)
 class DownloadConfig:
@@ -46,3 +101,47 @@ class DownloadConfig:
     batch_size: int
     workers: int
     request_headers: dict
+    stream: bool = False
+    chunk_size: int = CHUNK_SIZE
+    validate_pdf: bool = False
+    resume_partial: bool = False
+    probe: bool = False
+    probe_cache_file: Path | None = None
+    probe_max_age: float | None = None
+    async_concurrency: int = ASYNC_CONCURRENCY
+    dns_prefetch: bool = False
+    dns_ttl: float = DNS_TTL
+    dns_workers: int = DNS_WORKERS
+    pool_connections: int = POOL_CONNECTIONS
+    pool_maxsize: int = POOL_MAXSIZE
+    keep_alive: bool = KEEP_ALIVE
+    max_per_host: int = MAX_PER_HOST
+    min_host_interval: float = MIN_HOST_INTERVAL
+    circuit_breaker: bool = False
+    breaker_threshold: int = BREAKER_THRESHOLD
+    breaker_cooldown: float = BREAKER_COOLDOWN
+    breaker_file: Path | None = None
+    queue_size: int = QUEUE_SIZE
+    dedup: bool = False
+    conditional_requests: bool = False
+    storage_backend: str = "local"
+    sharded_layout: bool = False
+    storage_writers: int = STORAGE_WRITERS
+    fsync: bool = False
+    fsync_batch: int = FSYNC_BATCH
+    s3_bucket: str | None = None
+    s3_prefix: str = S3_PREFIX
+    s3_endpoint_url: str | None = None
+    hedge_delay: float | None = HEDGE_DELAY
+    autotune: bool = False
+    min_workers: int = MIN_WORKERS
+    max_retries: int = 0
+    retry_base_delay: float = RETRY_BASE_DELAY
+    retry_max_delay: float = RETRY_MAX_DELAY
+    retry_budget_ratio: float = RETRY_BUDGET_RATIO
+    connect_timeout: float | None = None
+    read_timeout: float | None = None
+    deadline: float | None = None
+    min_throughput: float | None = None
+    throughput_grace: float = THROUGHPUT_GRACE
+    processes: int = 1
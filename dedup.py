@@ -0,0 +1,116 @@
+import os
+import shutil
+import threading
+import uuid
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from pathlib import Path
+
+
+# Content-addressed copies of every downloaded PDF live under downloads_dir / OBJECTS_DIR_NAME
+OBJECTS_DIR_NAME = ".objects"
+
+
+class SingleFlight:
+    """Runs a function at most once per key and shares its result with every caller.
+
+    The first caller for a key runs the function, callers arriving while it runs wait for
+    the same result, and later callers get the stored result without running it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], object]) -> object:
+        """Returns fn()'s result for key, running fn only if no caller has run it yet.
+
+        Args:
+            key: Identifies the work, e.g. a URL.
+            fn: Produces the result for key.
+
+        Returns:
+            The result of the single call of fn for key. If that call raised, the exception is raised for every caller.
+        """
+        with self._lock:
+            future = self._results.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._results[key] = Future()
+
+        if is_owner:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def forget(self, key: Hashable) -> None:
+        """Drops the stored result for key, so the next caller runs the function again.
+
+        Args:
+            key: Identifies the work, e.g. a URL.
+        """
+        with self._lock:
+            self._results.pop(key, None)
+
+
+def object_path(objects_dir: Path, digest: str) -> Path:
+    """Returns where the PDF with the given SHA-256 hex digest is stored.
+
+    Objects are spread over subdirectories named by the first two hex digits.
+    """
+    return objects_dir / digest[:2] / f"{digest}.pdf"
+
+
+def incoming_path(objects_dir: Path) -> Path:
+    """Returns a unique path to download a PDF to before its digest is known."""
+    incoming_dir = objects_dir / "incoming"
+    incoming_dir.mkdir(parents=True, exist_ok=True)
+    return incoming_dir / f"{uuid.uuid4().hex}.pdf"
+
+
+def store_file(path: Path, digest: str, objects_dir: Path) -> Path:
+    """Moves a downloaded file into the content store under its digest.
+
+    If a file with the same content is already stored, the new copy is dropped.
+
+    Args:
+        path: The downloaded file, on the same filesystem as objects_dir.
+        digest: SHA-256 hex digest of the file's content.
+        objects_dir: Root directory of the content store.
+
+    Returns:
+        Path: The stored object.
+    """
+    target = object_path(objects_dir, digest)
+    if target.exists():
+        path.unlink()
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(path, target)
+    return target
+
+
+def link_file(target: Path, link_path: Path) -> None:
+    """Atomically points link_path at a stored object.
+
+    A hard link is used when possible, then a symlink, and a copy as the last resort.
+
+    Args:
+        target: The stored object.
+        link_path: The per-row file name, replaced if it exists.
+    """
+    tmp_path = link_path.with_name(f".{link_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        try:
+            os.link(target, tmp_path)
+        except OSError:
+            try:
+                os.symlink(target.resolve(), tmp_path)
+            except OSError:
+                shutil.copyfile(target, tmp_path)
+        os.replace(tmp_path, link_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
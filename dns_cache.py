@@ -0,0 +1,164 @@
+import socket
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+
+# Status code logged for a URL whose host name doesn't exist
+UNRESOLVED_CODE = 452
+
+# getaddrinfo errors meaning the name doesn't exist, as opposed to a resolver that didn't answer
+_NOT_FOUND_ERRORS = frozenset({socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME)})
+
+
+class HostNotFound(Exception):
+    """Raised by a resolver when a host name doesn't exist."""
+
+
+def system_resolve(host: str) -> list[str]:
+    """Resolves host with the system resolver.
+
+    Args:
+        host: The host name.
+
+    Returns:
+        list[str]: Its IP addresses, in the resolver's order.
+
+    Raises:
+        HostNotFound: If the name doesn't exist.
+        OSError: If the resolver failed for another reason, e.g. it timed out.
+    """
+    try:
+        infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        if e.errno in _NOT_FOUND_ERRORS:
+            raise HostNotFound(host) from e
+        raise
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+class DnsCache:
+    """Resolved addresses per host name, kept for ttl seconds.
+
+    Names that don't exist are remembered for negative_ttl seconds, so the rows of a dead
+    host fail without another lookup. Resolver errors that may be temporary are not cached.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float | None = None, resolver: Callable[[str], list[str]] = system_resolve, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._resolver = resolver
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Host name to (addresses, expiry), addresses is None for a name that doesn't exist
+        self._entries: dict[str, tuple[list[str] | None, float]] = {}
+
+    def _cached(self, host: str) -> tuple[bool, list[str] | None]:
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry is None or entry[1] <= self._clock():
+            return False, None
+        return True, entry[0]
+
+    def lookup(self, host: str) -> list[str] | None:
+        """Returns the addresses of host, resolving it if it isn't cached or has expired.
+
+        Args:
+            host: The host name.
+
+        Returns:
+            list[str] | None: The addresses, or None if the name doesn't exist.
+
+        Raises:
+            OSError: If the resolver failed, the result is not cached.
+        """
+        found, addresses = self._cached(host)
+        if found:
+            return addresses
+        try:
+            addresses = self._resolver(host)
+            expires = self._clock() + self.ttl
+        except HostNotFound:
+            addresses = None
+            expires = self._clock() + self.negative_ttl
+        with self._lock:
+            self._entries[host] = (addresses, expires)
+        return addresses
+
+    def is_unresolvable(self, host: str) -> bool:
+        """Returns whether host is cached as a name that doesn't exist, without a lookup."""
+        found, addresses = self._cached(host)
+        return found and addresses is None
+
+    def prefetch(self, hosts: Iterable[str], workers: int = 32) -> set[str]:
+        """Resolves hosts concurrently into the cache.
+
+        Args:
+            hosts: Host names, duplicates and empty names are skipped.
+            workers: Lookups in flight at once.
+
+        Returns:
+            set[str]: The hosts whose name doesn't exist.
+        """
+        def not_found(host: str) -> bool:
+            try:
+                return self.lookup(host) is None
+            except OSError:
+                return False
+
+        hosts = list({host for host in hosts if host})
+        if not hosts:
+            return set()
+        with ThreadPoolExecutor(max_workers=max(min(workers, len(hosts)), 1)) as executor:
+            missing = list(executor.map(not_found, hosts))
+        return {host for host, is_missing in zip(hosts, missing) if is_missing}
+
+
+class _CachedResolutionMixin:
+    dns_cache: DnsCache
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = self.dns_cache.lookup(host)
+        except OSError:
+            addresses = None
+        if not addresses:
+            # urllib3 resolves the name itself and raises its usual errors
+            return super()._new_conn()
+        # Only the socket connects to the cached address, TLS and the Host header still use the name.
+        # Each address is tried in turn, like urllib3 does with the ones it resolves itself.
+        error = None
+        for address in addresses:
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except ConnectTimeoutError as e:
+                # Also NewConnectionError, which subclasses it
+                error = e
+            finally:
+                self._dns_host = host
+        raise error
+
+
+def install(adapter: HTTPAdapter, cache: DnsCache) -> None:
+    """Makes the connections opened through adapter resolve host names through cache.
+
+    The adapter's current connection classes are kept, so this can be called after
+    metrics.instrument_adapter.
+
+    Args:
+        adapter: A requests HTTPAdapter, before any request was sent through it.
+        cache: The DnsCache to resolve with.
+    """
+    pool_classes = adapter.poolmanager.pool_classes_by_scheme
+    resolving = {}
+    for scheme, pool_class in pool_classes.items():
+        connection_class = type(f"Cached{pool_class.ConnectionCls.__name__}", (_CachedResolutionMixin, pool_class.ConnectionCls), {"dns_cache": cache})
+        resolving[scheme] = type(f"Cached{pool_class.__name__}", (pool_class,), {"ConnectionCls": connection_class})
+    adapter.poolmanager.pool_classes_by_scheme = resolving
@@ -1,266 +1,1769 @@
-from pathlib import Path
-import pandas as pd
-import requests
-import json
-import config
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from _collections_abc import Hashable
-from requests.exceptions import MissingSchema, InvalidSchema, InvalidURL, URLRequired
-
-
-data_config = config.DataConfig(
-    data_file=config.DATA_FILE,
-    log_file=config.LOG_FILE,
-    sheet_name=config.SHEET_NAME,
-    id_column=config.ID_COLUMN,
-    pdf_url_column=config.PDF_URL_COLUMN,
-    secondary_pdf_url_column=config.SECONDARY_PDF_URL_COLUMN,
-)
-
-download_config = config.DownloadConfig(
-    downloads_dir=config.DOWNLOADS_DIR,
-    download_timeout=config.DOWNLOAD_TIMEOUT,
-    batch_size=config.BATCH_SIZE,
-    request_headers=config.REQUEST_HEADERS,
-    workers=config.WORKERS,
-)
-
-
-def verify_pdf(content: bytes | None) -> bool:
-    """Verifies if the content is a valid PDF by checking first bytes.
-
-    Args:
-        content: bytes from the HTTP response.
-
-    Returns:
-        bool: True if content is a valid PDF, False otherwise.
-    """
-    
-    if not content:
-        return False
-    
-    PDF_MAGIC_BYTES = b"%PDF-"
-    return content.startswith(PDF_MAGIC_BYTES)
-
-
-def download_pdf_file(row_id: Hashable | str, urls: list[str], config: config.DownloadConfig) -> tuple[bool, int, str]:
-    
-        """Downloads a PDF file from the given URLs and saves it to the specified directory.
-
-    Args:
-        row_id: The identifier for the row, used to name the saved file.
-        urls: A list of URLs to attempt to download the PDF from.
-        config: DownloadConfig specifying download settings and directory.
-
-    Returns:
-        tuple: A tuple containing a boolean indicating success,
-               the HTTP status code, and the URL used.
-
-    Raises:
-        requests.Timeout: If there is a timeout during the request.
-        requests.ConnectionError: If there is a connection error during the request.
-        requests.RequestException: For other request-related errors.
-
-    """
-    
-        save_path = config.downloads_dir / f"{row_id}.pdf"
-        result_code = 0
-        url = ""
-
-        try:
-            for url in urls:
-                response = requests.get(url, timeout=config.download_timeout, headers=config.request_headers)
-
-                if response.status_code == 404:
-                    print(f"File not found (404): {row_id} at {url}")
-                    result_code = response.status_code
-                    continue
-
-                if response.status_code == 403:
-                    print(f"Access forbidden (403): {row_id} at {url}")
-                    result_code = response.status_code
-                    continue
-
-                if not response.ok:
-                    print(f"HTTP error {response.status_code} for {row_id} at {url}")
-                    result_code = response.status_code
-                    continue
-
-                if not verify_pdf(response.content):
-                    result_code = 415
-                    print(f"Invalid PDF (415): {row_id} at {url}")
-                    continue
-
-                try:
-                    save_path.write_bytes(response.content)
-                except OSError as e:
-                    print(f"I/O error (500): {row_id} at {url}: {e}")
-                    return False, 500, url
-
-                print(f"Successfully downloaded and wrote file: {row_id}")
-                result_code = response.status_code
-                return True, result_code, url
-            
-        except (MissingSchema, InvalidSchema, InvalidURL, URLRequired, ValueError, TypeError):
-            print(f"Invalid URL (400): {row_id} at {url!r}")
-            return False, 400, url
-
-        except requests.Timeout:
-            result_code = 408
-            print(f"Timeout error (408): {row_id} at {url}")
-
-        except requests.ConnectionError:
-            result_code = 503
-            print(f"Connection error (503): {row_id} at {url}")
-
-        except requests.RequestException as e:
-            result_code = 500
-            print(f"Error with file (500): {row_id}: {e}")
-
-        return False, result_code, url
-
-
-
-def write_dict_to_json(status: dict) -> None:
-    """Writes a dictionary to a json file
-
-    Args:
-        status: The dictionary containing the status of downloads
-    """
-    with open(config.LOG_FILE, "w") as file:
-        json.dump(status, file, indent=2)
-
-
-def read_json_to_dict(filepath: Path) -> dict:
-    """Small helper function that returns an empty dictionary if the log files doesn't exist.
-
-    Args:
-        filepath: The path to the json file.
-
-    Returns:
-        dict: The content of the json file as a dictionary or an empty dictionary if the file doesn't exist.
-    """
-    if not filepath.exists():
-        return {}
-    with open(filepath, "r") as file:
-        status = json.load(file)
-    return status
-
-
-def filter_data(df: pd.DataFrame, config: config.DataConfig, batch_size: int | None = None) -> pd.DataFrame:
-    """Filters the dataframe to only include rows with valid URLs and not already processed.
-
-    Args:
-        df: The dataframe to filter.
-        config: DataConfig specifying which columns contain URLs and log file path.
-        batch_size: The number of rows to include in the batch. If None, includes all
-
-    Returns:
-        pd.DataFrame: The filtered dataframe.
-    """
-    has_url = (
-        df[config.pdf_url_column].notna() | df[config.secondary_pdf_url_column].notna()
-    )
-    df = df[has_url]
-
-    # Reads already processed IDs from the log file and filters them out
-    download_status = read_json_to_dict(config.log_file)
-    unprocessed_df = df[~df.index.isin(download_status.keys())]
-
-    # "Hack" to return the entire dataframe at call time if batch_size is None
-    if batch_size is None:
-        return unprocessed_df
-
-    return unprocessed_df.iloc[:batch_size]
-
-
-def extract_urls(df: pd.DataFrame, config: config.DataConfig) -> pd.Series:
-    """Extracts URLs from the specified columns in the dataframe, 
-    removes leading and trailing whitespace and ensure urls are of string type.
- 
-    Args:
-        df: The dataframe containing the URL columns.
-        config: DataConfig specifying which columns contain URLs.
-    
-    Returns:
-        pd.Series: A series where each entry is a list of URLs for the corresponding row.
-    """
-    df_url_columns = df[[config.pdf_url_column, config.secondary_pdf_url_column]]
-    urls = df_url_columns.apply(lambda row: [str(url).strip() for url in row if pd.notna(url)], axis=1)
-    return urls
-
-
-def main_concurrent(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, dict]:
-    """Main function to download PDF files concurrently using ThreadPoolExecutor.
-
-    Args:
-        data_config: DataConfig containing data file and column info.
-        download_config: DownloadConfig containing download settings.
-
-    Returns:
-        tuple: A tuple containing the elapsed time and a dictionary with download statuses for benchmarking purposes.
-    """
-
-    start_time = time.perf_counter()
-    df = pd.read_excel(
-        data_config.data_file,
-        sheet_name=data_config.sheet_name,
-        index_col=data_config.id_column,
-    )
-    batch = filter_data(df, data_config, batch_size=download_config.batch_size)
-    urls = extract_urls(batch, data_config)
-
-    download_status = {}
-    with ThreadPoolExecutor(max_workers=download_config.workers) as executor:
-        futures = {
-            executor.submit(download_pdf_file, index, url, download_config): index
-            for index, url in urls.items()
-        }
-
-        for future in as_completed(futures):
-            index = futures[future]
-            download_status[index] = future.result()
-    write_dict_to_json(download_status)
-
-    end_time = time.perf_counter()
-    print(
-        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
-    )
-    return end_time - start_time, download_status
-
-
-def main_sequential(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, dict]:
-    """Main function to download PDF files single threaded.
-
-    Args:
-        data_config: DataConfig containing data file and column info.
-        download_config: DownloadConfig containing download settings.
-
-    Returns:
-        tuple: A tuple containing the elapsed time and a dictionary with download statuses for benchmarking purposes.
-    """
-    start_time = time.perf_counter()
-    df = pd.read_excel(
-        data_config.data_file,
-        sheet_name=data_config.sheet_name,
-        index_col=data_config.id_column,
-    )
-    batch = filter_data(df, data_config, batch_size=download_config.batch_size)
-    urls = extract_urls(batch, data_config)
-
-    download_status = {}
-    for index, url in urls.items():
-        download_state = download_pdf_file(index, url, download_config)
-        download_status[index] = download_state
-    write_dict_to_json(download_status)
-
-    end_time = time.perf_counter()
-    print(
-        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
-    )
-    return end_time - start_time, download_status
-
-
-if __name__ == "__main__":
-    main_concurrent(data_config, download_config)
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import requests
+import json
+import circuit_breaker
+import config
+import dedup
+import dns_cache
+import http_cache
+import input_cache
+import metrics
+import partial
+import probe
+import retry
+import scheduler
+import status_log
+import storage
+import validation
+import hashlib
+import math
+import os
+import tempfile
+import time
+import asyncio
+import contextlib
+import functools
+import importlib.util
+import multiprocessing
+import queue
+import threading
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from typing import NamedTuple
+from _collections_abc import Hashable
+from requests.adapters import HTTPAdapter
+from requests.exceptions import MissingSchema, InvalidSchema, InvalidURL, URLRequired
+from urllib3.exceptions import DecodeError, HTTPError, ProtocolError, ReadTimeoutError, SSLError
+
+
+data_config = config.DataConfig(
+    data_file=config.DATA_FILE,
+    log_file=config.LOG_FILE,
+    sheet_name=config.SHEET_NAME,
+    id_column=config.ID_COLUMN,
+    pdf_url_column=config.PDF_URL_COLUMN,
+    secondary_pdf_url_column=config.SECONDARY_PDF_URL_COLUMN,
+    cache_dir=config.CACHE_DIR,
+    metrics_dir=config.METRICS_DIR,
+)
+
+download_config = config.DownloadConfig(
+    downloads_dir=config.DOWNLOADS_DIR,
+    download_timeout=config.DOWNLOAD_TIMEOUT,
+    batch_size=config.BATCH_SIZE,
+    request_headers=config.REQUEST_HEADERS,
+    workers=config.WORKERS,
+    stream=config.STREAM_DOWNLOADS,
+    chunk_size=config.CHUNK_SIZE,
+    validate_pdf=config.VALIDATE_PDF,
+    resume_partial=config.RESUME_PARTIAL,
+    probe=config.PROBE,
+    probe_cache_file=config.PROBE_CACHE_FILE,
+    probe_max_age=config.PROBE_MAX_AGE,
+    async_concurrency=config.ASYNC_CONCURRENCY,
+    dns_prefetch=config.DNS_PREFETCH,
+    dns_ttl=config.DNS_TTL,
+    dns_workers=config.DNS_WORKERS,
+    pool_connections=config.POOL_CONNECTIONS,
+    pool_maxsize=config.POOL_MAXSIZE,
+    keep_alive=config.KEEP_ALIVE,
+    max_per_host=config.MAX_PER_HOST,
+    min_host_interval=config.MIN_HOST_INTERVAL,
+    circuit_breaker=config.CIRCUIT_BREAKER,
+    breaker_threshold=config.BREAKER_THRESHOLD,
+    breaker_cooldown=config.BREAKER_COOLDOWN,
+    breaker_file=config.BREAKER_FILE,
+    queue_size=config.QUEUE_SIZE,
+    dedup=config.DEDUP,
+    conditional_requests=config.CONDITIONAL_REQUESTS,
+    storage_backend=config.STORAGE_BACKEND,
+    sharded_layout=config.SHARDED_LAYOUT,
+    storage_writers=config.STORAGE_WRITERS,
+    fsync=config.FSYNC,
+    fsync_batch=config.FSYNC_BATCH,
+    s3_bucket=config.S3_BUCKET,
+    s3_prefix=config.S3_PREFIX,
+    s3_endpoint_url=config.S3_ENDPOINT_URL,
+    hedge_delay=config.HEDGE_DELAY,
+    autotune=config.AUTOTUNE,
+    min_workers=config.MIN_WORKERS,
+    max_retries=config.MAX_RETRIES,
+    retry_base_delay=config.RETRY_BASE_DELAY,
+    retry_max_delay=config.RETRY_MAX_DELAY,
+    retry_budget_ratio=config.RETRY_BUDGET_RATIO,
+    connect_timeout=config.CONNECT_TIMEOUT,
+    read_timeout=config.READ_TIMEOUT,
+    deadline=config.DOWNLOAD_DEADLINE,
+    min_throughput=config.MIN_THROUGHPUT,
+    throughput_grace=config.THROUGHPUT_GRACE,
+    processes=config.PROCESSES,
+)
+
+# Each worker thread keeps its own sessions, requests.Session is not guaranteed to be thread safe
+_thread_local = threading.local()
+
+# Shared by every session of the process when config.dns_prefetch is set, see get_dns_cache
+_dns_cache: dns_cache.DnsCache | None = None
+_dns_cache_lock = threading.Lock()
+
+# Codes main_retry_failed requests again, the rows of any other failure are not requested again
+RETRYABLE_CODES = retry.TRANSIENT_CODES | {circuit_breaker.OPEN_CODE}
+
+# Shared by all hedged downloads, see get_hedge_executor
+_hedge_executor: ThreadPoolExecutor | None = None
+_hedge_executor_lock = threading.Lock()
+
+
+def get_session(config: config.DownloadConfig) -> requests.Session:
+    """Returns the calling thread's requests.Session, creating it on first use.
+
+    Reusing the session keeps connections alive between downloads, so rows pointing
+    at the same host skip the TCP and TLS handshake. With config.dns_prefetch set, new
+    connections look their host up in the process's DnsCache instead of the system resolver.
+
+    Args:
+        config: DownloadConfig specifying the connection pool and keep-alive settings.
+
+    Returns:
+        requests.Session: The session for the current thread and pool settings.
+    """
+    key = (config.pool_connections, config.pool_maxsize, config.keep_alive, config.dns_prefetch)
+    sessions = getattr(_thread_local, "sessions", None)
+    if sessions is None:
+        sessions = _thread_local.sessions = {}
+
+    session = sessions.get(key)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=config.pool_connections, pool_maxsize=config.pool_maxsize)
+        metrics.instrument_adapter(adapter)
+        if config.dns_prefetch:
+            dns_cache.install(adapter, get_dns_cache(config))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not config.keep_alive:
+            session.headers["Connection"] = "close"
+        sessions[key] = session
+    return session
+
+
+def get_dns_cache(config: config.DownloadConfig) -> dns_cache.DnsCache:
+    """Returns the DnsCache shared by all sessions of the process, creating it on first use.
+
+    Args:
+        config: DownloadConfig specifying how long resolved names are kept.
+
+    Returns:
+        dns_cache.DnsCache: The cache of the process.
+    """
+    global _dns_cache
+    with _dns_cache_lock:
+        if _dns_cache is None:
+            _dns_cache = dns_cache.DnsCache(config.dns_ttl)
+    return _dns_cache
+
+
+def open_storage(config: config.DownloadConfig) -> storage.Storage:
+    """Creates the Storage the downloads of a run are saved to.
+
+    Args:
+        config: DownloadConfig specifying the backend and its settings.
+
+    Returns:
+        storage.Storage: A LocalStorage in config.downloads_dir, or an S3Storage uploading
+            to config.s3_bucket with config.downloads_dir as its staging directory.
+
+    Raises:
+        ImportError: If the s3 backend is chosen and boto3 is not installed.
+        ValueError: If config.storage_backend is unknown, or s3 without a bucket.
+    """
+    if config.storage_backend == "local":
+        return storage.LocalStorage(config.downloads_dir, config.sharded_layout, config.storage_writers, config.fsync, config.fsync_batch)
+    if config.storage_backend == "s3":
+        if not config.s3_bucket:
+            raise ValueError("The s3 storage backend requires s3_bucket")
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError("The s3 storage backend requires boto3, install it with: pip install boto3") from None
+        client = boto3.client("s3", endpoint_url=config.s3_endpoint_url)
+        return storage.S3Storage(client, config.s3_bucket, config.downloads_dir, config.s3_prefix, max(config.storage_writers, 1))
+    raise ValueError(f"Unknown storage backend: {config.storage_backend!r}")
+
+
+def prefetch_dns(urls: Iterable[list[str]], config: config.DownloadConfig) -> set[str]:
+    """Resolves the host of every URL concurrently before the downloads start.
+
+    Each host is looked up once, instead of by every worker that connects to it, and hosts
+    that don't exist are known before any row waits on them, see download_row.
+
+    Args:
+        urls: The candidate URLs of each row, as returned by extract_urls.
+        config: DownloadConfig specifying the number of lookups in flight.
+
+    Returns:
+        set[str]: The hosts whose name doesn't exist.
+    """
+    started = time.perf_counter()
+    hosts = {scheduler.url_host(url) for row_urls in urls for url in row_urls}
+    not_found = get_dns_cache(config).prefetch(hosts, config.dns_workers)
+    print(f"Resolved {len(hosts)} hosts in {time.perf_counter() - started:.2f} seconds, {len(not_found)} don't exist")
+    return not_found
+
+
+def request_timeout(config: config.DownloadConfig) -> tuple[float, float]:
+    """Returns the (connect, read) timeout passed to requests.
+
+    Args:
+        config: DownloadConfig specifying the timeouts, config.download_timeout is used for any that is None.
+
+    Returns:
+        tuple: Seconds to connect, and seconds to wait for each read from the socket.
+    """
+    connect = config.download_timeout if config.connect_timeout is None else config.connect_timeout
+    read = config.download_timeout if config.read_timeout is None else config.read_timeout
+    return connect, read
+
+
+def verify_pdf(content: bytes | None) -> bool:
+    """Verifies if the content is a valid PDF by checking first bytes.
+
+    Args:
+        content: bytes from the HTTP response.
+
+    Returns:
+        bool: True if content is a valid PDF, False otherwise.
+    """
+    
+    if not content:
+        return False
+    
+    PDF_MAGIC_BYTES = b"%PDF-"
+    return content.startswith(PDF_MAGIC_BYTES)
+
+
+class SlowTransfer(Exception):
+    """Raised when a streamed download misses its deadline or falls below the minimum throughput."""
+
+
+class TransferMonitor:
+    """Checks a streamed download against the deadline and minimum throughput of a DownloadConfig.
+
+    The deadline counts from when the request was sent, so connecting and waiting for the
+    headers use it up as well. Throughput is averaged from when the headers arrived and
+    only enforced after config.throughput_grace seconds, so a slow start is forgiven.
+    """
+
+    def __init__(self, config: config.DownloadConfig, started: float, clock: Callable[[], float] = time.monotonic):
+        self.deadline = None if config.deadline is None else started + config.deadline
+        self.min_throughput = config.min_throughput
+        self.grace = config.throughput_grace
+        self.received = 0
+        self._clock = clock
+        self._body_started = clock()
+
+    def check(self, size: int) -> None:
+        """Counts a received chunk and checks the limits.
+
+        Args:
+            size: Number of bytes in the chunk.
+
+        Raises:
+            SlowTransfer: If the deadline passed or the average throughput is too low.
+        """
+        self.received += size
+        now = self._clock()
+        if self.deadline is not None and now > self.deadline:
+            raise SlowTransfer(f"deadline passed after {self.received} bytes")
+
+        elapsed = now - self._body_started
+        if self.min_throughput and elapsed > self.grace and self.received / elapsed < self.min_throughput:
+            raise SlowTransfer(f"{self.received / elapsed:.0f} bytes/s is below the minimum of {self.min_throughput:.0f}")
+
+
+def iter_body(response: requests.Response, chunk_size: int) -> Iterator[bytes]:
+    """Yields the body of a streamed response as soon as bytes arrive, at most chunk_size at a time.
+
+    Unlike iter_content, which waits until a whole chunk has arrived, a server trickling
+    bytes can't keep a read from returning, so the checks between chunks still run.
+    Like iter_content, gzip and deflate bodies are decoded, and urllib3 errors are raised
+    as the requests exceptions iter_content would raise.
+
+    Args:
+        response: A requests response opened with stream=True.
+        chunk_size: Maximum number of bytes per chunk.
+
+    Yields:
+        bytes: Decoded body chunks.
+    """
+    try:
+        while chunk := response.raw.read1(chunk_size, decode_content=True):
+            yield chunk
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ReadTimeout(e) from e
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e) from e
+    except DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e) from e
+    except SSLError as e:
+        raise requests.exceptions.SSLError(e) from e
+    except HTTPError as e:
+        raise requests.ConnectionError(e) from e
+
+
+def stream_pdf_to_file(response: requests.Response, save_path: Path, chunk_size: int, digest: "hashlib._Hash | None" = None, control: "AttemptControl | None" = None, monitor: TransferMonitor | None = None, validator: validation.PdfValidator | None = None, part: Path | None = None, offset: int = 0) -> bool:
+    """Streams a PDF response body to disk without holding the whole file in memory.
+
+    The magic bytes are checked on the first bytes received, before anything is written.
+    The body is written to a temp file next to save_path and atomically renamed into place,
+    so a failed or interrupted download never leaves a partial file under the final name.
+    With a validator, every chunk is also fed to it and the body must pass its final
+    checks before the rename.
+
+    With a part file, the body is written there instead and the bytes received are kept if
+    the download fails, so it can be continued later. If offset is set, the response is the
+    rest of the body after the first offset bytes already in part: those are fed to digest
+    and validator first, and the response is appended.
+
+    Args:
+        response: A requests response opened with stream=True.
+        save_path: The final path of the PDF file.
+        chunk_size: Number of bytes read from the response at a time.
+        digest: Optional hashlib object that is updated with every byte written.
+        control: Optional AttemptControl that is told when PDF bytes arrive and checked for cancellation.
+        monitor: Optional TransferMonitor that is checked after every chunk.
+        validator: Optional PdfValidator that checks the whole body as it streams.
+        part: Optional part file that is kept when the download fails, see partial.part_path.
+        offset: Bytes of part that response continues from, 0 for a response with the whole body.
+
+    Returns:
+        bool: True if the PDF was written, False if the content is not a valid PDF.
+
+    Raises:
+        OSError: If the temp file can't be written or renamed.
+        DownloadCancelled: If control was cancelled while the body was streaming.
+        SlowTransfer: If monitor found the download too slow.
+        InvalidPdf: If validator found the body truncated or without a trailer.
+    """
+    chunks = iter_body(response, chunk_size)
+    if monitor is not None:
+        chunks = _monitored(chunks, monitor)
+
+    # Chunks can be shorter than the magic bytes, so read until we have enough
+    head = b""
+    if not offset:
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= len(b"%PDF-"):
+                break
+        if not verify_pdf(head):
+            return False
+    # A continued part file was checked for the magic bytes by partial.resume_state
+    if control is not None:
+        control.first_bytes.set()
+
+    if part is None:
+        fd, tmp_name = tempfile.mkstemp(dir=save_path.parent, prefix=f".{save_path.stem}.", suffix=".tmp")
+        target = Path(tmp_name)
+        file = os.fdopen(fd, "wb")
+    else:
+        target = part
+        if offset:
+            _feed_existing(part, offset, chunk_size, digest, validator)
+        file = open(part, "r+b" if offset else "wb")
+        file.truncate(offset)
+        file.seek(offset)
+
+    try:
+        with file:
+            file.write(head)
+            if digest is not None:
+                digest.update(head)
+            if validator is not None:
+                validator.update(head)
+            for chunk in chunks:
+                if control is not None and control.cancelled.is_set():
+                    raise DownloadCancelled()
+                file.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                if validator is not None:
+                    validator.update(chunk)
+        if validator is not None:
+            validator.finish()
+        os.replace(target, save_path)
+    except validation.InvalidPdf as e:
+        # All bytes arrived but don't make a PDF, continuing the part file would not help
+        if part is None or e.code == validation.CORRUPT_CODE:
+            target.unlink(missing_ok=True)
+        raise
+    except BaseException:
+        # The part file holds a prefix of the body and is kept for the next attempt
+        if part is None:
+            target.unlink(missing_ok=True)
+        raise
+    if part is not None:
+        partial.meta_path(part).unlink(missing_ok=True)
+    return True
+
+
+def _feed_existing(part: Path, offset: int, chunk_size: int, digest: "hashlib._Hash | None", validator: validation.PdfValidator | None) -> None:
+    if digest is None and validator is None:
+        return
+    with open(part, "rb") as file:
+        remaining = offset
+        while remaining and (chunk := file.read(min(chunk_size, remaining))):
+            remaining -= len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            if validator is not None:
+                validator.update(chunk)
+
+
+def _monitored(chunks: Iterator[bytes], monitor: TransferMonitor) -> Iterator[bytes]:
+    for chunk in chunks:
+        monitor.check(len(chunk))
+        yield chunk
+
+
+class FetchResult(NamedTuple):
+    """Outcome of downloading a single URL."""
+    ok: bool
+    code: int
+    validators: dict | None = None
+    retry_after: float | None = None
+
+
+class ProbeResult(NamedTuple):
+    """What a Range probe found out about a URL.
+
+    Attributes:
+        is_pdf: The verdict of probe.classify, None if the probe failed or can't tell.
+        content_type: The Content-Type of the response.
+        encoded: Whether the body was content-encoded, so the verdict came from decoding a
+            range of the compressed bytes.
+        timed_out: Whether the probe timed out.
+    """
+    is_pdf: bool | None
+    content_type: str | None = None
+    encoded: bool = False
+    timed_out: bool = False
+
+
+class RowResult(NamedTuple):
+    """Outcome of downloading a row, with what run_downloads needs to schedule a retry and report timings."""
+    status: tuple[bool, int, str]
+    retry_after: float | None = None
+    attempts: tuple[metrics.AttemptTiming, ...] = ()
+
+
+@dataclass
+class AttemptControl:
+    """Lets another thread follow and stop a download running in a worker.
+
+    Attributes:
+        first_bytes: Set once the response has been verified to start with the PDF magic bytes.
+        cancelled: Set by the other thread to abort the download at the next chunk.
+    """
+    first_bytes: threading.Event = field(default_factory=threading.Event)
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+
+class DownloadCancelled(Exception):
+    """Raised inside a download whose AttemptControl was cancelled."""
+
+
+def fetch_pdf(row_id: Hashable | str, url: str, save_path: Path, config: config.DownloadConfig, digest: "hashlib._Hash | None" = None, cached_path: Path | None = None, control: AttemptControl | None = None, timing: metrics.AttemptTiming | None = None, part: Path | None = None) -> FetchResult:
+    """Downloads a single URL to save_path if it returns a PDF.
+
+    With config.resume_partial set and a part file, a streamed download keeps the bytes it
+    received when it fails, and the next call for the same URL asks only for the rest with a
+    Range request. If-Range makes the server send the whole file again if it changed, and a
+    range the server can't serve falls back to a full download.
+
+    Args:
+        row_id: The identifier for the row, only used in messages.
+        url: The URL to download.
+        save_path: Where the PDF is written.
+        config: DownloadConfig specifying download settings.
+        digest: Optional hashlib object that is updated with the PDF's content.
+        cached_path: An earlier download of url. If config.conditional_requests is set and its
+            validators are stored, the GET is conditional and a 304 leaves the file as it is.
+            Defaults to save_path.
+        control: Optional AttemptControl used by hedged downloads to follow and cancel this one.
+        timing: Optional AttemptTiming that gets the time to the response headers and the bytes received.
+        part: Optional part file of the row, see partial.part_path. Only used when
+            config.resume_partial and config.stream are set.
+
+    Returns:
+        FetchResult: A boolean indicating success, the HTTP status code or the code the failure
+                     is mapped to (400, 408, 415, 500, 503, 917, 922), the cache validators of a successful
+                     response, and the delay asked for by a Retry-After header on an error response.
+                     A download completed from a part file has code 206.
+    """
+    if not (config.resume_partial and config.stream):
+        part = None
+    resume = partial.resume_state(part, url) if part is not None else None
+
+    headers = config.request_headers
+    if resume is not None:
+        # A conditional GET would answer 304 for the file we don't have yet
+        headers = {**headers, **resume.headers}
+    elif config.conditional_requests:
+        headers = {**headers, **http_cache.conditional_headers(cached_path or save_path, url)}
+
+    try:
+        started = time.monotonic()
+        response = get_session(config).get(url, timeout=request_timeout(config), headers=headers, stream=config.stream)
+        if timing is not None:
+            timing.ttfb = time.monotonic() - started
+
+        if resume is not None and response.status_code in (206, 416) and partial.content_range_start(response.headers.get("Content-Range")) != resume.offset:
+            response.close()
+            print(f"Can't resume ({response.status_code}): {row_id} at {url}, downloading it again")
+            partial.discard(part)
+            return fetch_pdf(row_id, url, save_path, config, digest, cached_path, control, timing, part)
+
+        # Closing the response releases the connection even if the body was never read
+        with response:
+            if response.status_code == 304:
+                print(f"Not modified (304): {row_id} at {url}")
+                return FetchResult(True, response.status_code)
+
+            if response.status_code == 404:
+                print(f"File not found (404): {row_id} at {url}")
+                return FetchResult(False, response.status_code)
+
+            if response.status_code == 403:
+                print(f"Access forbidden (403): {row_id} at {url}")
+                return FetchResult(False, response.status_code)
+
+            if not response.ok:
+                print(f"HTTP error {response.status_code} for {row_id} at {url}")
+                return FetchResult(False, response.status_code, retry_after=retry.parse_retry_after(response.headers.get("Retry-After")))
+
+            # A 200 instead of a 206 means the file changed, or the server ignores Range
+            offset = resume.offset if resume is not None and response.status_code == 206 else 0
+            if part is not None and not offset and not partial.start(part, url, response.headers):
+                # Without a validator a later Range request could mix two versions of the file
+                partial.discard(part)
+                part = None
+
+            monitor = TransferMonitor(config, started)
+            validator = None
+            if config.validate_pdf:
+                length = validation.expected_length(response.headers)
+                validator = validation.PdfValidator(None if length is None else offset + length)
+            try:
+                if config.stream:
+                    is_pdf = stream_pdf_to_file(response, save_path, config.chunk_size, digest, control, monitor, validator, part, offset)
+                else:
+                    monitor.received = len(response.content)
+                    is_pdf = verify_pdf(response.content)
+                    if is_pdf:
+                        if control is not None:
+                            control.first_bytes.set()
+                        if validator is not None:
+                            validator.update(response.content)
+                            validator.finish()
+                        storage.atomic_write_bytes(save_path, response.content)
+                        if digest is not None:
+                            digest.update(response.content)
+            except requests.RequestException:
+                raise
+            except OSError as e:
+                print(f"I/O error (500): {row_id} at {url}: {e}")
+                return FetchResult(False, 500)
+            finally:
+                if timing is not None:
+                    timing.bytes = monitor.received
+
+            if not is_pdf:
+                if part is not None:
+                    partial.discard(part)
+                print(f"Invalid PDF (415): {row_id} at {url}")
+                return FetchResult(False, 415)
+
+            if offset:
+                print(f"Resumed download at byte {offset}: {row_id} at {url}")
+            return FetchResult(True, response.status_code, http_cache.extract_validators(url, response.headers))
+
+    except (MissingSchema, InvalidSchema, InvalidURL, URLRequired, ValueError, TypeError):
+        print(f"Invalid URL (400): {row_id} at {url!r}")
+        return FetchResult(False, 400)
+
+    except DownloadCancelled:
+        print(f"Cancelled (499): {row_id} at {url}")
+        return FetchResult(False, 499)
+
+    except SlowTransfer as e:
+        print(f"Too slow (408): {row_id} at {url}: {e}")
+        return FetchResult(False, 408)
+
+    except validation.InvalidPdf as e:
+        print(f"{'Truncated' if e.code == validation.TRUNCATED_CODE else 'Corrupt'} PDF ({e.code}): {row_id} at {url}: {e}")
+        return FetchResult(False, e.code)
+
+    # The connection closed before the whole body arrived
+    except requests.exceptions.ChunkedEncodingError as e:
+        print(f"Truncated PDF ({validation.TRUNCATED_CODE}): {row_id} at {url}: {e}")
+        return FetchResult(False, validation.TRUNCATED_CODE)
+
+    except requests.Timeout:
+        print(f"Timeout error (408): {row_id} at {url}")
+        return FetchResult(False, 408)
+
+    except requests.ConnectionError:
+        print(f"Connection error (503): {row_id} at {url}")
+        return FetchResult(False, 503)
+
+    except requests.RequestException as e:
+        print(f"Error with file (500): {row_id}: {e}")
+        return FetchResult(False, 500)
+
+
+def fetch_pdf_deduplicated(row_id: Hashable | str, url: str, save_path: Path, config: config.DownloadConfig, url_flights: dedup.SingleFlight, timing: metrics.AttemptTiming | None = None) -> FetchResult:
+    """Downloads a URL at most once per run into the content store and links save_path to it.
+
+    The PDF is stored under its SHA-256 digest in downloads_dir/.objects, so rows with the
+    same URL or the same content share one file on disk, and save_path is a hard link to it.
+    An unfinished download is kept in the part file of save_path, see fetch_pdf.
+
+    Args:
+        row_id: The identifier for the row, only used in messages.
+        url: The URL to download.
+        save_path: The per-row file name that is linked to the stored PDF.
+        config: DownloadConfig specifying download settings.
+        url_flights: SingleFlight shared by all workers in the run, keyed by URL.
+        timing: Optional AttemptTiming, only filled in if this call downloads url.
+
+    Returns:
+        FetchResult: As returned by fetch_pdf for the single download of url.
+    """
+    objects_dir = config.downloads_dir / dedup.OBJECTS_DIR_NAME
+
+    def fetch_to_store() -> tuple[FetchResult, Path | None]:
+        digest = hashlib.sha256()
+        tmp_path = dedup.incoming_path(objects_dir)
+        result = fetch_pdf(row_id, url, tmp_path, config, digest, cached_path=save_path, timing=timing, part=partial.part_path(save_path))
+        if not result.ok:
+            return result, None
+        # Not modified, the row's existing file is still the current copy
+        if result.code == 304:
+            return result, save_path
+        return result, dedup.store_file(tmp_path, digest.hexdigest(), objects_dir)
+
+    try:
+        result, stored_path = url_flights.do(url, fetch_to_store)
+        # A transient failure must not be replayed to a retry of this or another row
+        if result.code in retry.TRANSIENT_CODES:
+            url_flights.forget(url)
+        if result.ok and stored_path != save_path:
+            dedup.link_file(stored_path, save_path)
+    except OSError as e:
+        print(f"I/O error (500): {row_id} at {url}: {e}")
+        return FetchResult(False, 500)
+    return result
+
+
+def timed_fetch(timing: metrics.AttemptTiming, fetch: Callable[[], FetchResult]) -> FetchResult:
+    """Runs fetch and completes timing with its outcome, duration and connect time.
+
+    Args:
+        timing: The AttemptTiming for the URL fetch downloads, passed to it as well.
+        fetch: Downloads the URL, in the calling thread.
+
+    Returns:
+        FetchResult: The result of fetch.
+    """
+    metrics.take_connect_time()
+    started = time.monotonic()
+    result = fetch()
+    timing.total = time.monotonic() - started
+    timing.connect = metrics.take_connect_time()
+    timing.ok, timing.code = result.ok, result.code
+    if timing.ttfb is not None:
+        timing.transfer = max(timing.total - timing.ttfb, 0.0)
+    return result
+
+
+def probe_pdf(url: str, config: config.DownloadConfig) -> ProbeResult:
+    """Asks url for its first bytes with a Range request to see if it serves a PDF.
+
+    Servers that ignore the Range header send the whole body, but only the first
+    probe.PROBE_BYTES bytes are read before the connection is closed. Content-encoded
+    bodies are decoded before they are classified.
+
+    Args:
+        url: The URL to probe.
+        config: DownloadConfig specifying the session settings, headers and timeouts.
+
+    Returns:
+        ProbeResult: The verdict and the Content-Type, or no verdict if the probe failed.
+    """
+    headers = {**config.request_headers, "Range": f"bytes=0-{probe.PROBE_BYTES - 1}"}
+    try:
+        with get_session(config).get(url, timeout=request_timeout(config), headers=headers, stream=True) as response:
+            if response.status_code not in (200, 206):
+                return ProbeResult(None)
+            head = b""
+            for chunk in iter_body(response, probe.PROBE_BYTES):
+                head += chunk
+                if len(head) >= len(b"%PDF-"):
+                    break
+            content_type = response.headers.get("Content-Type")
+            encoded = response.headers.get("Content-Encoding", "identity").strip().lower() != "identity"
+            return ProbeResult(probe.classify(content_type, head), content_type, encoded)
+    except requests.Timeout:
+        return ProbeResult(None, timed_out=True)
+    # The full download reports what went wrong
+    except (requests.RequestException, ValueError, TypeError):
+        return ProbeResult(None)
+
+
+def probe_rejects(row_id: Hashable | str, url: str, config: config.DownloadConfig, probe_cache: probe.ProbeCache) -> int | None:
+    """Returns the status code url fails with without a full download, if a probe rules it out.
+
+    URLs ending in .pdf are not probed. Definite probe results are stored in probe_cache,
+    so a URL is probed at most once while its result is fresh. A negative verdict on a
+    content-encoded body is used for this attempt but not stored, so a misread compressed
+    PDF isn't skipped for probe_max_age. A probe that timed out counts as the attempt,
+    instead of waiting for the same timeout again on the full download.
+
+    Args:
+        row_id: The identifier for the row, only used in messages.
+        url: The URL about to be downloaded.
+        config: DownloadConfig specifying download settings.
+        probe_cache: ProbeCache shared by the run.
+
+    Returns:
+        int | None: 415 if url doesn't serve a PDF, 408 if the probe timed out, None to download it.
+    """
+    if not probe.needs_probe(url):
+        return None
+    is_pdf = probe_cache.get(url)
+    if is_pdf is None:
+        result = probe_pdf(url, config)
+        if result.timed_out:
+            print(f"Timeout error (408), probe got no answer: {row_id} at {url}")
+            return 408
+        is_pdf = result.is_pdf
+        if is_pdf or (is_pdf is False and not result.encoded):
+            probe_cache.put(url, is_pdf, result.content_type)
+    if is_pdf is False:
+        print(f"Not a PDF, skipped after probe (415): {row_id} at {url}")
+        return 415
+    return None
+
+
+def get_hedge_executor(config: config.DownloadConfig) -> ThreadPoolExecutor:
+    """Returns the thread pool hedged attempts run on, creating it on first use.
+
+    The pool outlives single rows so its threads keep their pooled sessions, and cancelled
+    attempts that are still connecting can finish in the background without holding a worker.
+    """
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=2 * config.workers, thread_name_prefix="hedge")
+    return _hedge_executor
+
+
+def fetch_hedged(row_id: Hashable | str, urls: list[str], save_path: Path, config: config.DownloadConfig, timings: list[metrics.AttemptTiming] | None = None) -> tuple[FetchResult, str]:
+    """Races the secondary URL against a slow primary URL.
+
+    The primary URL is started first. If it hasn't delivered PDF bytes after config.hedge_delay
+    seconds, the secondary URL is started as well, the first valid PDF wins and the other
+    attempt is cancelled. If the primary fails before that, the secondary is tried as a normal
+    fallback. Each attempt writes to its own file and the winner is renamed to save_path.
+
+    Args:
+        row_id: The identifier for the row, only used in messages.
+        urls: The primary and secondary URL.
+        save_path: Where the PDF is saved.
+        config: DownloadConfig specifying download settings and hedge_delay.
+        timings: Optional list the timings of the attempts that finished are appended to.
+
+    Returns:
+        tuple: The FetchResult of the winning attempt, or of the last failed one, and its URL.
+    """
+    executor = get_hedge_executor(config)
+    attempts = {}
+
+    def start(index: int) -> Future:
+        path = save_path.with_name(f".{save_path.stem}.hedge{index}.pdf")
+        control = AttemptControl()
+        timing = metrics.AttemptTiming(urls[index], index, scheduler.url_host(urls[index]))
+        fetch = functools.partial(fetch_pdf, row_id, urls[index], path, config, cached_path=save_path, control=control, timing=timing)
+        future = executor.submit(timed_fetch, timing, fetch)
+        attempts[future] = (urls[index], path, control, timing)
+        return future
+
+    def discard_others(winner: Future | None) -> None:
+        if timings is not None:
+            timings.extend(timing for future, (*_, timing) in attempts.items() if future.done())
+        # Losers may still be connecting, their files are removed whenever they finish
+        for future, (_, path, control, _) in attempts.items():
+            if future is not winner:
+                control.cancelled.set()
+                future.add_done_callback(lambda _, path=path: path.unlink(missing_ok=True))
+
+    primary = start(0)
+    pending = {primary}
+    secondary_started = False
+    hedge_decided = False
+    result, url = FetchResult(False, 0), urls[0]
+
+    while pending:
+        done, pending = wait(pending, timeout=None if hedge_decided else config.hedge_delay, return_when=FIRST_COMPLETED)
+
+        if not done:
+            # The primary is slow: hedge, unless it is already streaming the PDF
+            hedge_decided = True
+            if not attempts[primary][2].first_bytes.is_set():
+                print(f"Hedging {row_id}: primary slower than {config.hedge_delay}s, starting {urls[1]}")
+                pending.add(start(1))
+                secondary_started = True
+            continue
+
+        for future in done:
+            url, path, _, _ = attempts[future]
+            result = future.result()
+            if not result.ok:
+                continue
+
+            discard_others(future)
+            if result.code != 304:
+                try:
+                    os.replace(path, save_path)
+                except OSError as e:
+                    print(f"I/O error (500): {row_id} at {url}: {e}")
+                    return FetchResult(False, 500), url
+            return result, url
+
+        # The primary failed before the hedge started, fall back to the secondary as usual
+        if not secondary_started and not pending:
+            hedge_decided = secondary_started = True
+            pending.add(start(1))
+
+    discard_others(None)
+    return result, url
+
+
+def download_pdf_file(row_id: Hashable | str, urls: list[str], config: config.DownloadConfig, url_flights: dedup.SingleFlight | None = None, probe_cache: probe.ProbeCache | None = None, store: storage.Storage | None = None) -> tuple[bool, int, str]:
+    """Downloads a PDF file from the given URLs and saves it to the specified directory.
+
+    See download_row, which also reports the delay a server asked for before a retry.
+
+    Args:
+        row_id: The identifier for the row, used to name the saved file.
+        urls: A list of URLs to attempt to download the PDF from.
+        config: DownloadConfig specifying download settings and directory.
+        url_flights: SingleFlight shared by the run so each URL is downloaded once, used when config.dedup is set.
+        probe_cache: ProbeCache shared by the run, used when config.probe is set.
+        store: Storage shared by the run, see download_row.
+
+    Returns:
+        tuple: A tuple containing a boolean indicating success,
+               the HTTP status code of the last attempt, and the URL used.
+    """
+    return download_row(row_id, urls, config, url_flights, probe_cache, store=store).status
+
+
+def download_row(row_id: Hashable | str, urls: list[str], config: config.DownloadConfig, url_flights: dedup.SingleFlight | None = None, probe_cache: probe.ProbeCache | None = None, breaker: circuit_breaker.CircuitBreaker | None = None, store: storage.Storage | None = None) -> RowResult:
+    """Downloads a PDF file from the given URLs and saves it to the specified directory.
+
+    The URLs are tried in order until one returns a valid PDF. If config.hedge_delay is set,
+    the secondary URL is raced against a slow primary instead, see fetch_hedged. Hedged rows
+    are not deduplicated, since a cancelled attempt must not be shared with other rows.
+    With config.resume_partial set, an attempt cut off mid-body is continued by the next
+    attempt of the same URL, see fetch_pdf. Hedged rows don't keep part files, and the
+    part file of a row is removed once the row fails with a code outside RETRYABLE_CODES.
+    With config.probe set, URLs that don't end in .pdf are probed first and skipped as 415
+    if they don't serve a PDF, see probe_rejects. Hedged rows are not probed. With
+    config.dns_prefetch set, URLs on a host the DnsCache knows doesn't exist fail right away
+    with dns_cache.UNRESOLVED_CODE. With a breaker, URLs on a host whose circuit is open
+    fail right away with circuit_breaker.OPEN_CODE, and every other attempt is recorded
+    to it. Hedged rows don't use the breaker.
+
+    The PDF is saved where store puts it, and handed over to store once complete, so an
+    fsync or upload doesn't hold up the worker. Without a store it is saved in
+    config.downloads_dir, in its hash-prefix subdirectory if config.sharded_layout is set.
+    A store that doesn't keep files locally, such as S3Storage, turns off config.dedup and
+    the validators of config.conditional_requests.
+
+    Args:
+        row_id: The identifier for the row, used to name the saved file.
+        urls: A list of URLs to attempt to download the PDF from.
+        config: DownloadConfig specifying download settings and directory.
+        url_flights: SingleFlight shared by the run so each URL is downloaded once, used when config.dedup is set.
+        probe_cache: ProbeCache shared by the run, used when config.probe is set. Without one,
+            probe results are only kept for this row.
+        breaker: Optional CircuitBreaker shared by the run.
+        store: Optional Storage shared by the run, see open_storage.
+
+    Returns:
+        RowResult: The (success, status_code, url) tuple of the last attempt, the Retry-After
+                   delay in seconds if the last attempt's response had one, and the timing of every attempt.
+    """
+    if store is not None:
+        save_path = store.path(row_id)
+    else:
+        save_path = storage.row_path(config.downloads_dir, row_id, config.sharded_layout)
+        if config.sharded_layout:
+            save_path.parent.mkdir(parents=True, exist_ok=True)
+    result_code = 0
+    url = ""
+
+    # extract_urls drops URLs without an http(s) scheme, which can leave a row with nothing to try
+    if not urls:
+        print(f"No valid URL (400): {row_id}")
+        return RowResult((False, 400, url))
+
+    # Without local files the content store would keep a copy of every uploaded PDF,
+    # and validators would be left next to a PDF that is gone
+    keeps_files = store is None or store.keeps_files
+    deduplicate = config.dedup and keeps_files
+    if deduplicate and url_flights is None:
+        url_flights = dedup.SingleFlight()
+    if config.probe and probe_cache is None:
+        probe_cache = probe.ProbeCache()
+
+    attempts = []
+
+    def attempt(index: int, url: str) -> FetchResult:
+        timing = metrics.AttemptTiming(url, index, scheduler.url_host(url))
+        attempts.append(timing)
+        allowed = False
+
+        def fetch() -> FetchResult:
+            nonlocal allowed
+            if breaker is not None:
+                if not breaker.allow(timing.host):
+                    print(f"Host circuit open ({circuit_breaker.OPEN_CODE}): {row_id} at {url}")
+                    return FetchResult(False, circuit_breaker.OPEN_CODE)
+                allowed = True
+            if config.dns_prefetch and get_dns_cache(config).is_unresolvable(timing.host):
+                print(f"Host not found ({dns_cache.UNRESOLVED_CODE}): {row_id} at {url}")
+                return FetchResult(False, dns_cache.UNRESOLVED_CODE)
+            if config.probe and (code := probe_rejects(row_id, url, config, probe_cache)) is not None:
+                return FetchResult(False, code)
+            if deduplicate:
+                return fetch_pdf_deduplicated(row_id, url, save_path, config, url_flights, timing)
+            return fetch_pdf(row_id, url, save_path, config, timing=timing, part=partial.part_path(save_path))
+
+        try:
+            return timed_fetch(timing, fetch)
+        finally:
+            # Every allowed attempt ends the probe of a half-open host, also one that never
+            # reached the host, e.g. a cached probe verdict or an unresolvable name
+            if allowed:
+                failed = circuit_breaker.host_failed(timing.code, timing.ttfb is not None)
+                if failed is None:
+                    breaker.release(timing.host)
+                else:
+                    breaker.record(timing.host, failed)
+
+    if config.hedge_delay is not None and len(urls) > 1:
+        result, url = fetch_hedged(row_id, urls, save_path, config, timings=attempts)
+        results = [(url, result)]
+    else:
+        # Lazy, so the URLs after the first success are never requested
+        results = ((url, attempt(index, url)) for index, url in enumerate(urls))
+
+    retry_after = None
+    for url, result in results:
+        result_code = result.code
+        retry_after = result.retry_after
+        if result.ok:
+            # A 304 keeps the file and the validators stored with it
+            if config.conditional_requests and keeps_files and result.code != 304:
+                try:
+                    http_cache.write_validators(save_path, result.validators)
+                except OSError as e:
+                    print(f"Could not store validators for {row_id}: {e}")
+            # An earlier URL of the row may have left a part file
+            if config.resume_partial:
+                partial.discard(partial.part_path(save_path))
+            if store is not None and result.code != 304:
+                store.commit(row_id, save_path, url)
+            print(f"Successfully downloaded and wrote file: {row_id}")
+            return RowResult((True, result_code, url), attempts=tuple(attempts))
+
+    # The row won't be requested again, so a part file left by one of its URLs would never be continued
+    if config.resume_partial and result_code not in RETRYABLE_CODES:
+        partial.discard(partial.part_path(save_path))
+    return RowResult((False, result_code, url), retry_after, tuple(attempts))
+
+
+async def download_pdf_file_async(session: "aiohttp.ClientSession", row_id: Hashable | str, urls: list[str], config: config.DownloadConfig) -> tuple[bool, int, str]:
+    """Asyncio counterpart of download_pdf_file, using a shared aiohttp session.
+
+    The body is always streamed in chunks of config.chunk_size through a temp file,
+    and the returned status codes follow the same mapping as download_pdf_file.
+
+    Args:
+        session: The aiohttp session shared by all downloads in the run.
+        row_id: The identifier for the row, used to name the saved file.
+        urls: A list of URLs to attempt to download the PDF from.
+        config: DownloadConfig specifying download settings and directory.
+
+    Returns:
+        tuple: A tuple containing a boolean indicating success,
+               the HTTP status code, and the URL used.
+    """
+    import aiohttp
+
+    save_path = storage.row_path(config.downloads_dir, row_id, config.sharded_layout)
+    if config.sharded_layout:
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+    # Same semantics as the requests timeout, plus the deadline for the whole download
+    connect_timeout, read_timeout = request_timeout(config)
+    timeout = aiohttp.ClientTimeout(total=config.deadline, sock_connect=connect_timeout, sock_read=read_timeout)
+    result_code = 0
+    url = ""
+
+    if not urls:
+        print(f"No valid URL (400): {row_id}")
+        return False, 400, url
+
+    try:
+        for url in urls:
+            async with session.get(url, timeout=timeout, headers=config.request_headers) as response:
+                if response.status == 404:
+                    print(f"File not found (404): {row_id} at {url}")
+                    result_code = response.status
+                    continue
+
+                if response.status == 403:
+                    print(f"Access forbidden (403): {row_id} at {url}")
+                    result_code = response.status
+                    continue
+
+                if not response.ok:
+                    print(f"HTTP error {response.status} for {row_id} at {url}")
+                    result_code = response.status
+                    continue
+
+                # read() may stop at a chunk boundary, a body shorter than the magic is not a PDF anyway
+                try:
+                    head = await response.content.readexactly(len(b"%PDF-"))
+                except asyncio.IncompleteReadError as e:
+                    head = e.partial
+                if not verify_pdf(head):
+                    result_code = 415
+                    print(f"Invalid PDF (415): {row_id} at {url}")
+                    continue
+
+                validator = validation.PdfValidator(validation.expected_length(response.headers)) if config.validate_pdf else None
+                try:
+                    fd, tmp_name = tempfile.mkstemp(dir=save_path.parent, prefix=f".{save_path.stem}.", suffix=".tmp")
+                    try:
+                        with os.fdopen(fd, "wb") as file:
+                            file.write(head)
+                            if validator is not None:
+                                validator.update(head)
+                            async for chunk in response.content.iter_chunked(config.chunk_size):
+                                file.write(chunk)
+                                if validator is not None:
+                                    validator.update(chunk)
+                        if validator is not None:
+                            validator.finish()
+                        os.replace(tmp_name, save_path)
+                    except BaseException:
+                        Path(tmp_name).unlink(missing_ok=True)
+                        raise
+                # Network and timeout errors are OSError subclasses too, let them reach the handlers below
+                except (aiohttp.ClientError, TimeoutError):
+                    raise
+                except validation.InvalidPdf as e:
+                    result_code = e.code
+                    print(f"{'Truncated' if e.code == validation.TRUNCATED_CODE else 'Corrupt'} PDF ({e.code}): {row_id} at {url}: {e}")
+                    continue
+                except OSError as e:
+                    print(f"I/O error (500): {row_id} at {url}: {e}")
+                    return False, 500, url
+
+                print(f"Successfully downloaded and wrote file: {row_id}")
+                return True, response.status, url
+
+    except (aiohttp.InvalidURL, aiohttp.NonHttpUrlClientError, ValueError, TypeError):
+        print(f"Invalid URL (400): {row_id} at {url!r}")
+        return False, 400, url
+
+    # aiohttp's timeout errors also subclass ClientConnectionError, so they must be caught first
+    except TimeoutError:
+        result_code = 408
+        print(f"Timeout error (408): {row_id} at {url}")
+
+    # The connection closed before the whole body arrived
+    except aiohttp.ClientPayloadError:
+        result_code = validation.TRUNCATED_CODE
+        print(f"Truncated PDF ({result_code}): {row_id} at {url}")
+
+    except aiohttp.ClientConnectionError:
+        result_code = 503
+        print(f"Connection error (503): {row_id} at {url}")
+
+    except aiohttp.ClientError as e:
+        result_code = 500
+        print(f"Error with file (500): {row_id}: {e}")
+
+    return False, result_code, url
+
+
+async def download_all_async(urls: pd.Series, config: config.DownloadConfig, log: status_log.StatusLog, progress: metrics.ProgressReporter | None = None) -> dict:
+    """Downloads all rows concurrently on a single event loop.
+
+    Tasks are created from urls as earlier ones finish, so no more than
+    config.async_concurrency rows are pending at a time.
+
+    Args:
+        urls: A series where each entry is a list of URLs for the corresponding row.
+        config: DownloadConfig containing download settings.
+        log: StatusLog each result is recorded to as soon as it is known.
+        progress: Optional ProgressReporter that gets the final status of every row.
+
+    Returns:
+        dict: The download status for each row id.
+    """
+    import aiohttp
+
+    # The window of pending tasks caps requests in flight, so the connector limit is removed
+    connector = aiohttp.TCPConnector(limit=0)
+    rows = iter(urls.items())
+    download_status = {}
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def download_row(index: Hashable, row_urls: list[str]) -> tuple[Hashable, tuple[bool, int, str]]:
+            return index, await download_pdf_file_async(session, index, row_urls, config)
+
+        pending = set()
+        while True:
+            while len(pending) < config.async_concurrency and (row := next(rows, None)) is not None:
+                pending.add(asyncio.ensure_future(download_row(*row)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, state = task.result()
+                download_status[index] = state
+                log.record(index, state)
+                if progress is not None:
+                    progress.record_row(state)
+    return download_status
+
+
+def read_json_to_dict(filepath: Path) -> dict:
+    """Small helper function that returns an empty dictionary if the log files doesn't exist.
+
+    Args:
+        filepath: The path to the json file.
+
+    Returns:
+        dict: The content of the json file as a dictionary or an empty dictionary if the file doesn't exist.
+    """
+    if not filepath.exists():
+        return {}
+    with open(filepath, "r") as file:
+        status = json.load(file)
+    return status
+
+
+def open_status_log(config: config.DataConfig) -> status_log.StatusLog:
+    """Opens the status log, importing the old log.json next to it the first time.
+
+    Args:
+        config: DataConfig specifying the log file path.
+
+    Returns:
+        StatusLog: The append-only status log for the run.
+    """
+    log = status_log.StatusLog(config.log_file)
+    legacy_log_file = Path(config.log_file).with_name("log.json")
+    if len(log) == 0 and legacy_log_file.exists() and legacy_log_file != Path(config.log_file):
+        log.record_many(read_json_to_dict(legacy_log_file).items())
+    return log
+
+
+def load_data(config: config.DataConfig) -> pd.DataFrame:
+    """Reads the id and URL columns of the input sheet, using the parsed cache when it is current.
+
+    Args:
+        config: DataConfig specifying the data file, sheet, columns and cache directory.
+            If cache_dir is None the sheet is parsed on every call.
+
+    Returns:
+        pd.DataFrame: The URL columns indexed by the id column.
+    """
+    usecols = [config.id_column, config.pdf_url_column, config.secondary_pdf_url_column]
+    if config.cache_dir is None:
+        return pd.read_excel(config.data_file, sheet_name=config.sheet_name, usecols=usecols, index_col=config.id_column)
+    return input_cache.read_excel_cached(config.data_file, config.cache_dir, config.sheet_name, config.id_column, usecols)
+
+
+def filter_data(df: pd.DataFrame, config: config.DataConfig, batch_size: int | None = None) -> pd.DataFrame:
+    """Filters the dataframe to only include rows with valid URLs and not already processed.
+
+    Args:
+        df: The dataframe to filter.
+        config: DataConfig specifying which columns contain URLs and log file path.
+        batch_size: The number of rows to include in the batch. If None, includes all
+
+    Returns:
+        pd.DataFrame: The filtered dataframe.
+    """
+    has_url = (
+        df[config.pdf_url_column].notna() | df[config.secondary_pdf_url_column].notna()
+    )
+    df = df[has_url]
+
+    # Reads already processed IDs from the status log and filters them out
+    with open_status_log(config) as log:
+        processed_ids = log.processed_ids()
+    unprocessed_df = df[~df.index.astype(str).isin(processed_ids)]
+
+    # "Hack" to return the entire dataframe at call time if batch_size is None
+    if batch_size is None:
+        return unprocessed_df
+
+    return unprocessed_df.iloc[:batch_size]
+
+
+def clean_url_column(urls: pd.Series) -> pd.Series:
+    """Cleans a column of URLs with vectorized string operations.
+
+    Strips surrounding whitespace and replaces empty strings and URLs without an
+    http(s) scheme and host with NA.
+
+    Args:
+        urls: A column of raw URL values.
+
+    Returns:
+        pd.Series: The cleaned URLs as a string column, NA where there is no usable URL.
+    """
+    cleaned = urls.astype("string").str.strip()
+    is_valid = cleaned.str.match(r"(?i)https?://[^\s/]+").fillna(False).astype(bool)
+    return cleaned.where(is_valid)
+
+
+def extract_urls(df: pd.DataFrame, config: config.DataConfig, compact: bool = False) -> pd.Series | tuple[np.ndarray, np.ndarray]:
+    """Extracts and cleans URLs from the primary and secondary URL columns in the dataframe.
+
+    Both columns are cleaned as whole columns by clean_url_column, and the secondary URL
+    is dropped where it is the same as the primary one.
+
+    Args:
+        df: The dataframe containing the URL columns.
+        config: DataConfig specifying which columns contain URLs.
+        compact: If True, return the two cleaned columns as arrays instead of building a list per row.
+
+    Returns:
+        pd.Series: A series where each entry is a list of URLs for the corresponding row.
+            With compact=True, a tuple of primary and secondary URL arrays aligned with df.index,
+            holding None where a row has no URL.
+    """
+    primary = clean_url_column(df[config.pdf_url_column])
+    secondary = clean_url_column(df[config.secondary_pdf_url_column])
+    secondary = secondary.mask((secondary == primary).fillna(False).astype(bool))
+
+    primary_urls = primary.to_numpy(dtype=object, na_value=None)
+    secondary_urls = secondary.to_numpy(dtype=object, na_value=None)
+    if compact:
+        return primary_urls, secondary_urls
+
+    urls = [
+        [url for url in pair if url is not None]
+        for pair in zip(primary_urls, secondary_urls)
+    ]
+    return pd.Series(urls, index=df.index, dtype=object)
+
+
+def run_downloads(rows: Iterable[tuple[Hashable, list[str]]], config: config.DownloadConfig, controller: scheduler.AimdController | None = None, run_metrics: metrics.RunMetrics | None = None, progress: metrics.ProgressReporter | None = None) -> Iterator[tuple[Hashable, tuple[bool, int, str]]]:
+    """Downloads rows on a thread pool and yields each result as soon as it is known.
+
+    Rows are pulled lazily from rows into the per-host scheduler, which holds at most
+    config.queue_size rows waiting for a worker. The queue is topped up as workers
+    free up, so the pool stays saturated without materialising the whole input. At most
+    config.workers rows are submitted to the pool at a time, and finished rows are
+    yielded rather than collected, so memory stays flat however many rows there are.
+
+    With config.autotune set, an AimdController decides how many of the config.workers
+    threads may be busy at a time, based on the latency and status of finished rows.
+
+    Rows failing with a transient code (408, 429, 5xx, 917) are put back into the scheduler
+    up to config.max_retries times, after an exponential backoff with jitter or the
+    server's Retry-After if that is longer. Retries are limited by a RetryBudget shared
+    by the run, and only the final result of a row is yielded.
+
+    With config.circuit_breaker set, the workers share a CircuitBreaker stored in
+    config.breaker_file, so URLs on a host that stopped responding fail fast with
+    circuit_breaker.OPEN_CODE. Those rows are not retried in the run, main_retry_failed
+    picks them up later.
+
+    Finished PDFs are handed to the Storage from open_storage, whose writer threads fsync or
+    upload them while the workers move on. Rows it failed to store are yielded again at
+    the end of the run with a 500, after their first result.
+
+    Args:
+        rows: Pairs of row id and the list of candidate URLs for that row.
+        config: DownloadConfig containing download settings.
+        controller: AimdController to use instead of the one created for config.autotune.
+        run_metrics: Optional RunMetrics that gets the timing of every attempt and the final status of every row.
+        progress: Optional ProgressReporter that gets the bytes received and the final status of every row.
+
+    Yields:
+        tuple: The row id and its (success, status_code, url) tuple, in completion order.
+    """
+    rows = iter(rows)
+    rows_exhausted = False
+    host_scheduler = scheduler.HostScheduler(config.max_per_host, config.min_host_interval)
+    url_flights = dedup.SingleFlight() if config.dedup else None
+    probe_cache = probe.ProbeCache(config.probe_cache_file, config.probe_max_age) if config.probe else None
+    breaker = circuit_breaker.CircuitBreaker(config.breaker_threshold, config.breaker_cooldown, config.breaker_file) if config.circuit_breaker else None
+    if controller is None and config.autotune:
+        controller = scheduler.AimdController(config.min_workers, config.workers)
+    retry_budget = retry.RetryBudget(config.retry_budget_ratio)
+    retries: Counter = Counter()
+    retries_denied = 0
+
+    # The caches are closed after the pool has shut down, nullcontext stands in for the ones that are off
+    with probe_cache or contextlib.nullcontext(), breaker or contextlib.nullcontext(), open_storage(config) as store, ThreadPoolExecutor(max_workers=config.workers) as executor:
+        futures = {}
+        while True:
+            # Refill the bounded queue from the input, rows waiting for a retry don't take up room
+            while not rows_exhausted and len(host_scheduler) - host_scheduler.delayed < config.queue_size:
+                row = next(rows, None)
+                if row is None:
+                    rows_exhausted = True
+                else:
+                    host_scheduler.add(*row)
+
+            if not host_scheduler and not futures:
+                break
+
+            # Fill free workers with rows whose host is allowed to start right now
+            max_in_flight = controller.limit if controller is not None else config.workers
+            while len(futures) < max_in_flight and (job := host_scheduler.next()) is not None:
+                index, row_urls, host = job
+                if index not in retries:
+                    retry_budget.record_request()
+                futures[executor.submit(download_row, index, row_urls, config, url_flights, probe_cache, breaker, store)] = (index, row_urls, host, time.perf_counter())
+
+            # Wake up on the first finished download, or when a throttled host or a retry may start.
+            # wait() returns right away without futures, so an idle pool sleeps instead of spinning.
+            if not futures:
+                time.sleep(host_scheduler.wait_time() or 0.0)
+                continue
+            done, _ = wait(futures, timeout=host_scheduler.wait_time(), return_when=FIRST_COMPLETED)
+            for future in done:
+                index, row_urls, host, started = futures.pop(future)
+                host_scheduler.release(host)
+                result = future.result()
+                ok, code, _ = result.status
+                if controller is not None:
+                    controller.record(time.perf_counter() - started, code)
+                if run_metrics is not None:
+                    run_metrics.record_attempts(result.attempts)
+                if progress is not None:
+                    progress.record_attempts(result.attempts)
+
+                if not ok and code in retry.TRANSIENT_CODES and retries[index] < config.max_retries:
+                    delay = retry.backoff_delay(retries[index], config.retry_base_delay, config.retry_max_delay)
+                    if result.retry_after is not None:
+                        delay = max(delay, result.retry_after)
+                    # A server asking for a longer pause than we are willing to wait is retried in a later run
+                    if delay <= config.retry_max_delay:
+                        if retry_budget.try_spend():
+                            retries[index] += 1
+                            host_scheduler.add(index, row_urls, delay)
+                            continue
+                        retries_denied += 1
+
+                retries.pop(index, None)
+                if run_metrics is not None:
+                    run_metrics.record_row(result.status, result.attempts)
+                if progress is not None:
+                    progress.record_row(result.status)
+                yield index, result.status
+
+        if breaker is not None and breaker.open_hosts:
+            print(f"Circuit open for {len(breaker.open_hosts)} hosts: {breaker.open_hosts[:10]}")
+
+        # The pool is idle once every row was yielded, wait for the writers before the storage closes
+        for index, url, error in store.flush():
+            print(f"Failed to store {index}: {error}")
+            yield index, (False, 500, url)
+
+    if host_scheduler.throttled:
+        print(f"Throttled hosts: {dict(host_scheduler.throttled.most_common(10))}")
+    if retries_denied:
+        print(f"Retry budget exhausted, {retries_denied} transient failures were not retried")
+    if controller is not None:
+        print(f"Concurrency over time (seconds, workers): {controller.history}")
+
+
+def report_metrics(run_metrics: metrics.RunMetrics, config: config.DataConfig) -> dict:
+    """Prints the headline numbers of a run and writes its summary to config.metrics_dir.
+
+    Args:
+        run_metrics: The RunMetrics passed to run_downloads.
+        config: DataConfig specifying metrics_dir, nothing is written if it is None.
+
+    Returns:
+        dict: The summary, see RunMetrics.summary().
+    """
+    summary = run_metrics.summary()
+    latency = summary["latency_seconds"]
+    if summary["attempts"]:
+        print(
+            f"Latency p50/p95/p99: {latency['p50']:.2f}/{latency['p95']:.2f}/{latency['p99']:.2f} seconds, "
+            f"{summary['throughput_mb_per_second']:.2f} MB/s"
+        )
+        slowest = next(iter(summary["hosts"].items()))
+        print(f"Most time spent on {slowest[0] or '(no host)'}: {slowest[1]['stage_seconds']}")
+    if config.metrics_dir is not None:
+        json_path, prom_path = metrics.write_metrics(summary, config.metrics_dir)
+        print(f"Metrics written to {json_path} and {prom_path}")
+    return summary
+
+
+def main_concurrent(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, dict]:
+    """Main function to download PDF files concurrently using ThreadPoolExecutor.
+
+    Args:
+        data_config: DataConfig containing data file and column info.
+        download_config: DownloadConfig containing download settings.
+
+    Returns:
+        tuple: A tuple containing the elapsed time and a dictionary with download statuses for benchmarking purposes.
+    """
+
+    start_time = time.perf_counter()
+    download_config.downloads_dir.mkdir(parents=True, exist_ok=True)
+    df = load_data(data_config)
+    batch = filter_data(df, data_config, batch_size=download_config.batch_size)
+    urls = extract_urls(batch, data_config)
+    if download_config.dns_prefetch:
+        prefetch_dns(urls, download_config)
+
+    # Bounded by download_config.batch_size, use main_pipeline for the whole sheet
+    download_status = {}
+    run_metrics = metrics.RunMetrics()
+    progress = metrics.ProgressReporter(len(urls), config.PROGRESS_INTERVAL)
+    with open_status_log(data_config) as log:
+        for index, state in run_downloads(urls.items(), download_config, run_metrics=run_metrics, progress=progress):
+            download_status[index] = state
+            log.record(index, state)
+    report_metrics(run_metrics, data_config)
+
+    end_time = time.perf_counter()
+    print(
+        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
+    )
+    return end_time - start_time, download_status
+
+
+def main_pipeline(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, Counter]:
+    """Main function to download every unprocessed row in the sheet in a single run.
+
+    The Excel file is read and the thread pool is created once, and rows are streamed
+    through run_downloads instead of being cut into batches, so there are no idle gaps
+    between batches. Each result is checkpointed to the status log as it finishes, so
+    an interrupted run resumes where it stopped, and only counts are kept in memory.
+    Progress is printed every config.PROGRESS_INTERVAL seconds. download_config.batch_size
+    is ignored.
+
+    Args:
+        data_config: DataConfig containing data file and column info.
+        download_config: DownloadConfig containing download settings.
+
+    Returns:
+        tuple: A tuple containing the elapsed time and a Counter of status codes.
+    """
+    start_time = time.perf_counter()
+    download_config.downloads_dir.mkdir(parents=True, exist_ok=True)
+    df = load_data(data_config)
+    rows = filter_data(df, data_config, batch_size=None)
+    urls = extract_urls(rows, data_config)
+    if download_config.dns_prefetch:
+        prefetch_dns(urls, download_config)
+    print(f"Downloading {len(urls)} unprocessed rows")
+
+    run_metrics = metrics.RunMetrics()
+    progress = metrics.ProgressReporter(len(urls), config.PROGRESS_INTERVAL)
+    with open_status_log(data_config) as log:
+        for index, state in run_downloads(urls.items(), download_config, run_metrics=run_metrics, progress=progress):
+            log.record(index, state)
+    report_metrics(run_metrics, data_config)
+
+    end_time = time.perf_counter()
+    print(
+        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
+    )
+    return end_time - start_time, progress.status_codes
+
+
+def download_shard(rows: list[tuple[Hashable, list[str]]], config: config.DownloadConfig, results: "multiprocessing.Queue") -> None:
+    """Downloads one shard of rows in a worker process of main_sharded.
+
+    Every result is put on results as ("result", row_id, status, received) as soon as it is
+    known, with the body bytes received since the previous result, followed by
+    ("done", totals, hosts, status_codes, success_url_index) with the aggregates of the
+    shard's RunMetrics once all rows are finished. Nothing is written to the status log here.
+
+    Args:
+        rows: Pairs of row id and the list of candidate URLs, as returned by scheduler.shard_by_host.
+        config: DownloadConfig containing download settings.
+        results: Queue read by the parent process.
+    """
+    run_metrics = metrics.RunMetrics()
+    # Only counts the bytes, the parent prints the progress of all shards
+    # DnsCache is per process, so each worker resolves the hosts of its own shard
+    if config.dns_prefetch:
+        prefetch_dns((row_urls for _, row_urls in rows), config)
+    progress = metrics.ProgressReporter(interval=math.inf)
+    sent = 0
+    for index, state in run_downloads(rows, config, run_metrics=run_metrics, progress=progress):
+        results.put(("result", index, state, progress.bytes - sent))
+        sent = progress.bytes
+    results.put(("done", run_metrics.totals, run_metrics.hosts, run_metrics.status_codes, run_metrics.success_url_index))
+
+
+def main_sharded(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, Counter]:
+    """Main function to download every unprocessed row split over several worker processes.
+
+    A single process is limited to one core for TLS, header parsing and writing files.
+    Here the unprocessed rows are split into download_config.processes shards by host,
+    and each shard runs run_downloads with download_config.workers threads in its own
+    process. Keeping the primary host of a row in one shard means the per-host limits and
+    the per-URL deduplication still hold for primary URLs, see shard_by_host. Fallback
+    URLs on other hosts may be requested from several shards at once. The workers send their results back to this process, the
+    only writer to the status log, so there are no write conflicts. download_config.batch_size
+    is ignored.
+
+    Args:
+        data_config: DataConfig containing data file and column info.
+        download_config: DownloadConfig containing download settings and the number of processes.
+
+    Returns:
+        tuple: A tuple containing the elapsed time and a Counter of status codes.
+    """
+    start_time = time.perf_counter()
+    download_config.downloads_dir.mkdir(parents=True, exist_ok=True)
+    df = load_data(data_config)
+    rows = filter_data(df, data_config, batch_size=None)
+    urls = extract_urls(rows, data_config)
+    shards = [shard for shard in scheduler.shard_by_host(urls.items(), max(download_config.processes, 1)) if shard]
+    print(f"Downloading {len(urls)} unprocessed rows in {len(shards)} processes")
+
+    # spawn, because forking a process that may already run threads can deadlock the child
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=download_shard, args=(shard, download_config, results)) for shard in shards]
+    for process in processes:
+        process.start()
+
+    run_metrics = metrics.RunMetrics()
+    progress = metrics.ProgressReporter(len(urls), config.PROGRESS_INTERVAL)
+    running = len(processes)
+    try:
+        with open_status_log(data_config) as log:
+            while running:
+                try:
+                    message = results.get(timeout=1)
+                except queue.Empty:
+                    # Every result is flushed before a worker exits, so an empty queue with no live workers means one crashed
+                    if not any(process.is_alive() for process in processes):
+                        print(f"{running} worker processes exited early, their remaining rows are downloaded on the next run")
+                        break
+                    continue
+
+                if message[0] == "done":
+                    run_metrics.merge(*message[1:])
+                    running -= 1
+                    continue
+
+                _, index, state, received = message
+                log.record(index, state)
+                progress.record_row(state, received)
+    finally:
+        for process in processes:
+            if process.is_alive() and running:
+                process.terminate()
+            process.join()
+    report_metrics(run_metrics, data_config)
+
+    end_time = time.perf_counter()
+    print(
+        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
+    )
+    return end_time - start_time, progress.status_codes
+
+
+def main_retry_failed(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, Counter]:
+    """Main function to download again the rows whose last attempt failed with a transient code.
+
+    Only rows whose most recent result in the status log is 408, 429, 5xx or 917, or that
+    were skipped because the circuit of their host was open (circuit_breaker.OPEN_CODE), are
+    queued, so permanent failures such as 404 or 415 are not requested again. The new results
+    are appended to the status log. download_config.batch_size is ignored.
+
+    Args:
+        data_config: DataConfig containing data file and column info.
+        download_config: DownloadConfig containing download settings.
+
+    Returns:
+        tuple: A tuple containing the elapsed time and a Counter of status codes.
+    """
+    start_time = time.perf_counter()
+    download_config.downloads_dir.mkdir(parents=True, exist_ok=True)
+    df = load_data(data_config)
+
+    run_metrics = metrics.RunMetrics()
+    with open_status_log(data_config) as log:
+        failed_ids = log.ids_with_codes(RETRYABLE_CODES)
+        urls = extract_urls(df[df.index.astype(str).isin(failed_ids)], data_config)
+        if download_config.dns_prefetch:
+            prefetch_dns(urls, download_config)
+        print(f"Retrying {len(urls)} rows with transient failures")
+
+        progress = metrics.ProgressReporter(len(urls), config.PROGRESS_INTERVAL)
+        for index, state in run_downloads(urls.items(), download_config, run_metrics=run_metrics, progress=progress):
+            log.record(index, state)
+    report_metrics(run_metrics, data_config)
+
+    end_time = time.perf_counter()
+    print(
+        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
+    )
+    return end_time - start_time, progress.status_codes
+
+
+def main_refresh(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, Counter]:
+    """Main function to revalidate the rows that were downloaded before.
+
+    Only rows whose most recent result in the status log is a success are queued, and
+    their URLs are requested with the ETag / Last-Modified stored with the PDF, so files
+    that haven't changed come back as 304 without a body and only changed files are
+    downloaded again. Conditional requests are turned on for the run whatever
+    download_config says. The new results are appended to the status log.
+    download_config.batch_size is ignored.
+
+    Args:
+        data_config: DataConfig containing data file and column info.
+        download_config: DownloadConfig containing download settings.
+
+    Returns:
+        tuple: A tuple containing the elapsed time and a Counter of status codes.
+    """
+    start_time = time.perf_counter()
+    download_config = replace(download_config, conditional_requests=True)
+    download_config.downloads_dir.mkdir(parents=True, exist_ok=True)
+    df = load_data(data_config)
+
+    run_metrics = metrics.RunMetrics()
+    with open_status_log(data_config) as log:
+        downloaded_ids = log.succeeded_ids()
+        urls = extract_urls(df[df.index.astype(str).isin(downloaded_ids)], data_config)
+        if download_config.dns_prefetch:
+            prefetch_dns(urls, download_config)
+        print(f"Refreshing {len(urls)} downloaded rows")
+
+        progress = metrics.ProgressReporter(len(urls), config.PROGRESS_INTERVAL)
+        for index, state in run_downloads(urls.items(), download_config, run_metrics=run_metrics, progress=progress):
+            log.record(index, state)
+    report_metrics(run_metrics, data_config)
+
+    end_time = time.perf_counter()
+    print(
+        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
+    )
+    return end_time - start_time, progress.status_codes
+
+
+def main_sequential(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, dict]:
+    """Main function to download PDF files single threaded.
+
+    Args:
+        data_config: DataConfig containing data file and column info.
+        download_config: DownloadConfig containing download settings.
+
+    Returns:
+        tuple: A tuple containing the elapsed time and a dictionary with download statuses for benchmarking purposes.
+    """
+    start_time = time.perf_counter()
+    download_config.downloads_dir.mkdir(parents=True, exist_ok=True)
+    df = load_data(data_config)
+    batch = filter_data(df, data_config, batch_size=download_config.batch_size)
+    urls = extract_urls(batch, data_config)
+    if download_config.dns_prefetch:
+        prefetch_dns(urls, download_config)
+
+    url_flights = dedup.SingleFlight() if download_config.dedup else None
+    probe_cache = probe.ProbeCache(download_config.probe_cache_file, download_config.probe_max_age) if download_config.probe else None
+
+    download_status = {}
+    progress = metrics.ProgressReporter(len(urls), config.PROGRESS_INTERVAL)
+    with open_status_log(data_config) as log, probe_cache or contextlib.nullcontext(), open_storage(download_config) as store:
+        for index, url in urls.items():
+            download_state = download_pdf_file(index, url, download_config, url_flights, probe_cache, store)
+            download_status[index] = download_state
+            log.record(index, download_state)
+            progress.record_row(download_state)
+        for index, url, error in store.flush():
+            print(f"Failed to store {index}: {error}")
+            download_status[index] = (False, 500, url)
+            log.record(index, download_status[index])
+
+    end_time = time.perf_counter()
+    print(
+        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
+    )
+    return end_time - start_time, download_status
+
+
+def main_async(data_config: config.DataConfig, download_config: config.DownloadConfig) -> tuple[float, dict]:
+    """Main function to download PDF files concurrently on an asyncio event loop.
+
+    Unlike main_concurrent, requests in flight are not bound to threads, so
+    download_config.async_concurrency can be in the thousands. Requires aiohttp, and
+    saves to the local storage backend only, without fsync.
+
+    Args:
+        data_config: DataConfig containing data file and column info.
+        download_config: DownloadConfig containing download settings.
+
+    Returns:
+        tuple: A tuple containing the elapsed time and a dictionary with download statuses for benchmarking purposes.
+    """
+    # Imported here rather than at the top, so the other engines and subcommands don't pay for it
+    if importlib.util.find_spec("aiohttp") is None:
+        raise ImportError("main_async requires aiohttp, install it with: pip install aiohttp")
+    if download_config.storage_backend != "local":
+        raise ValueError("main_async only saves to the local storage backend")
+
+    start_time = time.perf_counter()
+    download_config.downloads_dir.mkdir(parents=True, exist_ok=True)
+    df = load_data(data_config)
+    batch = filter_data(df, data_config, batch_size=download_config.batch_size)
+    urls = extract_urls(batch, data_config)
+
+    progress = metrics.ProgressReporter(len(urls), config.PROGRESS_INTERVAL)
+    with open_status_log(data_config) as log:
+        download_status = asyncio.run(download_all_async(urls, download_config, log, progress))
+
+    end_time = time.perf_counter()
+    print(
+        f"Attempted to Download {len(urls)} files in {end_time - start_time:.2f} seconds"
+    )
+    return end_time - start_time, download_status
+
+
+if __name__ == "__main__":
+    main_concurrent(data_config, download_config)
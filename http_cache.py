@@ -0,0 +1,84 @@
+import json
+import os
+from collections.abc import Mapping
+from pathlib import Path
+
+
+VALIDATOR_HEADERS = {
+    "etag": "ETag",
+    "last_modified": "Last-Modified",
+    "content_length": "Content-Length",
+}
+
+
+def validators_path(save_path: Path) -> Path:
+    """Returns the sidecar file holding the HTTP validators of a saved PDF."""
+    return save_path.with_name(f"{save_path.name}.meta.json")
+
+
+def extract_validators(url: str, headers: Mapping[str, str]) -> dict | None:
+    """Picks the cache validators out of response headers.
+
+    Args:
+        url: The URL the response came from.
+        headers: The response headers (case-insensitive mapping).
+
+    Returns:
+        dict | None: The validators, or None if the server sent neither ETag nor Last-Modified.
+    """
+    validators = {key: headers.get(header) for key, header in VALIDATOR_HEADERS.items()}
+    if validators["etag"] is None and validators["last_modified"] is None:
+        return None
+    return {"url": url, **validators}
+
+
+def write_validators(save_path: Path, validators: dict | None) -> None:
+    """Stores validators next to save_path, or removes stale ones if there are none.
+
+    The size of the saved file is stored too, since Content-Length is the encoded size
+    when the server compresses the response.
+
+    Args:
+        save_path: The saved PDF.
+        validators: As returned by extract_validators.
+    """
+    sidecar = validators_path(save_path)
+    if validators is None:
+        sidecar.unlink(missing_ok=True)
+        return
+    tmp_path = sidecar.with_name(sidecar.name + ".tmp")
+    tmp_path.write_text(json.dumps({**validators, "size": save_path.stat().st_size}))
+    os.replace(tmp_path, sidecar)
+
+
+def conditional_headers(save_path: Path, url: str) -> dict:
+    """Returns the headers for a conditional GET of url, if save_path is a usable earlier download of it.
+
+    The request is only made conditional when the sidecar was written for the same URL and
+    the file on disk still has the size it was saved with, so a damaged local copy is
+    downloaded again in full.
+
+    Args:
+        save_path: Where the PDF for the row is saved.
+        url: The URL about to be requested.
+
+    Returns:
+        dict: If-None-Match and/or If-Modified-Since headers, empty if the GET must be unconditional.
+    """
+    try:
+        validators = json.loads(validators_path(save_path).read_text())
+        size = save_path.stat().st_size
+    except (OSError, ValueError):
+        return {}
+
+    if validators.get("url") != url:
+        return {}
+    if validators.get("size") != size:
+        return {}
+
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
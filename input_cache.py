@@ -0,0 +1,162 @@
+import hashlib
+import importlib.util
+import json
+import os
+from pathlib import Path
+
+# pandas is imported on first use, so cached_row_ids can answer without it, see _pandas()
+pd = None
+
+# pyarrow is only needed to write Feather files, and is not imported until then
+CACHE_FORMAT = "feather" if importlib.util.find_spec("pyarrow") is not None else "pickle"
+
+
+def _pandas():
+    global pd
+    if pd is None:
+        import pandas
+        pd = pandas
+    return pd
+
+
+def file_digest(path: Path) -> str:
+    """Returns the SHA-256 hex digest of a file's content.
+
+    Args:
+        path: The file to hash.
+
+    Returns:
+        str: The hex digest.
+    """
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def _cache_files(data_file: Path, cache_dir: Path, sheet_name: int | str, index_col: str, usecols: list[str]) -> tuple[Path, Path, Path]:
+    # The cache depends on what was read, not only on the file
+    key = hashlib.sha256(repr((str(data_file.resolve()), sheet_name, index_col, list(usecols))).encode()).hexdigest()[:16]
+    stem = f"{data_file.stem}-{key}"
+    return cache_dir / f"{stem}.{CACHE_FORMAT}", cache_dir / f"{stem}.json", cache_dir / f"{stem}.ids.json"
+
+
+def read_excel_cached(data_file: Path | str, cache_dir: Path, sheet_name: int | str, index_col: str, usecols: list[str]) -> "pd.DataFrame":
+    """Reads the given columns of an Excel sheet, caching the parsed result on disk.
+
+    The cache is stored as Feather when pyarrow is installed and as a pickle otherwise.
+    It is reused while the source file's mtime and size are unchanged; if they changed,
+    the file is hashed and the cache is still reused when the content is the same.
+    The ids of the rows with a value in any of the other columns are cached as well,
+    for cached_row_ids.
+
+    Args:
+        data_file: Path to the Excel file.
+        cache_dir: Directory the cache files are written to.
+        sheet_name: The sheet to read.
+        index_col: The column to use as index.
+        usecols: The columns to read, including index_col.
+
+    Returns:
+        pd.DataFrame: The parsed sheet with index_col as index.
+    """
+    data_file = Path(data_file)
+    stat = data_file.stat()
+    cache_file, meta_file, ids_file = _cache_files(data_file, cache_dir, sheet_name, index_col, usecols)
+
+    meta = _read_meta(meta_file)
+    digest = None
+    if meta is not None and cache_file.exists():
+        if (meta["mtime_ns"], meta["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return _read_cache(cache_file, index_col, ids_file)
+
+        # Touched but possibly unchanged, e.g. after a copy or checkout
+        digest = file_digest(data_file)
+        if meta["sha256"] == digest:
+            _write_meta(meta_file, stat, digest)
+            return _read_cache(cache_file, index_col, ids_file)
+
+    df = _pandas().read_excel(data_file, sheet_name=sheet_name, usecols=usecols, index_col=index_col)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        _write_cache(df, cache_file)
+    except (TypeError, ValueError) as e:
+        # Feather can't store columns with mixed types, the sheet is still usable without a cache
+        print(f"Could not cache {data_file.name}: {e}")
+        return df
+    _write_row_ids(df, ids_file)
+    _write_meta(meta_file, stat, digest or file_digest(data_file))
+    return df
+
+
+def cached_row_ids(data_file: Path | str, cache_dir: Path, sheet_name: int | str, index_col: str, usecols: list[str]) -> list[str] | None:
+    """Returns the ids of the rows with a value in any column but index_col, without pandas.
+
+    Only answers from a cache written by read_excel_cached with the same arguments, and
+    only while the source file's mtime and size are unchanged, so it costs a stat and a
+    small JSON read.
+
+    Args:
+        data_file: Path to the Excel file.
+        cache_dir: Directory the cache files are written to.
+        sheet_name: The sheet to read.
+        index_col: The column to use as index.
+        usecols: The columns to read, including index_col.
+
+    Returns:
+        list[str] | None: The row ids as strings, or None if there is no current cache.
+    """
+    data_file = Path(data_file)
+    try:
+        stat = data_file.stat()
+    except OSError:
+        return None
+    _, meta_file, ids_file = _cache_files(data_file, cache_dir, sheet_name, index_col, usecols)
+    meta = _read_meta(meta_file)
+    if meta is None or (meta["mtime_ns"], meta["size"]) != (stat.st_mtime_ns, stat.st_size):
+        return None
+    try:
+        return json.loads(ids_file.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _read_meta(meta_file: Path) -> dict | None:
+    try:
+        return json.loads(meta_file.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_file: Path, stat: os.stat_result, digest: str) -> None:
+    meta = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}
+    tmp_file = meta_file.with_name(meta_file.name + ".tmp")
+    tmp_file.write_text(json.dumps(meta))
+    os.replace(tmp_file, meta_file)
+
+
+def _read_cache(cache_file: Path, index_col: str, ids_file: Path) -> "pd.DataFrame":
+    if cache_file.suffix == ".feather":
+        df = _pandas().read_feather(cache_file).set_index(index_col)
+    else:
+        df = _pandas().read_pickle(cache_file)
+    # Caches written before the row ids were stored
+    if not ids_file.exists():
+        _write_row_ids(df, ids_file)
+    return df
+
+
+def _write_row_ids(df: "pd.DataFrame", ids_file: Path) -> None:
+    ids = df.index[df.notna().any(axis=1)].astype(str).tolist()
+    tmp_file = ids_file.with_name(ids_file.name + ".tmp")
+    tmp_file.write_text(json.dumps(ids))
+    os.replace(tmp_file, ids_file)
+
+
+def _write_cache(df: "pd.DataFrame", cache_file: Path) -> None:
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+    if cache_file.suffix == ".feather":
+        # Feather only stores a default index
+        df.reset_index().to_feather(tmp_file)
+    else:
+        df.to_pickle(tmp_file)
+    os.replace(tmp_file, cache_file)
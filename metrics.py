@@ -0,0 +1,419 @@
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# Seconds spent opening connections (DNS, TCP and TLS) by each thread since the last take_connect_time()
+_connect_times = threading.local()
+
+# Upper bounds in seconds of the Histogram buckets, 20 per decade from 1 ms to 10000 seconds
+HISTOGRAM_BOUNDS = tuple(10 ** (k / 20 - 3) for k in range(141))
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self) -> None:
+        started = time.monotonic()
+        try:
+            super().connect()
+        finally:
+            _connect_times.seconds = getattr(_connect_times, "seconds", 0.0) + time.monotonic() - started
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self) -> None:
+        started = time.monotonic()
+        try:
+            super().connect()
+        finally:
+            _connect_times.seconds = getattr(_connect_times, "seconds", 0.0) + time.monotonic() - started
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+def instrument_adapter(adapter: HTTPAdapter) -> None:
+    """Makes the connections opened through adapter record how long connecting took.
+
+    Args:
+        adapter: A requests HTTPAdapter, before any request was sent through it.
+    """
+    adapter.poolmanager.pool_classes_by_scheme = {
+        "http": _TimedHTTPConnectionPool,
+        "https": _TimedHTTPSConnectionPool,
+    }
+
+
+def take_connect_time() -> float:
+    """Returns the seconds the calling thread spent connecting since the last call, and resets it.
+
+    Returns:
+        float: DNS, TCP and TLS time of new connections, 0.0 if only pooled connections were used.
+    """
+    seconds = getattr(_connect_times, "seconds", 0.0)
+    _connect_times.seconds = 0.0
+    return seconds
+
+
+@dataclass
+class AttemptTiming:
+    """Timing of one request for one URL of a row.
+
+    Attributes:
+        url: The requested URL.
+        url_index: Position of url among the row's URLs, 0 for the primary.
+        host: Host name of url.
+        ok: Whether the attempt produced the PDF.
+        code: Status code of the attempt, as in the status log.
+        connect: Seconds spent on DNS, TCP and TLS, 0.0 on a reused connection.
+        ttfb: Seconds from sending the request to receiving the response headers, including connect.
+            None if no response arrived.
+        transfer: Seconds from the response headers to the end of the attempt.
+        total: Seconds the attempt took.
+        bytes: Body bytes received.
+    """
+    url: str
+    url_index: int
+    host: str
+    ok: bool = False
+    code: int = 0
+    connect: float = 0.0
+    ttfb: float | None = None
+    transfer: float = 0.0
+    total: float = 0.0
+    bytes: int = 0
+
+
+class Histogram:
+    """Counts of durations in fixed buckets, see HISTOGRAM_BOUNDS, so percentiles need no list of samples.
+
+    The largest sample of each bucket is kept too. A percentile is the largest sample in
+    the bucket holding its nearest rank: exact when the samples around it are more than a
+    bucket apart, and otherwise at most one bucket, about 12%, above the exact value.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.maxima = [0.0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        bucket = bisect.bisect_left(HISTOGRAM_BOUNDS, value)
+        self.counts[bucket] += 1
+        self.maxima[bucket] = max(self.maxima[bucket], value)
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for bucket, count in enumerate(other.counts):
+            if count:
+                self.counts[bucket] += count
+                self.maxima[bucket] = max(self.maxima[bucket], other.maxima[bucket])
+        self.count += other.count
+
+    def percentile(self, q: float) -> float | None:
+        """Returns the nearest-rank percentile q, between 0 and 100, or None without samples."""
+        if not self.count:
+            return None
+        rank = max(math.ceil(q / 100 * self.count), 1)
+        seen = 0
+        for count, maximum in zip(self.counts, self.maxima):
+            seen += count
+            if seen >= rank:
+                return maximum
+        return None
+
+
+class AttemptStats:
+    """Running totals of a set of attempts, with the latency and time to first byte as Histograms.
+
+    Memory doesn't grow with the number of attempts, and the totals of several processes
+    can be merged.
+    """
+
+    def __init__(self):
+        self.attempts = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency = Histogram()
+        self.ttfb = Histogram()
+        self.stage_seconds = {"connect": 0.0, "ttfb": 0.0, "transfer": 0.0, "total": 0.0}
+
+    def add(self, attempt: AttemptTiming) -> None:
+        self.attempts += 1
+        self.errors += not attempt.ok
+        self.bytes += attempt.bytes
+        self.latency.add(attempt.total)
+        self.stage_seconds["connect"] += attempt.connect
+        self.stage_seconds["transfer"] += attempt.transfer
+        self.stage_seconds["total"] += attempt.total
+        if attempt.ttfb is not None:
+            self.ttfb.add(attempt.ttfb)
+            self.stage_seconds["ttfb"] += attempt.ttfb
+
+    def merge(self, other: "AttemptStats") -> None:
+        self.attempts += other.attempts
+        self.errors += other.errors
+        self.bytes += other.bytes
+        self.latency.merge(other.latency)
+        self.ttfb.merge(other.ttfb)
+        for stage, seconds in other.stage_seconds.items():
+            self.stage_seconds[stage] += seconds
+
+    def summary(self) -> dict:
+        """Returns the attempt and error counts, bytes, latency percentiles and seconds per stage."""
+        return {
+            "attempts": self.attempts,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "latency_seconds": {
+                "p50": self.latency.percentile(50),
+                "p95": self.latency.percentile(95),
+                "p99": self.latency.percentile(99),
+            },
+            "ttfb_seconds": {
+                "p50": self.ttfb.percentile(50),
+                "p95": self.ttfb.percentile(95),
+            },
+            # Time spent in each stage, summed over the attempts; connect is part of ttfb
+            "stage_seconds": dict(self.stage_seconds),
+        }
+
+
+class RunMetrics:
+    """Collects the attempt timings and final statuses of a run and summarizes them.
+
+    Attempts are added to AttemptStats for the run and for their host as they are
+    recorded, and not kept, so memory grows with the number of hosts but not of rows.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._started = clock()
+        self._lock = threading.Lock()
+        self.totals = AttemptStats()
+        self.hosts: dict[str, AttemptStats] = {}
+        self.status_codes: Counter[int] = Counter()
+        self.success_url_index: Counter[int] = Counter()
+
+    def record_attempts(self, attempts: list[AttemptTiming]) -> None:
+        """Adds the attempts made for a row, including ones that are retried later.
+
+        Args:
+            attempts: As returned in RowResult.attempts.
+        """
+        with self._lock:
+            for attempt in attempts:
+                self.totals.add(attempt)
+                host = self.hosts.get(attempt.host)
+                if host is None:
+                    host = self.hosts[attempt.host] = AttemptStats()
+                host.add(attempt)
+
+    def record_row(self, status: tuple[bool, int, str], attempts: list[AttemptTiming]) -> None:
+        """Adds the final result of a row.
+
+        Args:
+            status: The (success, status_code, url) tuple of the row.
+            attempts: The attempts of the row's last try, used to find which URL succeeded.
+        """
+        ok, code, _ = status
+        with self._lock:
+            self.status_codes[code] += 1
+            if ok:
+                winner = next((attempt for attempt in reversed(attempts) if attempt.ok), None)
+                if winner is not None:
+                    self.success_url_index[winner.url_index] += 1
+
+    def merge(self, totals: AttemptStats, hosts: dict[str, AttemptStats], status_codes: Counter[int], success_url_index: Counter[int]) -> None:
+        """Adds what a RunMetrics in another process collected, see its attributes.
+
+        Args:
+            totals: Its totals.
+            hosts: Its hosts.
+            status_codes: Its status_codes.
+            success_url_index: Its success_url_index.
+        """
+        with self._lock:
+            self.totals.merge(totals)
+            for host, stats in hosts.items():
+                self.hosts.setdefault(host, AttemptStats()).merge(stats)
+            self.status_codes.update(status_codes)
+            self.success_url_index.update(success_url_index)
+
+    def summary(self) -> dict:
+        """Summarizes the run so far.
+
+        Returns:
+            dict: Row and attempt counts, latency percentiles of all attempts, throughput in MB/s,
+                  which URL index succeeded, and a per-host breakdown of time spent in each stage.
+        """
+        with self._lock:
+            totals = self.totals.summary()
+            hosts = {host: stats.summary() for host, stats in self.hosts.items()}
+            status_codes = dict(self.status_codes)
+            success_url_index = dict(self.success_url_index)
+        elapsed = self._clock() - self._started
+
+        return {
+            "elapsed_seconds": elapsed,
+            "rows": sum(status_codes.values()),
+            "status_codes": status_codes,
+            "success_url_index": success_url_index,
+            "throughput_mb_per_second": totals["bytes"] / elapsed / 1e6 if elapsed > 0 else 0.0,
+            **totals,
+            # Hosts that took the most attempt time first
+            "hosts": dict(sorted(hosts.items(), key=lambda item: -item[1]["stage_seconds"]["total"])),
+        }
+
+
+class ProgressReporter:
+    """Prints a progress line with rows/s, MB/s, the ETA and the status codes so far.
+
+    A line is printed at most every interval seconds, when a row finishes. Only counters
+    are kept, so memory doesn't grow with the number of rows. Meant to be used from the
+    thread that consumes the results.
+    """
+
+    def __init__(self, total: int | None = None, interval: float = 10.0, clock: Callable[[], float] = time.monotonic, output: Callable[[str], None] = print):
+        self.total = total
+        self.interval = interval
+        self.rows = 0
+        self.bytes = 0
+        self.status_codes: Counter[int] = Counter()
+        self._clock = clock
+        self._output = output
+        self._started = clock()
+        self._last_report = self._started
+
+    def record_attempts(self, attempts: list[AttemptTiming]) -> None:
+        """Adds the bytes received by the attempts of a row, including ones that are retried later.
+
+        Args:
+            attempts: As returned in RowResult.attempts.
+        """
+        self.bytes += sum(attempt.bytes for attempt in attempts)
+
+    def record_row(self, status: tuple[bool, int, str], received: int = 0) -> None:
+        """Adds the final result of a row, and prints a progress line if one is due.
+
+        Args:
+            status: The (success, status_code, url) tuple of the row.
+            received: Body bytes received for the row that were not passed to record_attempts.
+        """
+        self.rows += 1
+        self.bytes += received
+        self.status_codes[status[1]] += 1
+        now = self._clock()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self._output(self.line())
+
+    def line(self) -> str:
+        """Returns the progress line for the rows recorded so far."""
+        elapsed = self._clock() - self._started
+        rate = self.rows / elapsed if elapsed > 0 else 0.0
+        parts = [
+            f"Progress: {self.rows}" + (f"/{self.total}" if self.total is not None else "") + " rows",
+            f"{rate:.1f} rows/s",
+            f"{self.bytes / elapsed / 1e6 if elapsed > 0 else 0.0:.2f} MB/s",
+        ]
+        if self.total is not None and rate > 0:
+            parts.append(f"ETA {format_duration(max(self.total - self.rows, 0) / rate)}")
+        codes = ", ".join(f"{code}: {count}" for code, count in sorted(self.status_codes.items()))
+        parts.append(f"codes {{{codes}}}")
+        return ", ".join(parts)
+
+
+def format_duration(seconds: float) -> str:
+    """Formats seconds as H:MM:SS."""
+    seconds = round(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def to_prometheus(summary: dict, prefix: str = "pdf_downloader") -> str:
+    """Renders a summary in the Prometheus text exposition format.
+
+    Args:
+        summary: As returned by RunMetrics.summary().
+        prefix: Prefix of every metric name.
+
+    Returns:
+        str: The metrics, ending with a newline.
+    """
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples: list[tuple[dict, float | None]]) -> None:
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ",".join(f'{key}="{_escape_label(str(val))}"' for key, val in labels.items())
+            lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+    latency = summary["latency_seconds"]
+    hosts = summary["hosts"]
+    metric("rows_total", "counter", "Rows finished, by final status code.",
+           [({"code": code}, count) for code, count in sorted(summary["status_codes"].items())])
+    metric("success_url_index_total", "counter", "Successful rows, by position of the URL that succeeded.",
+           [({"index": index}, count) for index, count in sorted(summary["success_url_index"].items())])
+    metric("attempt_latency_seconds", "summary", "Attempt latency percentiles.",
+           [({"quantile": q}, latency[key]) for q, key in [("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")]])
+    # A summary also has the sum and count of its samples
+    lines.append(f"{prefix}_attempt_latency_seconds_sum {summary['stage_seconds']['total']}")
+    lines.append(f"{prefix}_attempt_latency_seconds_count {summary['attempts']}")
+    metric("bytes_total", "counter", "Body bytes received.", [({}, summary["bytes"])])
+    metric("throughput_bytes_per_second", "gauge", "Body bytes received per second of the run.",
+           [({}, summary["throughput_mb_per_second"] * 1e6)])
+    metric("elapsed_seconds", "gauge", "Duration of the run.", [({}, summary["elapsed_seconds"])])
+    metric("host_attempts_total", "counter", "Attempts, by host.",
+           [({"host": host}, stats["attempts"]) for host, stats in hosts.items()])
+    metric("host_errors_total", "counter", "Failed attempts, by host.",
+           [({"host": host}, stats["errors"]) for host, stats in hosts.items()])
+    metric("host_stage_seconds_total", "counter", "Attempt time by host and stage, connect is part of ttfb.",
+           [({"host": host, "stage": stage}, seconds)
+            for host, stats in hosts.items() for stage, seconds in stats["stage_seconds"].items()])
+    return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_metrics(summary: dict, metrics_dir: Path) -> tuple[Path, Path]:
+    """Writes a summary as a timestamped JSON file and as downloads.prom.
+
+    downloads.prom is replaced on every run, so it can be picked up by the node_exporter
+    textfile collector.
+
+    Args:
+        summary: As returned by RunMetrics.summary().
+        metrics_dir: Directory to write to, created if missing.
+
+    Returns:
+        tuple: The paths of the JSON and the Prometheus file.
+    """
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    json_path = metrics_dir / f"run-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    prom_path = metrics_dir / "downloads.prom"
+    for path, text in [(json_path, json.dumps(summary, indent=2)), (prom_path, to_prometheus(summary))]:
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+    return json_path, prom_path
@@ -0,0 +1,103 @@
+import json
+import os
+import re
+from collections.abc import Mapping
+from pathlib import Path
+from typing import NamedTuple
+
+
+class ResumeState(NamedTuple):
+    """How to continue a partial download.
+
+    Attributes:
+        offset: Number of bytes already in the part file.
+        headers: Range and If-Range headers for the request.
+    """
+    offset: int
+    headers: dict
+
+
+def part_path(save_path: Path) -> Path:
+    """Returns the sidecar file that keeps the bytes of an unfinished download of save_path."""
+    return save_path.with_name(f"{save_path.name}.part")
+
+
+def meta_path(part: Path) -> Path:
+    """Returns the file holding the URL and validators a part file was downloaded with."""
+    return part.with_name(f"{part.name}.json")
+
+
+def if_range_validator(headers: Mapping[str, str]) -> str | None:
+    """Returns the validator to send in If-Range, so a changed file is sent in full instead of a mismatched range.
+
+    Args:
+        headers: The headers of the response the part file was started from.
+
+    Returns:
+        str | None: A strong ETag, else the Last-Modified date, or None if the download can't be resumed safely.
+    """
+    etag = headers.get("ETag")
+    # Weak ETags are not allowed in If-Range
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def start(part: Path, url: str, headers: Mapping[str, str]) -> bool:
+    """Records what a new part file is downloaded from, if the server lets it be resumed.
+
+    Args:
+        part: The part file about to be written.
+        url: The requested URL.
+        headers: The response headers.
+
+    Returns:
+        bool: True if the metadata was written, False if the response has no usable validator
+              or is content-encoded, and the download can only be restarted from zero.
+    """
+    # The bytes on disk are decoded, a Range would count the compressed ones
+    if headers.get("Content-Encoding", "identity").strip().lower() != "identity":
+        return False
+    validator = if_range_validator(headers)
+    if validator is None:
+        return False
+    meta = meta_path(part)
+    tmp_path = meta.with_name(meta.name + ".tmp")
+    tmp_path.write_text(json.dumps({"url": url, "if_range": validator}))
+    os.replace(tmp_path, meta)
+    return True
+
+
+def resume_state(part: Path, url: str) -> ResumeState | None:
+    """Returns how to continue part, if it holds the start of a PDF downloaded from url.
+
+    Args:
+        part: The part file of the row.
+        url: The URL about to be requested.
+
+    Returns:
+        ResumeState | None: The offset and the headers for a Range request, or None if the
+            download has to start from zero.
+    """
+    try:
+        meta = json.loads(meta_path(part).read_text())
+        offset = part.stat().st_size
+        with open(part, "rb") as file:
+            head = file.read(len(b"%PDF-"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("url") != url or not meta.get("if_range") or offset < len(b"%PDF-") or head != b"%PDF-":
+        return None
+    return ResumeState(offset, {"Range": f"bytes={offset}-", "If-Range": meta["if_range"]})
+
+
+def content_range_start(value: str | None) -> int | None:
+    """Returns the first byte position of a Content-Range header such as "bytes 100-999/1000"."""
+    match = re.fullmatch(r"\s*bytes\s+(\d+)-\d+/(?:\d+|\*)\s*", value or "")
+    return int(match.group(1)) if match else None
+
+
+def discard(part: Path) -> None:
+    """Removes a part file and its metadata."""
+    part.unlink(missing_ok=True)
+    meta_path(part).unlink(missing_ok=True)
@@ -0,0 +1,127 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+# Bytes asked for with the Range header, enough to see the %PDF- header or an HTML doctype
+PROBE_BYTES = 1024
+
+# Content types that are never a PDF, only used when the probe got no body bytes
+NON_PDF_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "application/json", "image/")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    url TEXT PRIMARY KEY,
+    is_pdf INTEGER NOT NULL,
+    content_type TEXT,
+    probed_at REAL NOT NULL
+);
+"""
+
+
+def needs_probe(url: str) -> bool:
+    """Returns whether url is worth probing before a full download.
+
+    URLs whose path ends in .pdf are nearly always PDFs, so probing them would only add a
+    round trip. Landing pages, such as most of the Report Html Address column, are probed.
+
+    Args:
+        url: The URL to download.
+
+    Returns:
+        bool: True if the URL path doesn't end in .pdf.
+    """
+    try:
+        return not urlsplit(url).path.lower().endswith(".pdf")
+    except ValueError:
+        return False
+
+
+def classify(content_type: str | None, head: bytes) -> bool | None:
+    """Decides from a probe response whether the full response is a PDF.
+
+    The first bytes decide when there are any, exactly as verify_pdf would on the full
+    download. The Content-Type is only trusted when no body bytes were received.
+
+    Args:
+        content_type: The Content-Type header of the probe response.
+        head: The first body bytes of the probe response, possibly empty.
+
+    Returns:
+        bool | None: True for a PDF, False for an obvious non-PDF, None if the probe can't tell.
+    """
+    if len(head) >= len(b"%PDF-"):
+        return head.startswith(b"%PDF-")
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type == "application/pdf":
+        return True
+    if content_type.startswith(NON_PDF_TYPES):
+        return False
+    return None
+
+
+class ProbeCache:
+    """Probe results per URL, stored in SQLite so later runs skip known non-PDF URLs without a request.
+
+    Only definite results are stored. Entries older than max_age seconds are ignored, so a
+    page that turns into a PDF is eventually downloaded. Safe to use from several threads
+    and processes.
+    """
+
+    def __init__(self, path: Path | str | None = None, max_age: float | None = None, clock=time.time):
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        if path is None:
+            self._connection = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        else:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def __enter__(self) -> "ProbeCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def get(self, url: str) -> bool | None:
+        """Returns the stored result for url.
+
+        Args:
+            url: The probed URL.
+
+        Returns:
+            bool | None: Whether url serves a PDF, or None if it wasn't probed or the result is too old.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT is_pdf, probed_at FROM probes WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        is_pdf, probed_at = row
+        if self.max_age is not None and self._clock() - probed_at > self.max_age:
+            return None
+        return bool(is_pdf)
+
+    def put(self, url: str, is_pdf: bool, content_type: str | None = None) -> None:
+        """Stores the result of probing url.
+
+        Args:
+            url: The probed URL.
+            is_pdf: Whether it serves a PDF.
+            content_type: The Content-Type it was served with, kept for inspection.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO probes (url, is_pdf, content_type, probed_at) VALUES (?, ?, ?, ?)",
+                (url, bool(is_pdf), content_type, self._clock()),
+            )
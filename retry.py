@@ -0,0 +1,78 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import validation
+
+
+# Failures that are worth another attempt later: timeouts, truncated bodies, rate limits and server or connection errors
+TRANSIENT_CODES = frozenset({408, validation.TRUNCATED_CODE, 429, 500, 502, 503, 504})
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: random.Random | None = None) -> float:
+    """Returns the delay before a retry, using exponential backoff with full jitter.
+
+    Args:
+        attempt: Number of retries already made for the row, starting at 0.
+        base: Delay ceiling for the first retry in seconds.
+        cap: Maximum delay ceiling in seconds.
+        rng: Random generator, for deterministic tests.
+
+    Returns:
+        float: A delay drawn uniformly between 0 and min(cap, base * 2 ** attempt).
+    """
+    rng = rng or random
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """Parses a Retry-After header into seconds from now.
+
+    Args:
+        value: The header value, either delay seconds or an HTTP date.
+        now: Current time as a Unix timestamp, defaults to time.time().
+
+    Returns:
+        float | None: Seconds to wait (never negative), or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (time.time() if now is None else now))
+
+
+class RetryBudget:
+    """Limits retries to a share of fresh requests, so retries can't crowd out new rows.
+
+    Every fresh request adds ratio tokens and every retry spends one. The budget starts
+    with minimum tokens so a run can retry before many fresh requests have been made.
+    """
+
+    def __init__(self, ratio: float, minimum: int = 10):
+        self.ratio = ratio
+        self._tokens = float(minimum)
+        self._lock = threading.Lock()
+
+    def record_request(self) -> None:
+        """Adds the tokens earned by one fresh request."""
+        with self._lock:
+            self._tokens += self.ratio
+
+    def try_spend(self) -> bool:
+        """Takes a token for one retry.
+
+        Returns:
+            bool: True if the retry may go ahead, False if the budget is used up.
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
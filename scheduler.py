@@ -0,0 +1,260 @@
+import heapq
+import itertools
+import time
+from collections import Counter, deque
+from collections.abc import Callable, Hashable, Iterable
+from urllib.parse import urlsplit
+
+
+def url_host(url: str) -> str:
+    """Returns the lowercase host name of a URL, or an empty string if it has none.
+
+    Args:
+        url: The URL to parse.
+
+    Returns:
+        str: The host name, used as the key for per-host limits.
+    """
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+class HostScheduler:
+    """Hands out rows in an order that is polite to each host.
+
+    Rows are grouped by the host of their first URL. A host never has more than
+    max_per_host rows in flight, and two rows for the same host are started at least
+    min_interval seconds apart. Hosts are served round robin so rows for other hosts
+    keep the workers busy while one host is throttled. Rows added with a delay, such as
+    retries, are held back until the delay has passed and then queued like any other row.
+
+    The limits only apply to the host of the first URL. Requests a row sends to other
+    hosts, such as its fallback URLs, hedges and probes, are not counted against any host.
+
+    Attributes:
+        throttled: Counter of how many rows of each host had to wait because of its limits.
+    """
+
+    def __init__(self, max_per_host: int, min_interval: float, clock: Callable[[], float] = time.monotonic):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self.throttled: Counter[str] = Counter()
+        self._clock = clock
+        self._queues: dict[str, deque] = {}
+        self._hosts: deque[str] = deque()
+        self._in_flight: Counter[str] = Counter()
+        self._last_start: dict[str, float] = {}
+        # Hosts whose next row was already counted in throttled
+        self._held: set[str] = set()
+        # (ready_at, tie breaker, row_id, urls) for rows that may not start yet
+        self._delayed: list[tuple[float, int, Hashable, list[str]]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values()) + len(self._delayed)
+
+    @property
+    def delayed(self) -> int:
+        """Number of rows added with a delay that are not queued for a worker yet."""
+        return len(self._delayed)
+
+    def add(self, row_id: Hashable, urls: list[str], delay: float = 0.0) -> None:
+        """Queues a row under the host of its first URL.
+
+        Args:
+            row_id: The identifier for the row.
+            urls: The candidate URLs for the row.
+            delay: Seconds before the row may start.
+        """
+        if delay > 0:
+            heapq.heappush(self._delayed, (self._clock() + delay, next(self._sequence), row_id, urls))
+            return
+        self._enqueue(row_id, urls)
+
+    def _enqueue(self, row_id: Hashable, urls: list[str]) -> None:
+        host = url_host(urls[0]) if urls else ""
+        if host not in self._queues:
+            self._queues[host] = deque()
+            self._hosts.append(host)
+        self._queues[host].append((row_id, urls))
+
+    def next(self) -> tuple[Hashable, list[str], str] | None:
+        """Returns the next row that may start now and marks its host as busy.
+
+        Returns:
+            tuple | None: (row_id, urls, host), or None if every host with queued rows is throttled.
+        """
+        now = self._clock()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, row_id, urls = heapq.heappop(self._delayed)
+            self._enqueue(row_id, urls)
+
+        for _ in range(len(self._hosts)):
+            host = self._hosts[0]
+            self._hosts.rotate(-1)
+
+            if not self._may_start(host, now):
+                if host not in self._held:
+                    self._held.add(host)
+                    self.throttled[host] += 1
+                continue
+
+            self._held.discard(host)
+            row_id, urls = self._queues[host].popleft()
+            if not self._queues[host]:
+                del self._queues[host]
+                self._hosts.remove(host)
+            self._in_flight[host] += 1
+            self._last_start[host] = now
+            return row_id, urls, host
+        return None
+
+    def release(self, host: str) -> None:
+        """Marks a row for host as finished, freeing one of its in-flight slots.
+
+        Args:
+            host: The host returned by next() for the finished row.
+        """
+        self._in_flight[host] -= 1
+        if self._in_flight[host] <= 0:
+            del self._in_flight[host]
+
+    def wait_time(self) -> float | None:
+        """Returns how long until a host that is only held back by min_interval, or a delayed row, may start.
+
+        Returns:
+            float | None: Seconds to wait, or None if nothing is waiting on a timer.
+        """
+        now = self._clock()
+        waits = [
+            self._last_start[host] + self.min_interval - now
+            for host in self._hosts
+            if host and self._in_flight[host] < self.max_per_host and host in self._last_start
+        ]
+        if self._delayed:
+            waits.append(self._delayed[0][0] - now)
+        return max(min(waits), 0.0) if waits else None
+
+    def _may_start(self, host: str, now: float) -> bool:
+        # Rows without a parsable host fail before touching the network, so they are never held back
+        if not host:
+            return True
+        if self._in_flight[host] >= self.max_per_host:
+            return False
+        last_start = self._last_start.get(host)
+        return last_start is None or now - last_start >= self.min_interval
+
+
+def shard_by_host(rows: Iterable[tuple[Hashable, list[str]]], shards: int) -> list[list[tuple[Hashable, list[str]]]]:
+    """Splits rows into shards so that all rows for a host end up in the same shard.
+
+    Keeping a host in one shard lets each shard apply the per-host limits and download
+    each URL once on its own. Rows are split by the host of their first URL only, so
+    fallback URLs on another host can be requested from several shards. Hosts are assigned largest first to the shard with the
+    fewest rows so far, which keeps the shards close in size unless one host dominates.
+
+    Args:
+        rows: Pairs of row id and the list of candidate URLs for that row.
+        shards: Number of shards, at least 1.
+
+    Returns:
+        list: shards lists of (row_id, urls), rows keeping their input order within a shard.
+    """
+    by_host: dict[str, list[tuple[int, Hashable, list[str]]]] = {}
+    for position, (row_id, urls) in enumerate(rows):
+        host = url_host(urls[0]) if urls else ""
+        by_host.setdefault(host, []).append((position, row_id, urls))
+
+    # (rows so far, shard number) so ties go to the lowest shard number
+    loads = [(0, shard) for shard in range(shards)]
+    assigned: list[list[tuple[int, Hashable, list[str]]]] = [[] for _ in range(shards)]
+    for host_rows in sorted(by_host.values(), key=len, reverse=True):
+        load, shard = heapq.heappop(loads)
+        assigned[shard].extend(host_rows)
+        heapq.heappush(loads, (load + len(host_rows), shard))
+
+    return [[(row_id, urls) for _, row_id, urls in sorted(shard_rows, key=lambda row: row[0])] for shard_rows in assigned]
+
+
+# Status codes that suggest we are sending more requests than the hosts or network can take
+CONGESTION_CODES = frozenset({408, 429, 502, 503, 504})
+
+
+class AimdController:
+    """Adapts how many downloads may be in flight with additive increase, multiplicative decrease.
+
+    Results are evaluated in windows of as many downloads as the current limit. After a
+    window, the limit is cut by the decrease factor if too many downloads hit congestion
+    codes or the mean latency rose above latency_factor times the best window seen.
+    Otherwise it grows by increase, as long as throughput did not drop compared to the
+    previous window.
+
+    Attributes:
+        limit: The number of downloads currently allowed in flight.
+        history: (seconds since start, limit) for the initial limit and every change.
+    """
+
+    def __init__(
+        self,
+        minimum: int,
+        maximum: int,
+        initial: int | None = None,
+        increase: int = 2,
+        decrease: float = 0.5,
+        max_error_rate: float = 0.2,
+        latency_factor: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.max_error_rate = max_error_rate
+        self.latency_factor = latency_factor
+        self.limit = initial if initial is not None else max(minimum, maximum // 4)
+        self._clock = clock
+        self._start = self._window_start = clock()
+        self.history: list[tuple[float, int]] = [(0.0, self.limit)]
+        self._latencies: list[float] = []
+        self._congested = 0
+        self._best_latency: float | None = None
+        self._last_throughput: float | None = None
+
+    def record(self, latency: float, code: int) -> None:
+        """Adds the outcome of one download and adjusts the limit at the end of a window.
+
+        Args:
+            latency: Seconds the download took.
+            code: The status code it finished with.
+        """
+        self._latencies.append(latency)
+        if code in CONGESTION_CODES:
+            self._congested += 1
+        if len(self._latencies) >= self.limit:
+            self._adjust()
+
+    def _adjust(self) -> None:
+        now = self._clock()
+        count = len(self._latencies)
+        throughput = count / max(now - self._window_start, 1e-9)
+        mean_latency = sum(self._latencies) / count
+        error_rate = self._congested / count
+        if self._best_latency is None or mean_latency < self._best_latency:
+            self._best_latency = mean_latency
+
+        if error_rate > self.max_error_rate or mean_latency > self.latency_factor * self._best_latency:
+            new_limit = max(self.minimum, int(self.limit * self.decrease))
+        elif self._last_throughput is None or throughput >= 0.95 * self._last_throughput:
+            new_limit = min(self.maximum, self.limit + self.increase)
+        else:
+            new_limit = self.limit
+
+        self._last_throughput = throughput
+        self._window_start = now
+        self._latencies = []
+        self._congested = 0
+        if new_limit != self.limit:
+            self.limit = new_limit
+            self.history.append((round(now - self._start, 3), new_limit))
@@ -0,0 +1,138 @@
+import sqlite3
+import threading
+import time
+from collections.abc import Hashable, Iterable
+from pathlib import Path
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    row_id TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    code INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_row_id ON attempts (row_id, seq);
+"""
+
+
+class StatusLog:
+    """Append-only log of download results, stored in SQLite.
+
+    Every result is committed as its own row as soon as it is recorded, so a killed run
+    only loses the downloads that were still in flight. Re-attempts of a row are appended
+    as well and the most recent attempt wins. The connection is shared between threads
+    and guarded by a lock.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # timeout makes concurrent writers from other processes wait for the write lock instead of failing
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        # WAL keeps committed rows safe if the process dies, NORMAL skips the fsync on every commit
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def __enter__(self) -> "StatusLog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def record(self, row_id: Hashable, status: tuple[bool, int, str]) -> None:
+        """Appends the result of one download.
+
+        Args:
+            row_id: The identifier for the row.
+            status: The (success, status_code, url) tuple returned by download_pdf_file.
+        """
+        self.record_many([(row_id, status)])
+
+    def record_many(self, results: Iterable[tuple[Hashable, tuple[bool, int, str]]]) -> None:
+        """Appends several results in one transaction.
+
+        Args:
+            results: Pairs of row id and (success, status_code, url).
+        """
+        now = time.time()
+        rows = [(str(row_id), bool(ok), int(code), str(url), now) for row_id, (ok, code, url) in results]
+        with self._lock:
+            with self._connection:
+                self._connection.execute("BEGIN")
+                self._connection.executemany(
+                    "INSERT INTO attempts (row_id, ok, code, url, recorded_at) VALUES (?, ?, ?, ?, ?)", rows
+                )
+
+    def processed_ids(self) -> set[str]:
+        """Returns the ids of all rows with at least one recorded attempt.
+
+        Returns:
+            set: Row ids as strings, read from the row_id index.
+        """
+        with self._lock:
+            return {row_id for (row_id,) in self._connection.execute("SELECT DISTINCT row_id FROM attempts")}
+
+    def latest(self) -> dict[str, tuple[bool, int, str]]:
+        """Returns the most recent result for every row.
+
+        Returns:
+            dict: Row id mapped to (success, status_code, url).
+        """
+        # SQLite returns the bare columns from the row holding MAX(seq) within each group
+        query = "SELECT row_id, ok, code, url, MAX(seq) FROM attempts GROUP BY row_id"
+        with self._lock:
+            return {
+                row_id: (bool(ok), code, url)
+                for row_id, ok, code, url, _ in self._connection.execute(query)
+            }
+
+    def ids_with_codes(self, codes: Iterable[int]) -> set[str]:
+        """Returns the ids of rows whose most recent attempt failed with one of the given codes.
+
+        Args:
+            codes: Status codes to look for, e.g. retry.TRANSIENT_CODES.
+
+        Returns:
+            set: Row ids as strings.
+        """
+        codes = [int(code) for code in codes]
+        placeholders = ", ".join("?" * len(codes))
+        query = (
+            "SELECT row_id FROM (SELECT row_id, ok, code, MAX(seq) FROM attempts GROUP BY row_id)"
+            f" WHERE NOT ok AND code IN ({placeholders})"
+        )
+        with self._lock:
+            return {row_id for (row_id,) in self._connection.execute(query, codes)}
+
+    def succeeded_ids(self) -> set[str]:
+        """Returns the ids of rows whose most recent attempt succeeded.
+
+        Returns:
+            set: Row ids as strings.
+        """
+        query = "SELECT row_id FROM (SELECT row_id, ok, MAX(seq) FROM attempts GROUP BY row_id) WHERE ok"
+        with self._lock:
+            return {row_id for (row_id,) in self._connection.execute(query)}
+
+    def code_counts(self) -> dict[int, int]:
+        """Returns how many rows have each status code as their most recent attempt.
+
+        Returns:
+            dict: Status code mapped to the number of rows, counted in SQLite.
+        """
+        query = "SELECT code, COUNT(*) FROM (SELECT code, MAX(seq) FROM attempts GROUP BY row_id) GROUP BY code"
+        with self._lock:
+            return dict(self._connection.execute(query).fetchall())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(DISTINCT row_id) FROM attempts").fetchone()[0]
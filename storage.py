@@ -0,0 +1,271 @@
+import abc
+import hashlib
+import os
+import tempfile
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+
+
+def shard_dir(row_id: Hashable | str) -> str:
+    """Returns the hash-prefix subdirectory of a row: the first two hex digits of the SHA-256 of its id.
+
+    The ids are spread evenly over 256 directories whatever they look like, so no single
+    directory grows large enough to slow down lookups, creates and listings.
+    """
+    return hashlib.sha256(str(row_id).encode()).hexdigest()[:2]
+
+
+def row_path(root: Path, row_id: Hashable | str, sharded: bool = False) -> Path:
+    """Returns where the PDF of a row is saved under root.
+
+    Args:
+        root: The downloads directory.
+        row_id: The identifier for the row.
+        sharded: Whether the PDF goes into the hash-prefix subdirectory of the row, see shard_dir.
+
+    Returns:
+        Path: root/{row_id}.pdf, or root/{shard}/{row_id}.pdf.
+    """
+    if sharded:
+        return root / shard_dir(row_id) / f"{row_id}.pdf"
+    return root / f"{row_id}.pdf"
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Writes data to path through a temp file in the same directory, so path never holds a partial file.
+
+    Args:
+        path: The file to write, replaced if it exists.
+        data: The new content.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def fsync_path(path: Path) -> None:
+    """Flushes a file or directory to disk. Directories are skipped where they can't be opened, e.g. on Windows."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (IsADirectoryError, PermissionError):
+        if path.is_dir():
+            return
+        raise
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Storage(abc.ABC):
+    """Where the downloaded PDFs end up.
+
+    A network worker writes the PDF of a row to path(row_id) on the local disk and hands
+    the finished file over with commit(). Anything slow that is left to do, such as an
+    fsync or an upload, runs on up to writers threads, so the worker can start on the next
+    row right away. The body itself is still written by the worker as it streams in, only
+    the work after the file is complete moves to the writers. Failures are collected and
+    returned by flush(). Safe to use from several threads.
+
+    Subclasses implement path() and commit().
+
+    Attributes:
+        keeps_files: Whether committed PDFs stay on the local disk. Without it neither the
+            local content store of deduplicated downloads nor the validators of conditional
+            requests are written, since nothing would use or remove them.
+    """
+
+    keeps_files = True
+
+    def __init__(self, writers: int = 0):
+        self.writers = writers
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._futures: set[Future] = set()
+        self._failures: list[tuple[Hashable, str, Exception]] = []
+        self._dirs: set[Path] = set()
+
+    def __enter__(self) -> "Storage":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @abc.abstractmethod
+    def path(self, row_id: Hashable | str) -> Path:
+        """Returns the local file the PDF of a row is downloaded to, creating its directory if needed."""
+
+    @abc.abstractmethod
+    def commit(self, row_id: Hashable | str, path: Path, url: str = "") -> None:
+        """Hands over the finished PDF of a row.
+
+        Args:
+            row_id: The identifier for the row.
+            path: The file returned by path(row_id), complete and renamed into place.
+            url: The URL it was downloaded from, returned with a failure by flush().
+        """
+
+    def flush(self) -> list[tuple[Hashable, str, Exception]]:
+        """Waits until every committed PDF is stored.
+
+        Returns:
+            list: (row_id, url, error) for every PDF that could not be stored since the last flush.
+        """
+        with self._lock:
+            futures = set(self._futures)
+        wait(futures)
+        with self._lock:
+            failures, self._failures = self._failures, []
+        return failures
+
+    def close(self) -> list[tuple[Hashable, str, Exception]]:
+        """Flushes and stops the writer threads.
+
+        Returns:
+            list: As returned by flush().
+        """
+        failures = self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+        return failures
+
+    def _make_parent(self, path: Path) -> None:
+        parent = path.parent
+        if parent in self._dirs:
+            return
+        parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._dirs.add(parent)
+
+    def _fail(self, row_id: Hashable | str, url: str, error: Exception) -> None:
+        with self._lock:
+            self._failures.append((row_id, url, error))
+
+    def _run(self, rows: list[tuple[Hashable, str]], work: Callable[[], None]) -> None:
+        """Runs work on a writer thread, or right away without writers, failing rows if it raises."""
+        def run() -> None:
+            try:
+                work()
+            except Exception as e:
+                for row_id, url in rows:
+                    self._fail(row_id, url, e)
+
+        if self.writers <= 0:
+            run()
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.writers, thread_name_prefix="storage")
+            future = self._executor.submit(run)
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+
+
+class LocalStorage(Storage):
+    """Saves PDFs in a directory on the local disk, optionally in hash-prefix subdirectories.
+
+    Downloads are written to a temp file and renamed into place before commit(), so a PDF
+    is never seen half written. With fsync set, committed files and then their directories
+    are fsynced on the writer threads in batches of fsync_batch files, without an fsync per
+    file on the network workers. A row is logged as downloaded when its PDF is committed,
+    before its batch is synced, so a crash can lose up to fsync_batch PDFs already logged;
+    every PDF committed before flush() returns is on disk.
+    """
+
+    def __init__(self, root: Path, sharded: bool = False, writers: int = 0, fsync: bool = False, fsync_batch: int = 64):
+        super().__init__(writers)
+        self.root = Path(root)
+        self.sharded = sharded
+        self.fsync = fsync
+        self.fsync_batch = fsync_batch
+        self._batch: list[tuple[Hashable, str, Path]] = []
+
+    def path(self, row_id: Hashable | str) -> Path:
+        path = row_path(self.root, row_id, self.sharded)
+        self._make_parent(path)
+        return path
+
+    def commit(self, row_id: Hashable | str, path: Path, url: str = "") -> None:
+        # Without fsync the PDF is already where it belongs
+        if not self.fsync:
+            return
+        with self._lock:
+            self._batch.append((row_id, url, path))
+            if len(self._batch) < self.fsync_batch:
+                return
+            batch, self._batch = self._batch, []
+        self._sync(batch)
+
+    def flush(self) -> list[tuple[Hashable, str, Exception]]:
+        with self._lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            self._sync(batch)
+        return super().flush()
+
+    def _sync(self, batch: list[tuple[Hashable, str, Path]]) -> None:
+        def sync() -> None:
+            for row_id, url, path in batch:
+                try:
+                    fsync_path(path)
+                except OSError as e:
+                    self._fail(row_id, url, e)
+            # The renames are only durable once the directories are flushed, once per directory for the batch
+            for directory in {path.parent for _, _, path in batch}:
+                fsync_path(directory)
+
+        self._run([(row_id, url) for row_id, url, _ in batch], sync)
+
+
+class S3Storage(Storage):
+    """Uploads PDFs to a bucket of an S3-compatible object store.
+
+    Each PDF is downloaded to staging_dir on the local disk first, and uploaded by the
+    writer threads under prefix/{shard}/{row_id}.pdf, with the same hash-prefix shards as the
+    local layout. The local copy is removed once it was uploaded.
+
+    Args:
+        client: Any object with boto3's upload_file(Filename, Bucket, Key), e.g.
+            boto3.client("s3", endpoint_url=...).
+        bucket: The bucket name.
+        staging_dir: Local directory the downloads are written to before the upload.
+        prefix: Prepended to every key.
+        writers: Uploads in flight at once.
+    """
+
+    keeps_files = False
+
+    def __init__(self, client, bucket: str, staging_dir: Path, prefix: str = "", writers: int = 4):
+        super().__init__(writers)
+        self.client = client
+        self.bucket = bucket
+        self.staging_dir = Path(staging_dir)
+        self.prefix = prefix
+
+    def key(self, row_id: Hashable | str) -> str:
+        """Returns the object key of the PDF of a row."""
+        return f"{self.prefix}{shard_dir(row_id)}/{row_id}.pdf"
+
+    def path(self, row_id: Hashable | str) -> Path:
+        path = row_path(self.staging_dir, row_id, sharded=True)
+        self._make_parent(path)
+        return path
+
+    def commit(self, row_id: Hashable | str, path: Path, url: str = "") -> None:
+        def upload() -> None:
+            self.client.upload_file(str(path), self.bucket, self.key(row_id))
+            path.unlink(missing_ok=True)
+
+        self._run([(row_id, url)], upload)
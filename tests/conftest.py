@@ -0,0 +1,17 @@
+import pytest
+
+
+# ---------- Fake clock ----------
+class FakeClock:
+    """Stands in for time.monotonic or time.time, tests move it by setting now."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,102 @@
+from collections import Counter
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+from benchmark import ServerProfile, fake_pdf_server, sweep
+
+
+# ============================================================
+# ServerProfile
+# ============================================================
+def test_outcomes_are_deterministic_and_follow_the_rates():
+    profile = ServerProfile(latency="lognormal", latency_mean=0.05, latency_spread=0.5, forbidden_rate=0.1, missing_rate=0.2, timeout_rate=0.1, not_pdf_rate=0.2)
+    paths = [f"/{i}.pdf" for i in range(2000)]
+    outcomes = [profile.outcome(path) for path in paths]
+    assert outcomes == [profile.outcome(path) for path in paths]
+
+    counts = Counter(outcome for outcome, _, _ in outcomes)
+    for name, rate in [("forbidden", 0.1), ("missing", 0.2), ("timeout", 0.1), ("not_pdf", 0.2), ("pdf", 0.4)]:
+        assert counts[name] == pytest.approx(rate * len(paths), rel=0.15)
+    assert sum(delay for _, delay, _ in outcomes) / len(paths) == pytest.approx(0.05, rel=0.15)
+
+    # Another seed answers differently
+    assert outcomes != [ServerProfile(seed=1).outcome(path) for path in paths]
+
+
+def test_unknown_latency_distribution():
+    with pytest.raises(ValueError):
+        ServerProfile(latency="pareto").outcome("/1.pdf")
+
+
+# ============================================================
+# fake_pdf_server()
+# ============================================================
+def test_fake_server_answers_per_profile():
+    profile = ServerProfile(latency_mean=0, payload_min=1000, payload_max=2000, timeout_rate=0)
+    with fake_pdf_server(profile) as base_url:
+        for i in range(30):
+            path = f"/{i}.pdf"
+            response = requests.get(base_url + path, timeout=5)
+            outcome, _, size = profile.outcome(path)
+            if outcome == "pdf":
+                assert response.status_code == 200
+                assert len(response.content) == size
+                assert response.content.startswith(b"%PDF-") and response.content.endswith(b"%%EOF\n")
+            elif outcome == "not_pdf":
+                assert response.status_code == 200 and not response.content.startswith(b"%PDF-")
+            else:
+                assert response.status_code == {"forbidden": 403, "missing": 404}[outcome]
+
+
+# ============================================================
+# sweep()
+# ============================================================
+def test_sweep_shape_and_engines_agree(capsys):
+    profile = ServerProfile(latency_mean=0.01, payload_max=32 * 1024, timeout_rate=0, seed=3)
+    results = sweep(profile, ["sequential", "concurrent"], workers=[2, 4], batch_sizes=[5, 20])
+
+    assert list(results) == [str(i) for i in range(8)]
+    for run in results.values():
+        assert {"elapsed_time", "batch_size", "workers", "download_status"} <= set(run)
+        assert len(run["download_status"]) == run["batch_size"]
+        # The final status of a row is the one its last URL gets from the server
+        for ok, code, url in run["download_status"].values():
+            assert code == profile.expected_code(urlsplit(url).path)
+            assert ok == (code == 200)
+
+    statuses = [run["download_status"] for run in results.values() if run["batch_size"] == 20]
+    assert all(status == statuses[0] for status in statuses)
+    assert "concurrent: 20 rows with 4 workers" in capsys.readouterr().out
+
+
+def test_sweep_rejects_unknown_engines():
+    with pytest.raises(ValueError):
+        sweep(ServerProfile(), ["warp"], workers=[1], batch_sizes=[1])
+
+
+# ============================================================
+# extract_urls_benchmark()
+# ============================================================
+def test_extract_urls_methods_agree():
+    import download_files
+    from benchmark import EXTRACT_URLS_METHODS, url_frame
+
+    data_cfg = download_files.data_config
+    df = url_frame(500, data_cfg, seed=1)
+    expected = EXTRACT_URLS_METHODS["apply"](df, data_cfg)
+    assert EXTRACT_URLS_METHODS["vectorized"](df, data_cfg).tolist() == expected.tolist()
+    primary, secondary = EXTRACT_URLS_METHODS["vectorized_compact"](df, data_cfg)
+    assert [[url for url in pair if url is not None] for pair in zip(primary, secondary)] == expected.tolist()
+
+
+def test_extract_urls_benchmark_shape(capsys):
+    from benchmark import extract_urls_benchmark
+
+    results = extract_urls_benchmark([10, 20], repeats=2)
+    assert list(results) == [str(i) for i in range(12)]
+    assert [(run["method"], run["rows"]) for run in results.values()][:6] == [
+        ("apply", 10), ("apply", 10), ("vectorized", 10), ("vectorized", 10), ("vectorized_compact", 10), ("vectorized_compact", 10),
+    ]
+    assert all(run["elapsed_time"] >= 0 for run in results.values())
@@ -0,0 +1,75 @@
+import pytest
+
+from circuit_breaker import CircuitBreaker, host_failed
+
+
+# --- The circuit opens after threshold consecutive failures, a success in between resets the count ---
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=60, clock=clock)
+    for failed in (True, True, False, True, True):
+        breaker.record("a.com", failed)
+    assert breaker.state("a.com") == "closed" and breaker.allow("a.com")
+
+    breaker.record("a.com", True)
+    assert breaker.state("a.com") == "open"
+    assert not breaker.allow("a.com")
+    # Other hosts and rows without a host are not affected
+    assert breaker.allow("b.com") and breaker.allow("")
+    assert breaker.open_hosts == ["a.com"]
+
+
+# --- After the cooldown a single probe is let through, its result closes or reopens the circuit ---
+def test_half_open_probe(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=60, clock=clock)
+    breaker.record("a.com", True)
+
+    clock.now += 60
+    assert breaker.state("a.com") == "half-open"
+    assert breaker.allow("a.com")
+    assert not breaker.allow("a.com")
+
+    breaker.record("a.com", True)
+    assert breaker.state("a.com") == "open"
+    assert not breaker.allow("a.com")
+
+    clock.now += 60
+    assert breaker.allow("a.com")
+    breaker.record("a.com", False)
+    assert breaker.state("a.com") == "closed"
+    assert breaker.allow("a.com") and breaker.allow("a.com")
+
+
+# --- Releasing the probe without a result keeps the host half-open for the next probe ---
+def test_release_probe(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=60, clock=clock)
+    breaker.record("a.com", True)
+    clock.now += 60
+    assert breaker.allow("a.com")
+    breaker.release("a.com")
+    assert breaker.state("a.com") == "half-open"
+    assert breaker.allow("a.com") and not breaker.allow("a.com")
+
+
+# --- Open circuits survive a restart, closed ones are removed ---
+def test_state_persists(tmp_path, clock):
+    path = tmp_path / "circuits.db"
+    with CircuitBreaker(threshold=1, cooldown=60, path=path, clock=clock) as breaker:
+        breaker.record("dead.com", True)
+        breaker.record("back.com", True)
+        breaker.record("back.com", False)
+
+    with CircuitBreaker(threshold=1, cooldown=60, path=path, clock=clock) as breaker:
+        assert breaker.open_hosts == ["dead.com"]
+        assert not breaker.allow("dead.com")
+        clock.now += 60
+        assert breaker.allow("dead.com")
+
+
+def test_host_failed():
+    assert host_failed(503, responded=False) is True
+    assert host_failed(408, responded=False) is True
+    # A 503 response means the host is up
+    assert host_failed(503, responded=True) is False
+    assert host_failed(404, responded=True) is False
+    # Never reached the host
+    assert host_failed(400, responded=False) is None
@@ -0,0 +1,129 @@
+import json
+import subprocess
+import sys
+from dataclasses import replace
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import cli
+import config
+import input_cache
+from status_log import StatusLog
+
+
+# ---------- Project config pointed at tmp_path ----------
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    data_file = tmp_path / "data.xlsx"
+    pd.DataFrame([
+        {"ID": "BR1", "PDF_URL": "https://a.com/1.pdf", "PDF_URL_2": None},
+        {"ID": "BR2", "PDF_URL": None, "PDF_URL_2": "https://b.com/2.pdf"},
+        {"ID": "BR3", "PDF_URL": None, "PDF_URL_2": None},
+    ]).to_excel(data_file, index=False)
+
+    for name, value in [
+        ("DATA_FILE", data_file), ("LOG_FILE", tmp_path / "logs" / "status.db"), ("CACHE_DIR", tmp_path / "cache"),
+        ("SHEET_NAME", 0), ("ID_COLUMN", "ID"), ("PDF_URL_COLUMN", "PDF_URL"), ("SECONDARY_PDF_URL_COLUMN", "PDF_URL_2"),
+    ]:
+        monkeypatch.setattr(config, name, value)
+    return cli.default_data_config()
+
+
+def read_sheet(data_config):
+    usecols = [data_config.id_column, data_config.pdf_url_column, data_config.secondary_pdf_url_column]
+    input_cache.read_excel_cached(data_config.data_file, data_config.cache_dir, data_config.sheet_name, data_config.id_column, usecols)
+
+
+# --- Importing the CLI loads none of the heavy dependencies ---
+def test_cli_import_is_light():
+    code = "import cli, sys; print([m for m in ('pandas', 'numpy', 'requests', 'aiohttp') if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=Path(cli.__file__).parent, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+# --- The download engines only load aiohttp when the async engine runs ---
+def test_download_files_import_skips_aiohttp():
+    code = "import download_files, sys; print('aiohttp' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=Path(cli.__file__).parent, check=True)
+    assert result.stdout.strip() == "False"
+
+
+# --- Remaining rows come from the cached row ids, and are unknown before the sheet was read ---
+def test_remaining_row_ids(project):
+    assert cli.remaining_row_ids(project) is None
+
+    read_sheet(project)
+    assert cli.remaining_row_ids(project) == {"BR1", "BR2"}
+
+    with StatusLog(project.log_file) as log:
+        log.record("BR1", (True, 200, "https://a.com/1.pdf"))
+    assert cli.remaining_row_ids(project) == {"BR2"}
+
+
+# --- A resume with nothing left to do never imports download_files ---
+def test_resume_with_nothing_left(project, monkeypatch, capsys):
+    read_sheet(project)
+    with StatusLog(project.log_file) as log:
+        log.record("BR1", (True, 200, "https://a.com/1.pdf"))
+        log.record("BR2", (False, 404, "https://b.com/2.pdf"))
+
+    monkeypatch.setitem(sys.modules, "download_files", None)
+    assert cli.main(["resume"]) == 0
+    assert "Nothing to resume" in capsys.readouterr().out
+
+
+def test_status(project, capsys):
+    read_sheet(project)
+    with StatusLog(project.log_file) as log:
+        log.record("BR1", (False, 408, "https://a.com/1.pdf"))
+        log.record("BR1", (True, 200, "https://a.com/1.pdf"))
+        log.record("BR9", (False, 404, "https://c.com/9.pdf"))
+
+    assert cli.main(["status", "--json"]) == 0
+    assert json.loads(capsys.readouterr().out) == {
+        "rows_logged": 2,
+        "rows_remaining": 1,
+        "status_codes": {"200": 1, "404": 1},
+    }
+
+    cli.main(["status"])
+    assert "Rows remaining: 1" in capsys.readouterr().out
+
+
+# --- Options override the project's DownloadConfig ---
+def test_run_passes_options(project, monkeypatch):
+    import download_files
+
+    calls = []
+    monkeypatch.setattr(download_files, "main_sequential", lambda data_cfg, dl_cfg: calls.append(dl_cfg))
+    assert cli.main(["run", "--engine", "sequential", "--batch-size", "7", "--workers", "3"]) == 0
+    assert (calls[0].batch_size, calls[0].workers) == (7, 3)
+
+
+# --- resume shards over config.PROCESSES unless --processes says otherwise ---
+@pytest.mark.parametrize("argv, processes, engine", [([], 3, "main_sharded"), (["--processes", "1"], 1, "main_pipeline")])
+def test_resume_processes_default_to_config(project, monkeypatch, argv, processes, engine):
+    import download_files
+
+    calls = []
+    monkeypatch.setattr(download_files, "download_config", replace(download_files.download_config, processes=3))
+    for name in ("main_sharded", "main_pipeline"):
+        monkeypatch.setattr(download_files, name, lambda data_cfg, dl_cfg, name=name: calls.append((name, dl_cfg.processes)))
+    assert cli.main(["resume", *argv]) == 0
+    assert calls == [(engine, processes)]
+
+
+def test_refresh_runs_main_refresh(project, monkeypatch):
+    import download_files
+
+    calls = []
+    monkeypatch.setattr(download_files, "main_refresh", lambda data_cfg, dl_cfg: calls.append(dl_cfg))
+    assert cli.main(["refresh", "--workers", "5"]) == 0
+    assert calls[0].workers == 5
+
+
+def test_unknown_command():
+    with pytest.raises(SystemExit):
+        cli.main(["explode"])
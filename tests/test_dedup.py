@@ -0,0 +1,82 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dedup import SingleFlight, link_file, object_path, store_file
+
+
+# ============================================================
+# SingleFlight
+# ============================================================
+def test_single_flight_runs_once_for_concurrent_callers():
+    flights = SingleFlight()
+    calls = []
+    lock = threading.Lock()
+
+    def slow():
+        with lock:
+            calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: flights.do("url", slow), range(8)))
+
+    assert results == ["result"] * 8
+    assert len(calls) == 1
+
+    # Later callers get the stored result
+    assert flights.do("url", lambda: "other") == "result"
+    assert flights.do("other-url", lambda: "other") == "other"
+
+
+def test_single_flight_shares_exceptions():
+    flights = SingleFlight()
+
+    def boom():
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        flights.do("url", boom)
+    with pytest.raises(OSError):
+        flights.do("url", lambda: "never run")
+
+
+def test_single_flight_forget_runs_again():
+    flights = SingleFlight()
+    assert flights.do("url", lambda: "first") == "first"
+    flights.forget("url")
+    assert flights.do("url", lambda: "second") == "second"
+    flights.forget("unknown")
+
+
+# ============================================================
+# Content store
+# ============================================================
+def test_store_file_keeps_one_copy_per_digest(tmp_path):
+    objects = tmp_path / ".objects"
+    first = tmp_path / "a.pdf"
+    second = tmp_path / "b.pdf"
+    first.write_bytes(b"%PDF-same")
+    second.write_bytes(b"%PDF-same")
+
+    stored = store_file(first, "ab" + "0" * 62, objects)
+    assert stored == object_path(objects, "ab" + "0" * 62)
+    assert stored.parent.name == "ab"
+    assert store_file(second, "ab" + "0" * 62, objects) == stored
+    assert not first.exists() and not second.exists()
+    assert stored.read_bytes() == b"%PDF-same"
+
+
+def test_link_file_hard_links_and_replaces(tmp_path):
+    target = tmp_path / "object.pdf"
+    target.write_bytes(b"%PDF-new")
+    link = tmp_path / "row.pdf"
+    link.write_bytes(b"%PDF-old")
+
+    link_file(target, link)
+    assert link.read_bytes() == b"%PDF-new"
+    assert link.stat().st_ino == target.stat().st_ino
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["object.pdf", "row.pdf"]
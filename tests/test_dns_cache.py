@@ -0,0 +1,99 @@
+import socket
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from dns_cache import DnsCache, HostNotFound, install, system_resolve
+
+
+# ---------- Stub resolver ----------
+class StubResolver:
+    def __init__(self, table):
+        self.table = table
+        self.calls = []
+
+    def __call__(self, host):
+        self.calls.append(host)
+        result = self.table[host]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture
+def resolver():
+    return StubResolver({
+        "a.com": ["10.0.0.1", "10.0.0.2"],
+        "gone.com": HostNotFound("gone.com"),
+        "flaky.com": OSError("resolver timed out"),
+    })
+
+
+# --- Addresses are cached for the TTL, then looked up again ---
+def test_lookup_is_cached_until_ttl(resolver, clock):
+    cache = DnsCache(ttl=60, resolver=resolver, clock=clock)
+    assert cache.lookup("a.com") == ["10.0.0.1", "10.0.0.2"]
+    assert cache.lookup("a.com") == ["10.0.0.1", "10.0.0.2"]
+    assert resolver.calls == ["a.com"]
+
+    clock.now = 61
+    cache.lookup("a.com")
+    assert resolver.calls == ["a.com", "a.com"]
+
+
+# --- Names that don't exist are cached for negative_ttl, resolver errors are not cached ---
+def test_negative_and_failed_lookups(resolver, clock):
+    cache = DnsCache(ttl=60, negative_ttl=10, resolver=resolver, clock=clock)
+    assert not cache.is_unresolvable("gone.com")
+    assert cache.lookup("gone.com") is None
+    assert cache.is_unresolvable("gone.com")
+    clock.now = 11
+    assert not cache.is_unresolvable("gone.com")
+
+    with pytest.raises(OSError):
+        cache.lookup("flaky.com")
+    assert not cache.is_unresolvable("flaky.com")
+    with pytest.raises(OSError):
+        cache.lookup("flaky.com")
+    assert resolver.calls.count("flaky.com") == 2
+
+
+def test_prefetch(resolver):
+    cache = DnsCache(resolver=resolver)
+    assert cache.prefetch(["a.com", "gone.com", "flaky.com", "a.com", ""], workers=4) == {"gone.com"}
+    assert sorted(resolver.calls) == ["a.com", "flaky.com", "gone.com"]
+    assert cache.prefetch([]) == set()
+
+
+def test_system_resolve(monkeypatch):
+    def fake_getaddrinfo(host, port, type=0):
+        if host == "gone.invalid":
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))] * 2
+
+    monkeypatch.setattr(socket, "getaddrinfo", fake_getaddrinfo)
+    assert system_resolve("localhost") == ["127.0.0.1"]
+    with pytest.raises(HostNotFound):
+        system_resolve("gone.invalid")
+
+
+# --- A connection falls back to the next cached address when one refuses ---
+def test_connection_tries_each_cached_address():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    port = server.getsockname()[1]
+    # Nothing listens on 127.0.0.2, so connecting to it is refused
+    adapter = HTTPAdapter()
+    install(adapter, DnsCache(resolver=StubResolver({"two.test": ["127.0.0.2", "127.0.0.1"], "none.test": ["127.0.0.2"]})))
+    session = requests.Session()
+    session.mount("http://", adapter)
+    try:
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            # Connected to the second address, then the server never answers
+            session.get(f"http://two.test:{port}/", timeout=(2, 0.2))
+        with pytest.raises(requests.exceptions.ConnectionError):
+            session.get(f"http://none.test:{port}/", timeout=2)
+    finally:
+        server.close()
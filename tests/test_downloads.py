@@ -1,6 +1,8 @@
+import pandas as pd
 import pytest
 import responses
-from download_files import verify_pdf, download_pdf_file
+from config import DownloadConfig
+from download_files import SlowTransfer, TransferMonitor, verify_pdf, download_pdf_file, get_session, extract_urls, request_timeout
 
 
 # ============================================================
@@ -23,11 +25,16 @@ def test_verify_pdf(payload, expected):
 # ============================================================
 # DummyConfig helper for download_pdf_file() tests
 # ------------------------------------------------------------
-class DummyConfig:
-    def __init__(self, tmp_path):
-        self.downloads_dir = tmp_path
-        self.download_timeout = 2
-        self.request_headers = {}
+# Builds a real DownloadConfig so new settings fall back to their defaults
+def DummyConfig(tmp_path, **overrides):
+    return DownloadConfig(
+        downloads_dir=tmp_path,
+        download_timeout=2,
+        batch_size=1,
+        workers=1,
+        request_headers={},
+        **overrides,
+    )
 
 
 # ============================================================
@@ -66,6 +73,12 @@ def test_invalid_url_format_maps_to_400(tmp_path, bad):
     assert not (tmp_path / "row_bad.pdf").exists()
 
 
+# --- No URL left after cleaning (400) ---
+def test_no_urls_maps_to_400(tmp_path):
+    cfg = DummyConfig(tmp_path)
+    assert download_pdf_file("row_none", [], cfg) == (False, 400, "")
+
+
 # --- Fallback: first URL 404, second OK ---
 @responses.activate
 def test_404_then_success(tmp_path):
@@ -153,3 +166,258 @@ def test_io_error_when_writing_pdf(tmp_path, monkeypatch):
 
     ok, code, used = download_pdf_file("row9", [BASE_URL], cfg)
     assert (ok, code, used) == (False, 500, BASE_URL)
+
+
+# ============================================================
+# Streaming mode (stream=True)
+# ------------------------------------------------------------
+# Body is written through a temp file and renamed into place.
+# ============================================================
+
+# --- Success: streamed in small chunks, no temp files left behind ---
+@responses.activate
+def test_streamed_download_writes_file(tmp_path):
+    cfg = DummyConfig(tmp_path, stream=True, chunk_size=2)
+    body = b"%PDF-1.4\n" + b"x" * 100
+    responses.add(responses.GET, BASE_URL, body=body, status=200)
+    ok, code, used = download_pdf_file("row10", [BASE_URL], cfg)
+    assert (ok, code, used) == (True, 200, BASE_URL)
+    assert (tmp_path / "row10.pdf").read_bytes() == body
+    assert [p.name for p in tmp_path.iterdir()] == ["row10.pdf"]
+
+
+# --- Invalid PDF (415): rejected on the first chunk, nothing written ---
+@responses.activate
+def test_streamed_invalid_pdf_returns_415(tmp_path):
+    cfg = DummyConfig(tmp_path, stream=True)
+    responses.add(responses.GET, BASE_URL, body=b"<html>not a pdf</html>", status=200)
+    ok, code, used = download_pdf_file("row11", [BASE_URL], cfg)
+    assert (ok, code, used) == (False, 415, BASE_URL)
+    assert list(tmp_path.iterdir()) == []
+
+
+# --- I/O error on rename (500): temp file is cleaned up ---
+@responses.activate
+def test_streamed_io_error_cleans_up_temp_file(tmp_path, monkeypatch):
+    import download_files as mod
+    cfg = DummyConfig(tmp_path, stream=True)
+    responses.add(responses.GET, BASE_URL, body=b"%PDF-1.4\n...", status=200)
+
+    def boom_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(mod.os, "replace", boom_replace)
+
+    ok, code, used = download_pdf_file("row12", [BASE_URL], cfg)
+    assert (ok, code, used) == (False, 500, BASE_URL)
+    assert list(tmp_path.iterdir()) == []
+
+
+# ============================================================
+# Timeouts, deadline and minimum throughput
+# ------------------------------------------------------------
+# TransferMonitor runs on a fake clock.
+# ============================================================
+def test_request_timeout_falls_back_to_download_timeout(tmp_path):
+    assert request_timeout(DummyConfig(tmp_path)) == (2, 2)
+    assert request_timeout(DummyConfig(tmp_path, connect_timeout=0.5, read_timeout=30)) == (0.5, 30)
+
+
+def test_transfer_monitor_deadline(tmp_path, clock):
+    monitor = TransferMonitor(DummyConfig(tmp_path, deadline=10), started=0.0, clock=clock)
+    clock.now = 9.0
+    monitor.check(100)
+    clock.now = 10.5
+    with pytest.raises(SlowTransfer):
+        monitor.check(100)
+
+
+def test_transfer_monitor_min_throughput_after_grace(tmp_path, clock):
+    cfg = DummyConfig(tmp_path, min_throughput=1000, throughput_grace=2)
+    monitor = TransferMonitor(cfg, started=0.0, clock=clock)
+    # Slow start is forgiven during the grace period
+    clock.now = 1.5
+    monitor.check(10)
+    # Big, healthy download averaging well above the minimum
+    clock.now = 3.0
+    monitor.check(10_000)
+    clock.now = 30.0
+    with pytest.raises(SlowTransfer):
+        monitor.check(10)
+
+
+# --- A download that misses its deadline counts as a timeout (408), nothing is written ---
+@responses.activate
+def test_streamed_download_past_deadline_returns_408(tmp_path):
+    cfg = DummyConfig(tmp_path, stream=True, chunk_size=4, deadline=0)
+    responses.add(responses.GET, BASE_URL, body=b"%PDF-1.4\n" + b"x" * 100, status=200)
+    ok, code, used = download_pdf_file("row13", [BASE_URL], cfg)
+    assert (ok, code, used) == (False, 408, BASE_URL)
+    assert list(tmp_path.iterdir()) == []
+
+
+# ============================================================
+# get_session()
+# ------------------------------------------------------------
+# One pooled session per worker thread.
+# ============================================================
+def test_session_reused_within_thread(tmp_path):
+    cfg = DummyConfig(tmp_path)
+    assert get_session(cfg) is get_session(cfg)
+
+
+def test_session_not_shared_between_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    cfg = DummyConfig(tmp_path)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(get_session, cfg).result()
+    assert other is not get_session(cfg)
+
+
+def test_session_pool_and_keep_alive_settings(tmp_path):
+    cfg = DummyConfig(tmp_path, pool_connections=3, pool_maxsize=2, keep_alive=False)
+    session = get_session(cfg)
+    adapter = session.get_adapter("https://example.com")
+    assert adapter._pool_connections == 3
+    assert adapter._pool_maxsize == 2
+    assert session.headers["Connection"] == "close"
+    assert get_session(DummyConfig(tmp_path)).headers["Connection"] == "keep-alive"
+
+
+# ============================================================
+# extract_urls()
+# ------------------------------------------------------------
+# Vectorized cleaning of the primary and secondary columns.
+# ============================================================
+class DummyDataConfig:
+    pdf_url_column = "primary"
+    secondary_pdf_url_column = "secondary"
+
+
+URL_ROWS = pd.DataFrame(
+    {
+        "primary": ["  https://a.com/1.pdf ", None, "", "htp://bad", "https://d.com/4.pdf", 42],
+        "secondary": ["https://a.com/1.pdf", "http://b.com/2.pdf", "   ", None, "HTTP://E.com/5.pdf", float("nan")],
+    },
+    index=["r1", "r2", "r3", "r4", "r5", "r6"],
+)
+
+
+def test_extract_urls_cleans_and_dedups():
+    urls = extract_urls(URL_ROWS, DummyDataConfig())
+    assert urls.to_dict() == {
+        "r1": ["https://a.com/1.pdf"],                           # stripped, duplicate secondary dropped
+        "r2": ["http://b.com/2.pdf"],                            # secondary only
+        "r3": [],                                                # blank strings dropped
+        "r4": [],                                                # invalid scheme dropped
+        "r5": ["https://d.com/4.pdf", "HTTP://E.com/5.pdf"],     # both kept, in order
+        "r6": [],                                                # non-string value dropped
+    }
+
+
+def test_extract_urls_compact():
+    primary, secondary = extract_urls(URL_ROWS, DummyDataConfig(), compact=True)
+    assert list(primary) == ["https://a.com/1.pdf", None, None, None, "https://d.com/4.pdf", None]
+    assert list(secondary) == [None, "http://b.com/2.pdf", None, None, "HTTP://E.com/5.pdf", None]
+
+
+# ============================================================
+# Deduplication (dedup=True)
+# ------------------------------------------------------------
+# One request per URL per run, PDFs stored by content hash.
+# ============================================================
+@responses.activate
+def test_dedup_downloads_shared_url_once(tmp_path):
+    from dedup import SingleFlight
+    cfg = DummyConfig(tmp_path, dedup=True, stream=True)
+    responses.add(responses.GET, BASE_URL, body=b"%PDF-1.4\nshared", status=200)
+    flights = SingleFlight()
+
+    assert download_pdf_file("rowA", [BASE_URL], cfg, flights) == (True, 200, BASE_URL)
+    assert download_pdf_file("rowB", [BASE_URL], cfg, flights) == (True, 200, BASE_URL)
+
+    assert len(responses.calls) == 1
+    assert (tmp_path / "rowA.pdf").read_bytes() == b"%PDF-1.4\nshared"
+    assert (tmp_path / "rowA.pdf").stat().st_ino == (tmp_path / "rowB.pdf").stat().st_ino
+
+
+@responses.activate
+def test_dedup_stores_identical_content_once(tmp_path):
+    cfg = DummyConfig(tmp_path, dedup=True)
+    other_url = "https://mirror.example.com/file.pdf"
+    responses.add(responses.GET, BASE_URL, body=b"%PDF-1.4\nsame", status=200)
+    responses.add(responses.GET, other_url, body=b"%PDF-1.4\nsame", status=200)
+
+    assert download_pdf_file("rowC", [BASE_URL], cfg)[0] is True
+    assert download_pdf_file("rowD", [other_url], cfg)[0] is True
+
+    objects = [p for p in (tmp_path / ".objects").rglob("*.pdf") if p.parent.name != "incoming"]
+    assert len(objects) == 1
+    assert (tmp_path / "rowD.pdf").stat().st_ino == objects[0].stat().st_ino
+
+
+@responses.activate
+def test_dedup_shares_failures(tmp_path):
+    from dedup import SingleFlight
+    cfg = DummyConfig(tmp_path, dedup=True)
+    responses.add(responses.GET, BASE_URL, status=404)
+    flights = SingleFlight()
+
+    assert download_pdf_file("rowE", [BASE_URL], cfg, flights) == (False, 404, BASE_URL)
+    assert download_pdf_file("rowF", [BASE_URL], cfg, flights) == (False, 404, BASE_URL)
+    assert len(responses.calls) == 1
+
+
+# ============================================================
+# Conditional requests (conditional_requests=True)
+# ------------------------------------------------------------
+# Validators are stored next to the PDF and sent on re-runs.
+# ============================================================
+@responses.activate
+def test_conditional_request_304_keeps_file(tmp_path):
+    import json
+    from responses import matchers
+    cfg = DummyConfig(tmp_path, conditional_requests=True)
+    body = b"%PDF-1.4\n..."
+    headers = {"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"}
+    responses.add(responses.GET, BASE_URL, body=body, status=200, headers=headers)
+
+    assert download_pdf_file("row20", [BASE_URL], cfg) == (True, 200, BASE_URL)
+    sidecar = json.loads((tmp_path / "row20.pdf.meta.json").read_text())
+    assert sidecar["etag"] == '"v1"' and sidecar["url"] == BASE_URL and sidecar["size"] == len(body)
+
+    responses.replace(
+        responses.GET, BASE_URL, status=304,
+        match=[matchers.header_matcher({"If-None-Match": '"v1"', "If-Modified-Since": headers["Last-Modified"]})],
+    )
+    assert download_pdf_file("row20", [BASE_URL], cfg) == (True, 304, BASE_URL)
+    assert (tmp_path / "row20.pdf").read_bytes() == body
+
+
+@responses.activate
+def test_conditional_request_skipped_for_damaged_file(tmp_path):
+    cfg = DummyConfig(tmp_path, conditional_requests=True)
+    responses.add(responses.GET, BASE_URL, body=b"%PDF-1.4\n...", status=200, headers={"ETag": '"v1"'})
+    download_pdf_file("row21", [BASE_URL], cfg)
+
+    # Truncated local copy: the next GET must be unconditional
+    (tmp_path / "row21.pdf").write_bytes(b"%PDF")
+    assert download_pdf_file("row21", [BASE_URL], cfg) == (True, 200, BASE_URL)
+    assert "If-None-Match" not in responses.calls[-1].request.headers
+    assert (tmp_path / "row21.pdf").read_bytes() == b"%PDF-1.4\n..."
+
+
+@responses.activate
+def test_conditional_request_with_dedup_links_existing_file(tmp_path):
+    from dedup import SingleFlight
+    cfg = DummyConfig(tmp_path, conditional_requests=True, dedup=True)
+    responses.add(responses.GET, BASE_URL, body=b"%PDF-1.4\n...", status=200, headers={"ETag": '"v1"'})
+    download_pdf_file("row22", [BASE_URL], cfg)
+
+    responses.replace(responses.GET, BASE_URL, status=304)
+    flights = SingleFlight()
+    assert download_pdf_file("row22", [BASE_URL], cfg, flights) == (True, 304, BASE_URL)
+    assert download_pdf_file("row23", [BASE_URL], cfg, flights) == (True, 304, BASE_URL)
+    assert (tmp_path / "row23.pdf").read_bytes() == b"%PDF-1.4\n..."
+    assert "If-None-Match" in responses.calls[-1].request.headers
@@ -0,0 +1,89 @@
+import os
+
+import pandas as pd
+import pytest
+
+import input_cache
+from input_cache import read_excel_cached
+
+
+COLUMNS = ["ID", "PDF_URL", "PDF_URL_2"]
+
+
+def write_sheet(path, rows):
+    pd.DataFrame(rows).to_excel(path, index=False)
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    path = tmp_path / "data.xlsx"
+    write_sheet(path, [
+        {"ID": "BR1", "PDF_URL": "https://a.com/1.pdf", "PDF_URL_2": None, "Other": 1},
+        {"ID": "BR2", "PDF_URL": None, "PDF_URL_2": "https://b.com/2.pdf", "Other": 2},
+    ])
+    return path
+
+
+def read(sheet, tmp_path):
+    return read_excel_cached(sheet, tmp_path / "cache", 0, "ID", COLUMNS)
+
+
+def forbid_excel(monkeypatch):
+    def boom(*a, **k):
+        raise AssertionError("Excel file parsed again")
+    monkeypatch.setattr(input_cache.pd, "read_excel", boom)
+
+
+# --- Only the requested columns are read, indexed by the id column ---
+def test_reads_only_requested_columns(sheet, tmp_path):
+    df = read(sheet, tmp_path)
+    assert list(df.columns) == ["PDF_URL", "PDF_URL_2"]
+    assert list(df.index) == ["BR1", "BR2"]
+
+
+# --- Second read comes from the cache with the same content ---
+@pytest.mark.parametrize("cache_format", ["feather", "pickle"])
+def test_second_read_uses_cache(sheet, tmp_path, monkeypatch, cache_format):
+    if cache_format == "feather":
+        pytest.importorskip("pyarrow")
+    monkeypatch.setattr(input_cache, "CACHE_FORMAT", cache_format)
+    first = read(sheet, tmp_path)
+    assert list((tmp_path / "cache").glob(f"*.{cache_format}"))
+
+    forbid_excel(monkeypatch)
+    second = read(sheet, tmp_path)
+    assert second.index.name == "ID"
+    assert second.fillna("").equals(first.fillna(""))
+
+
+# --- Touching the file without changing it is detected by the hash ---
+def test_touched_file_with_same_content_uses_cache(sheet, tmp_path, monkeypatch):
+    read(sheet, tmp_path)
+    stat = sheet.stat()
+    os.utime(sheet, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    forbid_excel(monkeypatch)
+    assert list(read(sheet, tmp_path).index) == ["BR1", "BR2"]
+
+
+# --- Changed content invalidates the cache ---
+def test_changed_file_is_parsed_again(sheet, tmp_path):
+    read(sheet, tmp_path)
+    write_sheet(sheet, [{"ID": "BR3", "PDF_URL": "https://c.com/3.pdf", "PDF_URL_2": None}])
+    stat = sheet.stat()
+    os.utime(sheet, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert list(read(sheet, tmp_path).index) == ["BR3"]
+
+
+# --- Row ids with a URL are answered without pandas while the cache is current ---
+def test_cached_row_ids(sheet, tmp_path):
+    args = (sheet, tmp_path / "cache", 0, "ID", COLUMNS)
+    assert input_cache.cached_row_ids(*args) is None
+
+    read(sheet, tmp_path)
+    assert input_cache.cached_row_ids(*args) == ["BR1", "BR2"]
+
+    stat = sheet.stat()
+    os.utime(sheet, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert input_cache.cached_row_ids(*args) is None
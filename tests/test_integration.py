@@ -1,6 +1,5 @@
 # tests/test_integration.py
-import json
-from types import SimpleNamespace
+from dataclasses import replace
 from pathlib import Path
 from threading import Thread
 from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
@@ -9,6 +8,12 @@ import pandas as pd
 import pytest
 
 import download_files as mod  # dit modul
+from config import DataConfig, DownloadConfig
+from status_log import StatusLog
+
+
+# A PDF served with an ETag, so downloads of it can be resumed
+RESUMABLE_BODY = b"%PDF-1.4\n" + b"x" * 2000 + b"\n%%EOF\n"
 
 
 # ---------- Local HTTP-server setup ----------
@@ -24,8 +29,14 @@ def http_server(tmp_path):
     
     # One valid "PDF" payload and one non-PDF text file (415)
     (serve_dir / "valid.pdf").write_bytes(b"%PDF-1.4\n...")
+    (serve_dir / "complete.pdf").write_bytes(b"%PDF-1.4\n...\n%%EOF\n")
+    # A landing page and a PDF behind a URL without the .pdf extension
+    (serve_dir / "landing.html").write_text("<!DOCTYPE html><html><body>Reports</body></html>", encoding="utf-8")
+    (serve_dir / "report").write_bytes(b"%PDF-1.4\n...")
     (serve_dir / "notpdf.txt").write_text("hello world", encoding="utf-8")
 
+    # Requests seen per path, for endpoints that fail the first time
+    hits = {}
 
     class _Handler(SimpleHTTPRequestHandler):
         # quiet logging in tests
@@ -39,8 +50,85 @@ def http_server(tmp_path):
                 self.send_response(403); self.end_headers(); return
                 
             # Simulate slow resposne to trigger timeout
-            if self.path == "/timeout.pdf":
+            if self.path in ("/timeout.pdf", "/hanging-page"):
                 time.sleep(10); return
+
+            # Send the PDF header right away, then dribble the rest
+            if self.path == "/slow.pdf":
+                self.send_response(200); self.send_header("Content-Length", "18"); self.end_headers()
+                self.wfile.write(b"%PDF-1.4\n"); self.wfile.flush()
+                time.sleep(0.5)
+                self.wfile.write(b"slow body"); return
+
+            # A PDF, or a landing page for /gzip-landing, sent gzip-encoded even when a Range was asked for
+            if self.path in ("/gzip.pdf", "/gzip-report", "/gzip-landing"):
+                import gzip
+                plain = b"<!DOCTYPE html><html></html>" if self.path == "/gzip-landing" else b"%PDF-1.4\ngzipped\n%%EOF\n"
+                body = gzip.compress(plain)
+                self.send_response(200); self.send_header("Content-Encoding", "gzip"); self.send_header("ETag", '"g1"')
+                self.send_header("Content-Length", str(len(body))); self.end_headers()
+                self.wfile.write(body); return
+
+            # The PDF magic arrives split over two packets
+            if self.path == "/split.pdf":
+                self.send_response(200); self.send_header("Content-Length", "12"); self.end_headers()
+                self.wfile.write(b"%PD"); self.wfile.flush()
+                time.sleep(0.2)
+                self.wfile.write(b"F-1.4\n..."); return
+
+            # Unavailable on the first request for each path, then a valid PDF
+            if self.path.startswith("/flaky.pdf"):
+                hits[self.path] = hits.get(self.path, 0) + 1
+                if hits[self.path] == 1:
+                    self.send_response(503); self.send_header("Retry-After", "0"); self.end_headers(); return
+                body = b"%PDF-1.4\nflaky"
+                self.send_response(200); self.send_header("Content-Length", str(len(body))); self.end_headers()
+                self.wfile.write(body); return
+
+            # Sends the PDF header, then one byte every 0.1 seconds: never idle long enough to time out
+            if self.path == "/trickle.pdf":
+                self.send_response(200); self.send_header("Content-Length", "1009"); self.end_headers()
+                try:
+                    self.wfile.write(b"%PDF-1.4\n"); self.wfile.flush()
+                    for _ in range(1000):
+                        time.sleep(0.1)
+                        self.wfile.write(b"x"); self.wfile.flush()
+                except OSError:
+                    pass
+                return
+
+            # Announces more bytes than it sends, then closes the connection
+            if self.path == "/truncated.pdf":
+                self.send_response(200); self.send_header("Content-Length", "1000"); self.end_headers()
+                self.wfile.write(b"%PDF-1.4\n...%%EOF\n"); self.close_connection = True; return
+
+            # An error page that happens to start with the PDF magic bytes
+            if self.path == "/errorpage.pdf":
+                body = b"%PDF-<html><body>Report not available</body></html>"
+                self.send_response(200); self.send_header("Content-Length", str(len(body))); self.end_headers()
+                self.wfile.write(body); return
+
+            # Cuts the first download off after 1000 bytes, then serves Range requests with a matching If-Range.
+            # With ?416 every Range request is refused instead
+            if self.path.startswith("/resumable.pdf"):
+                hits[self.path] = hits.get(self.path, 0) + 1
+                body = RESUMABLE_BODY
+                requested = self.headers.get("Range")
+                if requested and self.headers.get("If-Range") == '"v1"':
+                    if self.path.endswith("?416"):
+                        self.send_response(416); self.send_header("Content-Range", f"bytes */{len(body)}"); self.send_header("Content-Length", "0"); self.end_headers(); return
+                    start = int(requested.removeprefix("bytes=").rstrip("-"))
+                    self.send_response(206); self.send_header("ETag", '"v1"')
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"); self.send_header("Content-Length", str(len(body) - start)); self.end_headers()
+                    self.wfile.write(body[start:]); return
+                self.send_response(200); self.send_header("ETag", '"v1"'); self.send_header("Content-Length", str(len(body))); self.end_headers()
+                if hits[self.path] == 1:
+                    self.wfile.write(body[:1000]); self.close_connection = True; return
+                self.wfile.write(body); return
+
+            # Rate limited, asks for a pause far longer than anyone will wait
+            if self.path == "/busy.pdf":
+                self.send_response(429); self.send_header("Retry-After", "3600"); self.end_headers(); return
                 
             # Otherwise, serve files normally
             return super().do_GET()
@@ -72,23 +160,24 @@ def http_server(tmp_path):
 def cfgs(tmp_path):
     # Create temp file and directory structure
     data_file = tmp_path / "data.xlsx"
-    log_file = tmp_path / "logs" / "log.json"
+    log_file = tmp_path / "logs" / "status.db"
     log_file.parent.mkdir(parents=True, exist_ok=True)
     downloads = tmp_path / "downloads"
     downloads.mkdir()
 
     # Data-layer config passed to functions that read Excel and filter rows
-    data_cfg = SimpleNamespace(
+    data_cfg = DataConfig(
         data_file=str(data_file),               # path to Excel test file
         sheet_name="Sheet1",                    # sheet to read
         id_column="ID",                         # index column in Excel
         pdf_url_column="PDF_URL",               # primary URL column
         secondary_pdf_url_column="PDF_URL_2",   # fallback URL column
-        log_file=log_file,                      # path to JSON log file
+        log_file=log_file,                      # path to the status log
+        cache_dir=tmp_path / "cache",           # parsed copies of the Excel file
     )
     
     # Download-layer config passed to functions that fetch and write PDFs
-    dl_cfg = SimpleNamespace(
+    dl_cfg = DownloadConfig(
         downloads_dir=downloads,                # where PDFs are saved
         download_timeout=2,                     # requests timeout in seconds
         batch_size=None,                        # None = process all
@@ -177,7 +266,7 @@ def test_urls_trim_and_secondary_used(cfgs, http_server):
     assert ok4 is True and code4 == 200 and used4.endswith("/valid.pdf")
 
 
-# Downloads, JSON shape, elapsed timing, and non-PDF classified as 415
+# Downloads, status log shape, elapsed timing, and non-PDF classified as 415
 def test_downloads_written_and_json_shape(cfgs, http_server, capsys):
     data_cfg, dl_cfg = cfgs
     rows = [
@@ -200,12 +289,13 @@ def test_downloads_written_and_json_shape(cfgs, http_server, capsys):
     assert not (dl_cfg.downloads_dir / "BR7.pdf").exists()
     assert     (dl_cfg.downloads_dir / "BR8.pdf").exists()
 
-    # Log file exists and has the expected tuple-like structure per ID
+    # Status log exists and has the expected tuple-like structure per ID
     assert data_cfg.log_file.exists()
-    log = json.loads(Path(data_cfg.log_file).read_text())
+    with StatusLog(data_cfg.log_file) as status_log:
+        log = status_log.latest()
 
     def ok_tuple(v):
-        return isinstance(v, list) and len(v) == 3 and isinstance(v[0], bool) and isinstance(v[1], int) and isinstance(v[2], str)
+        return isinstance(v, tuple) and len(v) == 3 and isinstance(v[0], bool) and isinstance(v[1], int) and isinstance(v[2], str)
 
     for k in ["BR7", "BR8", "BRT", "BRF"]:
         assert ok_tuple(log[k])
@@ -284,7 +374,7 @@ def test_both_urls_fail(cfgs, http_server):
     assert used.endswith("/missing2.pdf")   # last attempted URL recorded
 
 
-# Simulate a timeout via monkeypatching requests.get to raise Timeout
+# Simulate a timeout via monkeypatching Session.get to raise Timeout
 def test_timeout_via_monkeypatch(cfgs, http_server, monkeypatch):
     data_cfg, dl_cfg = cfgs
     
@@ -292,13 +382,638 @@ def test_timeout_via_monkeypatch(cfgs, http_server, monkeypatch):
     rows = [{"ID": "TO", "PDF_URL": f"{http_server}/valid.pdf", "PDF_URL_2": None}]
     write_excel(Path(data_cfg.data_file), rows)
 
-    # Force requests.get to raise Timeout for any call
+    # Force the pooled sessions to raise Timeout for any call
     def _timeout(*a, **k):
         import requests
         raise requests.Timeout("simulated")
-    monkeypatch.setattr(mod.requests, "get", _timeout)
+    monkeypatch.setattr(mod.requests.Session, "get", _timeout)
 
     # Run. Expect failure and timeout-mapped code
     _, status = mod.main_sequential(data_cfg, dl_cfg)
     assert status["TO"][0] is False
-    assert status["TO"][1] in (408, 500)    # depends on how module maps timeouts
\ No newline at end of file
+    assert status["TO"][1] in (408, 500)    # depends on how module maps timeouts
+
+# Asyncio engine returns the same status semantics as the threaded modes
+def test_main_async_status_codes(cfgs, http_server):
+    pytest.importorskip("aiohttp")
+    data_cfg, dl_cfg = cfgs
+    rows = [
+        {"ID": "AS1", "PDF_URL": f"{http_server}/notpdf.txt", "PDF_URL_2": None},      # non-PDF -> 415
+        {"ID": "AS2", "PDF_URL": f"{http_server}/missing.pdf", "PDF_URL_2": f"{http_server}/valid.pdf"},  # 404 -> fallback 200
+        {"ID": "AS3", "PDF_URL": f"{http_server}/forbidden.pdf", "PDF_URL_2": None},   # 403
+        {"ID": "AS4", "PDF_URL": f"{http_server}/timeout.pdf", "PDF_URL_2": None},     # client timeout -> 408
+        {"ID": "AS5", "PDF_URL": "htp://bad", "PDF_URL_2": None},                      # dropped by extract_urls -> 400
+    ]
+    write_excel(Path(data_cfg.data_file), rows)
+
+    elapsed, status = mod.main_async(data_cfg, dl_cfg)
+    assert elapsed >= 0
+
+    assert status["AS1"] == (False, 415, f"{http_server}/notpdf.txt")
+    assert status["AS2"] == (True, 200, f"{http_server}/valid.pdf")
+    assert status["AS3"] == (False, 403, f"{http_server}/forbidden.pdf")
+    assert status["AS4"] == (False, 408, f"{http_server}/timeout.pdf")
+    assert status["AS5"] == (False, 400, "")
+
+    assert (dl_cfg.downloads_dir / "AS2.pdf").read_bytes() == b"%PDF-1.4\n..."
+    assert not (dl_cfg.downloads_dir / "AS1.pdf").exists()
+
+
+# The async engine never has more than async_concurrency rows pending
+def test_download_all_async_window(cfgs, monkeypatch):
+    import asyncio
+    pytest.importorskip("aiohttp")
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, async_concurrency=3)
+    pending = 0
+    max_pending = 0
+
+    async def fake_download(session, row_id, urls, config):
+        nonlocal pending, max_pending
+        pending += 1
+        max_pending = max(max_pending, pending)
+        await asyncio.sleep(0.01)
+        pending -= 1
+        return (True, 200, urls[0])
+
+    monkeypatch.setattr(mod, "download_pdf_file_async", fake_download)
+    urls = pd.Series({f"W{i}": [f"https://a.com/{i}.pdf"] for i in range(20)})
+    with StatusLog(data_cfg.log_file) as log:
+        status = asyncio.run(mod.download_all_async(urls, dl_cfg, log))
+        assert len(log.latest()) == 20
+    assert len(status) == 20 and max_pending == 3
+
+
+# Batches append to the status log, so later runs skip every earlier batch
+def test_batches_accumulate_in_status_log(cfgs, http_server):
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, batch_size=1)
+    rows = [
+        {"ID": "B1", "PDF_URL": f"{http_server}/valid.pdf", "PDF_URL_2": None},
+        {"ID": "B2", "PDF_URL": f"{http_server}/valid.pdf", "PDF_URL_2": None},
+        {"ID": "B3", "PDF_URL": f"{http_server}/missing.pdf", "PDF_URL_2": None},
+    ]
+    write_excel(Path(data_cfg.data_file), rows)
+
+    seen = []
+    for _ in range(3):
+        _, status = mod.main_concurrent(data_cfg, dl_cfg)
+        seen.extend(status)
+    assert seen == ["B1", "B2", "B3"]
+
+    # Nothing left to do on a fourth run
+    _, status = mod.main_concurrent(data_cfg, dl_cfg)
+    assert status == {}
+    with StatusLog(data_cfg.log_file) as log:
+        assert set(log.latest()) == {"B1", "B2", "B3"}
+
+
+# Whole-sheet pipeline processes every row in one run through a small bounded queue
+def test_pipeline_runs_whole_sheet(cfgs, http_server):
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, batch_size=1, workers=2, queue_size=2)
+    rows = [{"ID": f"P{i}", "PDF_URL": f"{http_server}/valid.pdf", "PDF_URL_2": None} for i in range(8)]
+    rows.append({"ID": "PX", "PDF_URL": f"{http_server}/missing.pdf", "PDF_URL_2": None})
+    write_excel(Path(data_cfg.data_file), rows)
+
+    elapsed, status_codes = mod.main_pipeline(data_cfg, dl_cfg)
+    assert elapsed >= 0
+    assert status_codes == {200: 8, 404: 1}
+
+    with StatusLog(data_cfg.log_file) as log:
+        assert len(log) == 9
+    assert len(list(dl_cfg.downloads_dir.glob("P*.pdf"))) == 8
+
+    # A resumed run has nothing left to do
+    _, status_codes = mod.main_pipeline(data_cfg, dl_cfg)
+    assert status_codes == {}
+
+
+
+# Sharded mode splits the rows over processes by host and merges results into one status log
+def test_sharded_runs_whole_sheet(cfgs, http_server):
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, workers=2, processes=2)
+    other_host = http_server.replace("127.0.0.1", "localhost")
+    rows = [{"ID": f"S{i}", "PDF_URL": f"{http_server}/valid.pdf", "PDF_URL_2": None} for i in range(4)]
+    rows += [{"ID": f"L{i}", "PDF_URL": f"{other_host}/valid.pdf", "PDF_URL_2": None} for i in range(3)]
+    rows.append({"ID": "SX", "PDF_URL": f"{http_server}/missing.pdf", "PDF_URL_2": None})
+    write_excel(Path(data_cfg.data_file), rows)
+
+    _, status_codes = mod.main_sharded(data_cfg, dl_cfg)
+    assert status_codes == {200: 7, 404: 1}
+
+    with StatusLog(data_cfg.log_file) as log:
+        latest = log.latest()
+    assert set(latest) == {"S0", "S1", "S2", "S3", "L0", "L1", "L2", "SX"}
+    assert latest["SX"][1] == 404
+    assert len(list(dl_cfg.downloads_dir.glob("[SL]?.pdf"))) == 7
+
+    _, status_codes = mod.main_sharded(data_cfg, dl_cfg)
+    assert status_codes == {}
+
+# run_downloads pulls rows lazily, never queueing more than queue_size ahead
+def test_run_downloads_reads_input_lazily(cfgs, http_server):
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, workers=1, queue_size=2)
+    pulled = []
+
+    def rows():
+        for i in range(6):
+            pulled.append(i)
+            yield f"L{i}", [f"{http_server}/valid.pdf"]
+
+    results = mod.run_downloads(rows(), dl_cfg)
+    index, state = next(results)
+    assert index == "L0" and state[0] is True
+    # At most one row per worker in flight plus queue_size rows waiting
+    assert len(pulled) <= dl_cfg.workers + dl_cfg.queue_size
+    assert [index for index, _ in results] == ["L1", "L2", "L3", "L4", "L5"]
+
+
+# Hedging: a primary that never answers loses to the secondary long before the timeout
+def test_hedged_download_beats_slow_primary(cfgs, http_server):
+    import time
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, hedge_delay=0.2)
+    timeout_url, valid_url = f"{http_server}/timeout.pdf", f"{http_server}/valid.pdf"
+
+    start = time.perf_counter()
+    assert mod.download_pdf_file("H1", [timeout_url, valid_url], dl_cfg) == (True, 200, valid_url)
+    assert time.perf_counter() - start < dl_cfg.download_timeout
+    assert (dl_cfg.downloads_dir / "H1.pdf").read_bytes() == b"%PDF-1.4\n..."
+
+
+# Hedging: a primary that is already streaming PDF bytes is not raced
+def test_hedged_download_keeps_streaming_primary(cfgs, http_server):
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, hedge_delay=0.2, stream=True, chunk_size=8)
+    slow_url, valid_url = f"{http_server}/slow.pdf", f"{http_server}/valid.pdf"
+
+    assert mod.download_pdf_file("H2", [slow_url, valid_url], dl_cfg) == (True, 200, slow_url)
+    assert (dl_cfg.downloads_dir / "H2.pdf").read_bytes() == b"%PDF-1.4\nslow body"
+    assert [p.name for p in dl_cfg.downloads_dir.iterdir()] == ["H2.pdf"]
+
+
+# Hedging: a primary that fails fast falls back to the secondary as usual
+def test_hedged_download_falls_back_after_fast_failure(cfgs, http_server):
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, hedge_delay=5)
+    missing_url, valid_url = f"{http_server}/missing.pdf", f"{http_server}/valid.pdf"
+
+    assert mod.download_pdf_file("H3", [missing_url, valid_url], dl_cfg) == (True, 200, valid_url)
+    assert mod.download_pdf_file("H4", [missing_url, missing_url + "?2"], dl_cfg) == (False, 404, missing_url + "?2")
+
+
+# Autotuned run completes and reports how the concurrency converged
+def test_run_downloads_with_autotune(cfgs, http_server, capsys):
+    from scheduler import AimdController
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, autotune=True, workers=8, max_per_host=8, min_host_interval=0)
+    # Local latencies are a few ms, so ignore latency noise and only grow on healthy windows
+    controller = AimdController(minimum=1, maximum=dl_cfg.workers, initial=1, latency_factor=1000)
+    rows = [(f"A{i}", [f"{http_server}/valid.pdf"]) for i in range(20)]
+
+    results = dict(mod.run_downloads(rows, dl_cfg, controller))
+    assert len(results) == 20 and all(state[0] for state in results.values())
+    assert controller.limit > 1
+    assert "Concurrency over time" in capsys.readouterr().out
+
+
+# With nothing in flight the loop sleeps until a held-back host may start, instead of polling the scheduler
+def test_run_downloads_sleeps_while_throttled(cfgs, http_server, monkeypatch):
+    from scheduler import HostScheduler
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, workers=4, max_per_host=4, min_host_interval=0.5)
+    calls = []
+    next_row = HostScheduler.next
+    monkeypatch.setattr(HostScheduler, "next", lambda self: calls.append(1) or next_row(self))
+    rows = [(f"T{i}", [f"{http_server}/valid.pdf"]) for i in range(3)]
+
+    results = dict(mod.run_downloads(rows, dl_cfg))
+    assert all(state[0] for state in results.values())
+    assert len(calls) < 50
+
+
+# A row waiting out its retry backoff doesn't keep the loop busy
+def test_run_downloads_sleeps_during_backoff(cfgs, http_server, monkeypatch):
+    from scheduler import HostScheduler
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, max_retries=1, retry_base_delay=0.5, retry_max_delay=0.5)
+    calls = []
+    next_row = HostScheduler.next
+    monkeypatch.setattr(HostScheduler, "next", lambda self: calls.append(1) or next_row(self))
+
+    results = dict(mod.run_downloads([("B1", [f"{http_server}/flaky.pdf?backoff"])], dl_cfg))
+    assert results == {"B1": (True, 200, f"{http_server}/flaky.pdf?backoff")}
+    assert len(calls) < 50
+
+
+# Transient failures are retried within the run, permanent ones and long Retry-Afters are not
+def test_run_downloads_retries_transient_failures(cfgs, http_server):
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, max_retries=2, retry_base_delay=0.01, dedup=True)
+    rows = [
+        ("R1", [f"{http_server}/flaky.pdf?1"]),
+        ("R2", [f"{http_server}/missing.pdf"]),
+        ("R3", [f"{http_server}/busy.pdf"]),
+    ]
+
+    results = dict(mod.run_downloads(rows, dl_cfg))
+    assert results == {
+        "R1": (True, 200, f"{http_server}/flaky.pdf?1"),
+        "R2": (False, 404, f"{http_server}/missing.pdf"),
+        "R3": (False, 429, f"{http_server}/busy.pdf"),
+    }
+    assert (dl_cfg.downloads_dir / "R1.pdf").read_bytes() == b"%PDF-1.4\nflaky"
+
+
+# Retry-failed mode only re-queues rows whose last result was transient
+def test_main_retry_failed(cfgs, http_server):
+    data_cfg, dl_cfg = cfgs
+    rows = [
+        {"ID": "F1", "PDF_URL": f"{http_server}/flaky.pdf?2", "PDF_URL_2": None},
+        {"ID": "F2", "PDF_URL": f"{http_server}/missing.pdf", "PDF_URL_2": None},
+    ]
+    write_excel(Path(data_cfg.data_file), rows)
+
+    # Retries are off by default, so the first run logs the 503
+    _, status = mod.main_concurrent(data_cfg, dl_cfg)
+    assert status["F1"] == (False, 503, f"{http_server}/flaky.pdf?2")
+
+    _, status_codes = mod.main_retry_failed(data_cfg, dl_cfg)
+    assert status_codes == {200: 1}
+    with StatusLog(data_cfg.log_file) as log:
+        assert log.latest()["F1"][0] is True
+        assert log.latest()["F2"] == (False, 404, f"{http_server}/missing.pdf")
+
+    # Nothing transient is left
+    _, status_codes = mod.main_retry_failed(data_cfg, dl_cfg)
+    assert status_codes == {}
+
+
+# A trickling server is cut off by the deadline or the minimum throughput, a slow but steady one is not
+def test_slow_transfers_are_cut_off(cfgs, http_server):
+    import time
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=True, read_timeout=1)
+    trickle_url, slow_url = f"{http_server}/trickle.pdf", f"{http_server}/slow.pdf"
+
+    start = time.perf_counter()
+    assert mod.download_pdf_file("T1", [trickle_url], replace(dl_cfg, deadline=0.5)) == (False, 408, trickle_url)
+    assert mod.download_pdf_file("T2", [trickle_url], replace(dl_cfg, min_throughput=1000, throughput_grace=0.3)) == (False, 408, trickle_url)
+    assert time.perf_counter() - start < 3
+    assert list(dl_cfg.downloads_dir.iterdir()) == []
+
+    assert mod.download_pdf_file("T3", [slow_url], replace(dl_cfg, deadline=5, min_throughput=1)) == (True, 200, slow_url)
+
+
+# Attempts are timed, and the run summary is exported as JSON and Prometheus text
+def test_run_metrics_exported(cfgs, http_server):
+    import json
+    data_cfg, dl_cfg = cfgs
+    data_cfg = replace(data_cfg, metrics_dir=data_cfg.log_file.parent / "metrics")
+    rows = [
+        {"ID": "M1", "PDF_URL": f"{http_server}/missing.pdf", "PDF_URL_2": f"{http_server}/valid.pdf"},
+        {"ID": "M2", "PDF_URL": f"{http_server}/valid.pdf", "PDF_URL_2": None},
+    ]
+    write_excel(Path(data_cfg.data_file), rows)
+
+    mod.main_concurrent(data_cfg, dl_cfg)
+
+    [json_path] = data_cfg.metrics_dir.glob("run-*.json")
+    summary = json.loads(json_path.read_text())
+    assert summary["rows"] == 2 and summary["attempts"] == 3
+    assert summary["success_url_index"] == {"0": 1, "1": 1}
+    host = summary["hosts"]["127.0.0.1"]
+    assert host["bytes"] == 2 * len(b"%PDF-1.4\n...")
+    assert host["stage_seconds"]["connect"] > 0
+    assert host["ttfb_seconds"]["p50"] > 0
+    assert 'pdf_downloader_rows_total{code="200"} 2' in (data_cfg.metrics_dir / "downloads.prom").read_text()
+
+
+# Each attempt of a row is timed, including connecting
+def test_download_row_timings(cfgs, http_server):
+    _, dl_cfg = cfgs
+    missing_url, valid_url = f"{http_server}/missing.pdf", f"{http_server}/valid.pdf"
+
+    result = mod.download_row("M3", [missing_url, valid_url], dl_cfg)
+    assert result.status == (True, 200, valid_url)
+    first, second = result.attempts
+    assert (first.url_index, first.ok, first.code) == (0, False, 404)
+    assert (second.url_index, second.ok, second.code, second.bytes) == (1, True, 200, len(b"%PDF-1.4\n..."))
+    assert second.ttfb <= second.total
+
+
+# With validation on, truncated bodies and error pages with a PDF prefix are not counted as downloaded
+@pytest.mark.parametrize("stream", [True, False])
+def test_pdf_validation(cfgs, http_server, stream):
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=stream, validate_pdf=True)
+
+    complete_url = f"{http_server}/complete.pdf"
+    assert mod.download_pdf_file("V1", [complete_url], dl_cfg) == (True, 200, complete_url)
+    assert mod.download_pdf_file("V2", [f"{http_server}/truncated.pdf"], dl_cfg)[1] == 917
+    assert mod.download_pdf_file("V3", [f"{http_server}/errorpage.pdf"], dl_cfg)[1] == 922
+    # No trailer
+    assert mod.download_pdf_file("V4", [f"{http_server}/valid.pdf", complete_url], dl_cfg) == (True, 200, complete_url)
+
+    assert sorted(path.name for path in dl_cfg.downloads_dir.iterdir()) == ["V1.pdf", "V4.pdf"]
+
+
+def test_pdf_validation_async(cfgs, http_server):
+    import asyncio
+    aiohttp = pytest.importorskip("aiohttp")
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, validate_pdf=True)
+
+    async def download(row_id, url):
+        async with aiohttp.ClientSession() as session:
+            return await mod.download_pdf_file_async(session, row_id, [url], dl_cfg)
+
+    assert asyncio.run(download("A1", f"{http_server}/complete.pdf"))[:2] == (True, 200)
+    assert asyncio.run(download("A2", f"{http_server}/truncated.pdf"))[1] == 917
+    assert asyncio.run(download("A3", f"{http_server}/errorpage.pdf"))[1] == 922
+    assert [path.name for path in dl_cfg.downloads_dir.iterdir()] == ["A1.pdf"]
+
+
+# Content-encoded PDFs are written decoded, whether streamed or not
+@pytest.mark.parametrize("stream", [True, False])
+def test_gzip_encoded_pdf(cfgs, http_server, stream):
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=stream, validate_pdf=True, resume_partial=True)
+    url = f"{http_server}/gzip.pdf"
+
+    assert mod.download_pdf_file("G1", [url], dl_cfg) == (True, 200, url)
+    assert (dl_cfg.downloads_dir / "G1.pdf").read_bytes() == b"%PDF-1.4\ngzipped\n%%EOF\n"
+    # Nothing but the PDF is left behind
+    assert sorted(path.name for path in dl_cfg.downloads_dir.iterdir()) == ["G1.pdf"]
+
+
+# A PDF magic split over two reads is still recognized by the async engine
+def test_async_magic_split_over_chunks(cfgs, http_server):
+    import asyncio
+    aiohttp = pytest.importorskip("aiohttp")
+    _, dl_cfg = cfgs
+    url = f"{http_server}/split.pdf"
+
+    async def download():
+        async with aiohttp.ClientSession() as session:
+            return await mod.download_pdf_file_async(session, "A4", [url], dl_cfg)
+
+    assert asyncio.run(download()) == (True, 200, url)
+    assert (dl_cfg.downloads_dir / "A4.pdf").read_bytes() == b"%PDF-1.4\n..."
+
+
+# Probing skips landing pages, keeps PDFs without a .pdf extension, and remembers the results
+@pytest.mark.parametrize("stream", [True, False])
+def test_probe_skips_landing_pages(cfgs, http_server, monkeypatch, stream):
+    from probe import ProbeCache
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=stream, probe=True)
+    landing_url, report_url, valid_url = f"{http_server}/landing.html", f"{http_server}/report", f"{http_server}/valid.pdf"
+
+    with ProbeCache(dl_cfg.downloads_dir.parent / "probes.db") as cache:
+        assert mod.download_pdf_file("P1", [landing_url, valid_url], dl_cfg, probe_cache=cache) == (True, 200, valid_url)
+        assert mod.download_pdf_file("P2", [report_url], dl_cfg, probe_cache=cache) == (True, 200, report_url)
+        assert (cache.get(landing_url), cache.get(report_url), cache.get(valid_url)) == (False, True, None)
+
+        # Known results need no probe
+        monkeypatch.setattr(mod, "probe_pdf", lambda *a: pytest.fail("probed again"))
+        assert mod.download_pdf_file("P3", [landing_url], dl_cfg, probe_cache=cache) == (False, 415, landing_url)
+    assert not (dl_cfg.downloads_dir / "P3.pdf").exists()
+
+
+# Compressed responses are decoded before the probe classifies them, a negative verdict on one isn't cached
+def test_probe_content_encoded(cfgs, http_server):
+    from probe import ProbeCache
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, probe=True)
+    report_url, landing_url = f"{http_server}/gzip-report", f"{http_server}/gzip-landing"
+
+    with ProbeCache() as cache:
+        assert mod.download_pdf_file("P4", [report_url], dl_cfg, probe_cache=cache) == (True, 200, report_url)
+        assert mod.download_pdf_file("P5", [landing_url], dl_cfg, probe_cache=cache) == (False, 415, landing_url)
+        assert (cache.get(report_url), cache.get(landing_url)) == (True, None)
+    assert (dl_cfg.downloads_dir / "P4.pdf").read_bytes() == b"%PDF-1.4\ngzipped\n%%EOF\n"
+
+
+# A probe that times out is the attempt, the full download doesn't wait for a second timeout
+def test_probe_timeout_counts_as_attempt(cfgs, http_server):
+    import time
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, probe=True, download_timeout=1)
+    url = f"{http_server}/hanging-page"
+
+    started = time.monotonic()
+    result = mod.download_row("P6", [url], dl_cfg)
+    assert result.status == (False, 408, url)
+    assert time.monotonic() - started < 1.8
+    assert [timing.code for timing in result.attempts] == [408]
+
+
+# A download cut off mid-body is continued from its part file with a Range request
+@pytest.mark.parametrize("dedup", [False, True])
+def test_resume_partial_download(cfgs, http_server, dedup):
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=True, validate_pdf=True, resume_partial=True, dedup=dedup)
+    url = f"{http_server}/resumable.pdf"
+    part = dl_cfg.downloads_dir / "R1.pdf.part"
+
+    assert mod.download_pdf_file("R1", [url], dl_cfg)[1] == 917
+    assert part.stat().st_size == 1000
+
+    assert mod.download_pdf_file("R1", [url], dl_cfg) == (True, 206, url)
+    assert (dl_cfg.downloads_dir / "R1.pdf").read_bytes() == RESUMABLE_BODY
+    assert not part.exists() and not Path(f"{part}.json").exists()
+
+
+# A range the server refuses is downloaded again from the start
+def test_resume_partial_falls_back_to_full_download(cfgs, http_server):
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=True, validate_pdf=True, resume_partial=True)
+    url = f"{http_server}/resumable.pdf?416"
+
+    assert mod.download_pdf_file("R2", [url], dl_cfg)[1] == 917
+    assert mod.download_pdf_file("R2", [url], dl_cfg) == (True, 200, url)
+    assert (dl_cfg.downloads_dir / "R2.pdf").read_bytes() == RESUMABLE_BODY
+    assert sorted(path.name for path in dl_cfg.downloads_dir.iterdir()) == ["R2.pdf"]
+
+
+# The part file is removed once the row fails for good
+def test_resume_partial_discarded_on_permanent_failure(cfgs, http_server):
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=True, validate_pdf=True, resume_partial=True)
+    part = dl_cfg.downloads_dir / "R4.pdf.part"
+
+    assert mod.download_pdf_file("R4", [f"{http_server}/resumable.pdf"], dl_cfg)[1] == 917
+    assert part.exists()
+    # A transient failure of another URL keeps it for the retry
+    assert mod.download_pdf_file("R4", [f"{http_server}/busy.pdf"], dl_cfg)[1] == 429
+    assert part.exists()
+    assert mod.download_pdf_file("R4", [f"{http_server}/missing.pdf"], dl_cfg)[1] == 404
+    assert list(dl_cfg.downloads_dir.iterdir()) == []
+
+
+def test_resume_partial_off_keeps_nothing(cfgs, http_server):
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=True)
+
+    assert mod.download_pdf_file("R3", [f"{http_server}/resumable.pdf"], dl_cfg)[1] == 917
+    assert list(dl_cfg.downloads_dir.iterdir()) == []
+
+
+# Hosts are resolved through the DnsCache, and rows on a host that doesn't exist fail without a request
+def test_dns_prefetch(cfgs, http_server, monkeypatch):
+    import threading
+    import dns_cache
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, dns_prefetch=True)
+    port = http_server.rsplit(":", 1)[1]
+
+    def resolver(host):
+        if host == "pdfs.example":
+            return ["127.0.0.1"]
+        raise dns_cache.HostNotFound(host)
+
+    monkeypatch.setattr(mod, "_dns_cache", dns_cache.DnsCache(resolver=resolver))
+    monkeypatch.setattr(mod, "_thread_local", threading.local())
+    rows = [
+        {"ID": "D1", "PDF_URL": f"http://pdfs.example:{port}/valid.pdf", "PDF_URL_2": None},
+        {"ID": "D2", "PDF_URL": f"http://gone.example:{port}/valid.pdf", "PDF_URL_2": f"http://pdfs.example:{port}/valid.pdf"},
+        {"ID": "D3", "PDF_URL": f"http://gone.example:{port}/valid.pdf", "PDF_URL_2": None},
+    ]
+    write_excel(Path(data_cfg.data_file), rows)
+
+    _, status = mod.main_concurrent(data_cfg, dl_cfg)
+    assert status["D1"] == (True, 200, f"http://pdfs.example:{port}/valid.pdf")
+    assert status["D2"] == (True, 200, f"http://pdfs.example:{port}/valid.pdf")
+    assert status["D3"] == (False, dns_cache.UNRESOLVED_CODE, f"http://gone.example:{port}/valid.pdf")
+
+
+# Once a host stops accepting connections its remaining URLs fail fast, also in the next run
+def test_circuit_breaker(cfgs, http_server):
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, workers=1, circuit_breaker=True, breaker_threshold=2, breaker_file=data_cfg.log_file.parent / "circuits.db")
+    # Nothing listens on port 1, so connecting is refused right away
+    dead = "http://localhost:1"
+    valid_url = f"{http_server}/valid.pdf"
+    rows = [{"ID": f"C{i}", "PDF_URL": f"{dead}/{i}.pdf", "PDF_URL_2": None} for i in range(1, 5)]
+    rows.append({"ID": "C5", "PDF_URL": f"{dead}/5.pdf", "PDF_URL_2": valid_url})
+    write_excel(Path(data_cfg.data_file), rows)
+
+    _, status = mod.main_pipeline(data_cfg, dl_cfg)
+    assert status == {503: 2, 921: 2, 200: 1}
+    with StatusLog(data_cfg.log_file) as log:
+        latest = log.latest()
+    assert [latest[f"C{i}"][1] for i in range(1, 5)] == [503, 503, 921, 921]
+    assert latest["C5"] == (True, 200, valid_url)
+
+    # The next run starts with the circuit still open
+    _, status = mod.main_retry_failed(data_cfg, dl_cfg)
+    assert status == {921: 4}
+
+
+# A half-open probe that never reached the host, here a cached probe verdict, doesn't keep the circuit from closing
+def test_circuit_breaker_probe_without_response(cfgs, http_server, clock):
+    from circuit_breaker import CircuitBreaker
+    from probe import ProbeCache
+    _, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, probe=True)
+    landing_url, valid_url = f"{http_server}/landing.html", f"{http_server}/valid.pdf"
+    host = mod.scheduler.url_host(valid_url)
+    breaker = CircuitBreaker(threshold=1, cooldown=60, clock=clock)
+
+    with ProbeCache(dl_cfg.downloads_dir.parent / "probes.db") as cache:
+        cache.put(landing_url, False)
+        breaker.record(host, True)
+        clock.now += 60
+        assert mod.download_row("H1", [landing_url], dl_cfg, probe_cache=cache, breaker=breaker).status == (False, 415, landing_url)
+        assert breaker.state(host) == "half-open"
+        for row_id in ("H2", "H3"):
+            assert mod.download_row(row_id, [valid_url], dl_cfg, probe_cache=cache, breaker=breaker).status == (True, 200, valid_url)
+    assert breaker.state(host) == "closed"
+
+
+# PDFs are saved in hash-prefix subdirectories and fsynced by the storage writers
+@pytest.mark.parametrize("stream", [True, False])
+def test_sharded_layout_with_fsync(cfgs, http_server, stream):
+    import storage
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, stream=stream, sharded_layout=True, fsync=True, fsync_batch=2)
+    valid_url = f"{http_server}/valid.pdf"
+    write_excel(Path(data_cfg.data_file), [{"ID": f"S{i}", "PDF_URL": valid_url, "PDF_URL_2": None} for i in range(1, 4)])
+
+    _, status = mod.main_pipeline(data_cfg, dl_cfg)
+    assert status == {200: 3}
+    for i in range(1, 4):
+        assert storage.row_path(dl_cfg.downloads_dir, f"S{i}", sharded=True).read_bytes().startswith(b"%PDF-")
+    assert not list(dl_cfg.downloads_dir.glob("*.pdf"))
+
+
+# With an S3 backend PDFs are uploaded and nothing is left locally, also with dedup and validators, rows whose upload failed are logged as 500
+@pytest.mark.parametrize("fail", [False, True])
+def test_s3_storage_backend(cfgs, http_server, monkeypatch, fail):
+    import storage
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, dedup=True, conditional_requests=True)
+
+    class FakeS3:
+        objects = {}
+
+        def upload_file(self, filename, bucket, key):
+            if fail:
+                raise OSError("upload refused")
+            self.objects[(bucket, key)] = Path(filename).read_bytes()
+
+    client = FakeS3()
+    monkeypatch.setattr(mod, "open_storage", lambda config: storage.S3Storage(client, "bucket", config.downloads_dir, "pdfs/", writers=2))
+    valid_url = f"{http_server}/valid.pdf"
+    write_excel(Path(data_cfg.data_file), [
+        {"ID": "S1", "PDF_URL": valid_url, "PDF_URL_2": None},
+        {"ID": "S2", "PDF_URL": f"{http_server}/missing.pdf", "PDF_URL_2": None},
+    ])
+
+    mod.main_pipeline(data_cfg, dl_cfg)
+    with StatusLog(data_cfg.log_file) as log:
+        latest = log.latest()
+    assert latest["S2"][1] == 404
+    if fail:
+        assert latest["S1"] == (False, 500, valid_url)
+        assert client.objects == {}
+    else:
+        assert latest["S1"] == (True, 200, valid_url)
+        assert list(client.objects) == [("bucket", f"pdfs/{storage.shard_dir('S1')}/S1.pdf")]
+        assert not [path for path in dl_cfg.downloads_dir.rglob("*") if path.is_file()]
+
+
+# A refresh run revalidates only the downloaded rows, unchanged PDFs come back as 304
+def test_main_refresh_revalidates_downloads(cfgs, http_server, tmp_path):
+    import os
+    data_cfg, dl_cfg = cfgs
+    dl_cfg = replace(dl_cfg, conditional_requests=True)
+    rows = [
+        {"ID": "RF1", "PDF_URL": f"{http_server}/valid.pdf", "PDF_URL_2": None},
+        {"ID": "RF2", "PDF_URL": f"{http_server}/complete.pdf", "PDF_URL_2": None},
+        {"ID": "RF3", "PDF_URL": f"{http_server}/missing.pdf", "PDF_URL_2": None},
+    ]
+    write_excel(Path(data_cfg.data_file), rows)
+
+    _, status = mod.main_pipeline(data_cfg, dl_cfg)
+    assert status == {200: 2, 404: 1}
+    # Rows in the status log are skipped by the normal run
+    assert mod.main_pipeline(data_cfg, dl_cfg)[1] == {}
+
+    _, status = mod.main_refresh(data_cfg, dl_cfg)
+    assert status == {304: 2}
+
+    # A PDF changed on the server is downloaded again
+    changed = tmp_path / "www" / "complete.pdf"
+    changed.write_bytes(b"%PDF-1.5\nnew\n%%EOF\n")
+    later = changed.stat().st_mtime + 60
+    os.utime(changed, (later, later))
+    _, status = mod.main_refresh(data_cfg, dl_cfg)
+    assert status == {304: 1, 200: 1}
+    assert (dl_cfg.downloads_dir / "RF2.pdf").read_bytes() == b"%PDF-1.5\nnew\n%%EOF\n"
+    with StatusLog(data_cfg.log_file) as log:
+        assert log.latest()["RF3"][1] == 404
@@ -0,0 +1,149 @@
+import json
+import math
+
+from metrics import HISTOGRAM_BOUNDS, AttemptTiming, Histogram, ProgressReporter, RunMetrics, format_duration, to_prometheus, write_metrics
+
+
+# ============================================================
+# percentile()
+# ------------------------------------------------------------
+# Exact nearest-rank percentile, the reference for Histogram.
+# ============================================================
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)), 1) - 1]
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) is None
+
+
+# ============================================================
+# Histogram
+# ============================================================
+def test_histogram_percentiles_stay_within_a_bucket():
+    values = [(i % 997) / 100 + 0.001 for i in range(10_000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.add(value)
+    for q in (50, 95, 99):
+        exact = percentile(values, q)
+        assert exact <= histogram.percentile(q) <= exact * 1.13
+    # Only the fixed buckets are kept
+    assert len(histogram.counts) == len(HISTOGRAM_BOUNDS) + 1
+    assert Histogram().percentile(50) is None
+
+
+# ============================================================
+# RunMetrics
+# ------------------------------------------------------------
+# Fake clock so the throughput is exact.
+# ============================================================
+def make_run(clock):
+    run = RunMetrics(clock=clock)
+    failed = AttemptTiming("https://a.com/1.pdf", 0, "a.com", ok=False, code=404, connect=0.1, ttfb=0.5, total=0.5)
+    fallback = AttemptTiming("https://b.com/1.pdf", 1, "b.com", ok=True, code=200, connect=0.2, ttfb=1.0, transfer=3.0, total=4.0, bytes=3_000_000)
+    direct = AttemptTiming("https://a.com/2.pdf", 0, "a.com", ok=True, code=200, ttfb=0.2, transfer=0.8, total=1.0, bytes=1_000_000)
+    run.record_attempts([failed, fallback])
+    run.record_row((True, 200, fallback.url), [failed, fallback])
+    run.record_attempts([direct])
+    run.record_row((True, 200, direct.url), [direct])
+    clock.now = 2.0
+    return run
+
+
+def test_summary(clock):
+    summary = make_run(clock).summary()
+    assert summary["rows"] == 2
+    assert summary["status_codes"] == {200: 2}
+    assert summary["success_url_index"] == {1: 1, 0: 1}
+    assert summary["attempts"] == 3 and summary["errors"] == 1
+    assert summary["bytes"] == 4_000_000
+    assert summary["throughput_mb_per_second"] == 2.0
+    assert summary["latency_seconds"] == {"p50": 1.0, "p95": 4.0, "p99": 4.0}
+
+    # Hosts that took the most time come first
+    assert list(summary["hosts"]) == ["b.com", "a.com"]
+    assert summary["hosts"]["a.com"]["stage_seconds"] == {"connect": 0.1, "ttfb": 0.7, "transfer": 0.8, "total": 1.5}
+
+
+def test_prometheus_format(clock):
+    text = to_prometheus(make_run(clock).summary())
+    lines = text.splitlines()
+    assert "# TYPE pdf_downloader_rows_total counter" in lines
+    assert 'pdf_downloader_rows_total{code="200"} 2' in lines
+    assert 'pdf_downloader_success_url_index_total{index="1"} 1' in lines
+    assert "# TYPE pdf_downloader_attempt_latency_seconds summary" in lines
+    assert 'pdf_downloader_attempt_latency_seconds{quantile="0.99"} 4.0' in lines
+    assert "pdf_downloader_attempt_latency_seconds_sum 5.5" in lines
+    assert "pdf_downloader_attempt_latency_seconds_count 3" in lines
+    assert 'pdf_downloader_host_stage_seconds_total{host="b.com",stage="transfer"} 3.0' in lines
+    assert "pdf_downloader_bytes_total 4000000" in lines
+    assert text.endswith("\n")
+
+
+def test_prometheus_escapes_labels():
+    run = RunMetrics()
+    run.record_attempts([AttemptTiming("u", 0, 'we"ird\\host', total=1.0)])
+    assert 'host="we\\"ird\\\\host"' in to_prometheus(run.summary())
+
+
+def test_write_metrics(tmp_path, clock):
+    summary = make_run(clock).summary()
+    json_path, prom_path = write_metrics(summary, tmp_path / "metrics")
+    assert json.loads(json_path.read_text())["rows"] == 2
+    assert prom_path.name == "downloads.prom"
+    assert prom_path.read_text() == to_prometheus(summary)
+
+
+def test_merge_from_another_process(clock):
+    worker = make_run(clock)
+    run = RunMetrics()
+    run.merge(worker.totals, worker.hosts, worker.status_codes, worker.success_url_index)
+    run.merge(worker.totals, worker.hosts, worker.status_codes, worker.success_url_index)
+    summary = run.summary()
+    assert summary["rows"] == 4 and summary["attempts"] == 6
+    assert summary["success_url_index"] == {1: 2, 0: 2}
+    assert summary["latency_seconds"] == {"p50": 1.0, "p95": 4.0, "p99": 4.0}
+    assert summary["hosts"]["a.com"]["stage_seconds"] == {"connect": 0.2, "ttfb": 1.4, "transfer": 1.6, "total": 3.0}
+
+
+# ============================================================
+# ProgressReporter
+# ============================================================
+def test_progress_lines(clock):
+    lines = []
+    progress = ProgressReporter(total=10, interval=5.0, clock=clock, output=lines.append)
+
+    progress.record_attempts([AttemptTiming("u", 0, "a.com", bytes=2_000_000)])
+    progress.record_row((True, 200, "u"))
+    clock.now = 1.0
+    progress.record_row((False, 404, "u"), received=1_000_000)
+    # Not due yet
+    assert lines == []
+
+    clock.now = 5.0
+    progress.record_row((True, 200, "u"))
+    assert lines == ["Progress: 3/10 rows, 0.6 rows/s, 0.60 MB/s, ETA 0:00:12, codes {200: 2, 404: 1}"]
+    assert progress.status_codes == {200: 2, 404: 1}
+
+    clock.now = 6.0
+    progress.record_row((True, 200, "u"))
+    assert len(lines) == 1
+
+
+def test_progress_without_total(clock):
+    progress = ProgressReporter(clock=clock)
+    assert progress.line() == "Progress: 0 rows, 0.0 rows/s, 0.00 MB/s, codes {}"
+
+
+def test_format_duration():
+    assert format_duration(0) == "0:00:00"
+    assert format_duration(3725.4) == "1:02:05"
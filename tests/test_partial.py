@@ -0,0 +1,45 @@
+import partial
+
+
+def test_part_and_meta_paths(tmp_path):
+    part = partial.part_path(tmp_path / "BR1.pdf")
+    assert part.name == "BR1.pdf.part"
+    assert partial.meta_path(part).name == "BR1.pdf.part.json"
+
+
+def test_if_range_validator():
+    assert partial.if_range_validator({"ETag": '"abc"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"}) == '"abc"'
+    # Weak ETags can't be used in If-Range
+    assert partial.if_range_validator({"ETag": 'W/"abc"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"}) == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert partial.if_range_validator({"ETag": 'W/"abc"'}) is None
+
+
+def test_resume_state(tmp_path):
+    part = tmp_path / "BR1.pdf.part"
+    url = "https://a.com/1.pdf"
+    assert not partial.start(part, url, {})
+    # Ranges of a compressed body don't line up with the decoded bytes on disk
+    assert not partial.start(part, url, {"ETag": '"v1"', "Content-Encoding": "gzip"})
+
+    assert partial.start(part, url, {"ETag": '"v1"'})
+    # Nothing received yet
+    assert partial.resume_state(part, url) is None
+
+    part.write_bytes(b"%PDF-1.4\n1234")
+    state = partial.resume_state(part, url)
+    assert state == (13, {"Range": "bytes=13-", "If-Range": '"v1"'})
+    # A part file from another URL is not continued
+    assert partial.resume_state(part, "https://b.com/1.pdf") is None
+
+    part.write_bytes(b"<html>")
+    assert partial.resume_state(part, url) is None
+
+    partial.discard(part)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_content_range_start():
+    assert partial.content_range_start("bytes 100-999/1000") == 100
+    assert partial.content_range_start("bytes 0-9/*") == 0
+    assert partial.content_range_start("bytes */1000") is None
+    assert partial.content_range_start(None) is None
@@ -0,0 +1,59 @@
+import pytest
+
+from probe import ProbeCache, classify, needs_probe
+
+
+# ============================================================
+# needs_probe()
+# ============================================================
+@pytest.mark.parametrize("url, expected", [
+    ("https://a.com/report.pdf", False),
+    ("https://a.com/REPORT.PDF?download=1", False),
+    ("https://a.com/sustainability/reports", True),
+    ("https://a.com/get?file=report.pdf", True),
+    ("http://[::1", False),
+])
+def test_needs_probe(url, expected):
+    assert needs_probe(url) is expected
+
+
+# ============================================================
+# classify()
+# ============================================================
+@pytest.mark.parametrize("content_type, head, expected", [
+    ("application/pdf", b"%PDF-1.7\n", True),
+    # The bytes win over a wrong Content-Type, as they would in verify_pdf
+    ("application/octet-stream", b"%PDF-1.4", True),
+    ("text/html", b"%PDF-1.4", True),
+    ("application/pdf", b"<!DOCTYPE html>", False),
+    ("text/html; charset=utf-8", b"", False),
+    ("image/png", b"", False),
+    ("application/pdf", b"", True),
+    ("application/octet-stream", b"", None),
+    (None, b"%P", None),
+])
+def test_classify(content_type, head, expected):
+    assert classify(content_type, head) is expected
+
+
+# ============================================================
+# ProbeCache
+# ============================================================
+def test_cache_persists_and_expires(tmp_path, clock):
+    with ProbeCache(tmp_path / "probes.db", max_age=60, clock=clock) as cache:
+        assert cache.get("https://a.com/page") is None
+        cache.put("https://a.com/page", False, "text/html")
+        cache.put("https://a.com/doc", True)
+
+    with ProbeCache(tmp_path / "probes.db", max_age=60, clock=clock) as cache:
+        assert cache.get("https://a.com/page") is False
+        assert cache.get("https://a.com/doc") is True
+        clock.now += 61
+        assert cache.get("https://a.com/page") is None
+
+
+def test_in_memory_cache():
+    cache = ProbeCache()
+    cache.put("https://a.com/page", False)
+    cache.put("https://a.com/page", True)
+    assert cache.get("https://a.com/page") is True
@@ -0,0 +1,71 @@
+import random
+import threading
+from email.utils import formatdate
+
+import pytest
+
+from retry import RetryBudget, backoff_delay, parse_retry_after
+
+
+# ============================================================
+# backoff_delay()
+# ============================================================
+def test_backoff_delay_grows_and_is_capped():
+    rng = random.Random(1)
+    for attempt, ceiling in [(0, 1.0), (1, 2.0), (2, 4.0), (10, 30.0)]:
+        delays = [backoff_delay(attempt, 1.0, 30.0, rng) for _ in range(200)]
+        assert all(0 <= d <= ceiling for d in delays)
+        # Full jitter spreads the delays over the whole range
+        assert max(delays) > ceiling * 0.8
+
+
+# ============================================================
+# parse_retry_after()
+# ============================================================
+@pytest.mark.parametrize("value, expected", [
+    (None, None),
+    ("", None),
+    ("120", 120.0),
+    (" 3 ", 3.0),
+    ("soon", None),
+    ("-5", None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    now = 1_700_000_000.0
+    assert parse_retry_after(formatdate(now + 30, usegmt=True), now=now) == 30.0
+    # A date in the past means retry right away
+    assert parse_retry_after(formatdate(now - 30, usegmt=True), now=now) == 0.0
+
+
+# ============================================================
+# RetryBudget
+# ============================================================
+def test_retry_budget_is_earned_by_fresh_requests():
+    budget = RetryBudget(ratio=0.5, minimum=1)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+    budget.record_request()
+    assert not budget.try_spend()
+    budget.record_request()
+    assert budget.try_spend()
+
+
+def test_retry_budget_is_thread_safe():
+    budget = RetryBudget(ratio=0.0, minimum=100)
+    granted = []
+
+    def spend():
+        for _ in range(50):
+            granted.append(budget.try_spend())
+
+    threads = [threading.Thread(target=spend) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(granted) == 100
@@ -0,0 +1,185 @@
+import pytest
+from scheduler import AimdController, HostScheduler, shard_by_host, url_host
+
+
+# ============================================================
+# url_host()
+# ============================================================
+@pytest.mark.parametrize("url, expected", [
+    ("https://Example.com/a.pdf", "example.com"),
+    ("http://127.0.0.1:8000/a.pdf", "127.0.0.1"),
+    ("htp://bad", "bad"),
+    ("not a url", ""),
+    ("http://[::1", ""),
+])
+def test_url_host(url, expected):
+    assert url_host(url) == expected
+
+
+# ============================================================
+# HostScheduler
+# ------------------------------------------------------------
+# Uses a fake clock so interval checks are deterministic.
+# ============================================================
+@pytest.fixture
+def make_scheduler(clock):
+    def make(max_per_host=1, min_interval=0.0):
+        return HostScheduler(max_per_host, min_interval, clock=clock), clock
+    return make
+
+
+# --- Hosts are interleaved round robin ---
+def test_hosts_are_interleaved(make_scheduler):
+    sched, _ = make_scheduler(max_per_host=10)
+    sched.add("a1", ["https://a.com/1.pdf"])
+    sched.add("a2", ["https://a.com/2.pdf"])
+    sched.add("b1", ["https://b.com/1.pdf"])
+    sched.add("b2", ["https://b.com/2.pdf"])
+
+    order = [sched.next()[0] for _ in range(4)]
+    assert order == ["a1", "b1", "a2", "b2"]
+    assert len(sched) == 0
+    assert sched.next() is None
+
+
+# --- max_per_host caps in-flight rows and counts throttling ---
+def test_max_in_flight_per_host(make_scheduler):
+    sched, _ = make_scheduler(max_per_host=1)
+    sched.add("a1", ["https://a.com/1.pdf"])
+    sched.add("a2", ["https://a.com/2.pdf"])
+
+    assert sched.next()[0] == "a1"
+    assert sched.next() is None
+    assert sched.next() is None
+    # One event per row that had to wait, however often it was passed over
+    assert sched.throttled["a.com"] == 1
+
+    sched.release("a.com")
+    assert sched.next()[0] == "a2"
+    sched.add("a3", ["https://a.com/3.pdf"])
+    assert sched.next() is None
+    assert sched.throttled["a.com"] == 2
+
+
+# --- min_interval spaces out starts against the same host ---
+def test_min_interval_per_host(make_scheduler):
+    sched, clock = make_scheduler(max_per_host=5, min_interval=2.0)
+    sched.add("a1", ["https://a.com/1.pdf"])
+    sched.add("a2", ["https://a.com/2.pdf"])
+
+    assert sched.next()[0] == "a1"
+    assert sched.next() is None
+    assert sched.wait_time() == 2.0
+
+    clock.now = 1.5
+    assert sched.wait_time() == 0.5
+    assert sched.next() is None
+
+    clock.now = 2.0
+    assert sched.next()[0] == "a2"
+
+
+# --- A throttled host does not block other hosts ---
+def test_throttled_host_does_not_block_others(make_scheduler):
+    sched, _ = make_scheduler(max_per_host=1, min_interval=10.0)
+    sched.add("a1", ["https://a.com/1.pdf"])
+    sched.add("a2", ["https://a.com/2.pdf"])
+    sched.add("b1", ["https://b.com/1.pdf"])
+
+    assert sched.next()[0] == "a1"
+    assert sched.next()[0] == "b1"
+    assert sched.next() is None
+    assert sched.throttled == {"a.com": 1}
+
+
+# --- Rows without a host are never throttled ---
+def test_rows_without_host_are_not_throttled(make_scheduler):
+    sched, _ = make_scheduler(max_per_host=1, min_interval=10.0)
+    sched.add("x1", ["not a url"])
+    sched.add("x2", [])
+
+    assert sched.next()[0] == "x1"
+    assert sched.next()[0] == "x2"
+    assert sched.wait_time() is None
+
+
+# --- Delayed rows wait for their delay, then queue like other rows ---
+def test_delayed_rows(make_scheduler):
+    sched, clock = make_scheduler(max_per_host=10)
+    sched.add("a1", ["https://a.com/1.pdf"], delay=5.0)
+    sched.add("a2", ["https://a.com/2.pdf"])
+
+    assert len(sched) == 2 and sched.delayed == 1
+    assert sched.next()[0] == "a2"
+    assert sched.next() is None
+    assert sched.wait_time() == 5.0
+
+    clock.now = 5.0
+    assert sched.next()[0] == "a1"
+    assert not sched
+
+
+# ============================================================
+# AimdController
+# ------------------------------------------------------------
+# Windows are as long as the current limit, fake clock again.
+# ============================================================
+def run_window(controller, clock, latency=1.0, code=200, duration=1.0):
+    clock.now += duration
+    for _ in range(controller.limit):
+        controller.record(latency, code)
+
+
+def test_aimd_grows_while_healthy_up_to_maximum(clock):
+    controller = AimdController(minimum=1, maximum=7, initial=2, increase=2, clock=clock)
+    for _ in range(5):
+        run_window(controller, clock)
+    assert controller.limit == 7
+    assert [limit for _, limit in controller.history] == [2, 4, 6, 7]
+
+
+def test_aimd_halves_on_congestion_down_to_minimum(clock):
+    controller = AimdController(minimum=3, maximum=32, initial=16, clock=clock)
+    run_window(controller, clock, code=503)
+    assert controller.limit == 8
+    run_window(controller, clock, code=408)
+    run_window(controller, clock, code=429)
+    assert controller.limit == 3
+    assert controller.history[-1] == (3.0, 3)
+
+
+def test_aimd_backs_off_when_latency_rises(clock):
+    controller = AimdController(minimum=1, maximum=32, initial=4, clock=clock)
+    run_window(controller, clock, latency=1.0)
+    assert controller.limit == 6
+    run_window(controller, clock, latency=5.0)
+    assert controller.limit == 3
+
+
+def test_aimd_holds_when_throughput_drops(clock):
+    controller = AimdController(minimum=1, maximum=32, initial=4, increase=4, clock=clock)
+    run_window(controller, clock, duration=1.0)    # 4 rows/s
+    assert controller.limit == 8
+    run_window(controller, clock, duration=4.0)    # 2 rows/s, more workers did not help
+    assert controller.limit == 8
+
+
+# ============================================================
+# shard_by_host()
+# ============================================================
+def test_shard_by_host_keeps_hosts_together_and_balances():
+    rows = [(f"a{i}", [f"https://a.com/{i}.pdf"]) for i in range(4)]
+    rows += [(f"b{i}", [f"https://b.com/{i}.pdf", f"https://c.com/{i}.pdf"]) for i in range(3)]
+    rows += [("c0", ["https://c.com/0.pdf"]), ("d0", ["https://d.com/0.pdf"]), ("none", [])]
+    first, second = shard_by_host(rows, 2)
+
+    # Largest host first, then each host goes to the emptier shard
+    assert [row_id for row_id, _ in first] == ["a0", "a1", "a2", "a3", "d0"]
+    assert [row_id for row_id, _ in second] == ["b0", "b1", "b2", "c0", "none"]
+
+
+def test_shard_by_host_keeps_input_order_and_allows_empty_shards():
+    rows = [("x2", ["https://x.com/2.pdf"]), ("y1", ["https://y.com/1.pdf"]), ("x1", ["https://x.com/1.pdf"])]
+    shards = shard_by_host(rows, 3)
+    assert shards == [[rows[0], rows[2]], [rows[1]], []]
+    assert shard_by_host(rows, 1) == [rows]
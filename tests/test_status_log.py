@@ -0,0 +1,97 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from status_log import StatusLog
+from download_files import open_status_log
+
+
+# ============================================================
+# StatusLog
+# ------------------------------------------------------------
+# Backed by a real SQLite file in tmp_path.
+# ============================================================
+def test_record_and_latest(tmp_path):
+    with StatusLog(tmp_path / "status.db") as log:
+        log.record("BR1", (True, 200, "https://a.com/1.pdf"))
+        log.record("BR2", (False, 404, "https://a.com/2.pdf"))
+        assert log.latest() == {
+            "BR1": (True, 200, "https://a.com/1.pdf"),
+            "BR2": (False, 404, "https://a.com/2.pdf"),
+        }
+        assert log.processed_ids() == {"BR1", "BR2"}
+        assert len(log) == 2
+
+
+# --- Re-attempts are appended and the newest one wins ---
+def test_latest_attempt_wins(tmp_path):
+    with StatusLog(tmp_path / "status.db") as log:
+        log.record("BR1", (False, 408, "https://a.com/1.pdf"))
+        log.record("BR1", (True, 200, "https://a.com/1.pdf"))
+        assert log.latest() == {"BR1": (True, 200, "https://a.com/1.pdf")}
+        assert len(log) == 1
+
+
+# --- Only rows whose latest attempt failed with one of the codes are returned ---
+def test_ids_with_codes(tmp_path):
+    with StatusLog(tmp_path / "status.db") as log:
+        log.record("BR1", (False, 503, "u"))
+        log.record("BR2", (False, 404, "u"))
+        log.record("BR3", (False, 408, "u"))
+        log.record("BR3", (True, 200, "u"))
+        log.record("BR4", (False, 408, "u"))
+        assert log.ids_with_codes({408, 503}) == {"BR1", "BR4"}
+
+
+# --- Only rows whose latest attempt succeeded are returned ---
+def test_succeeded_ids(tmp_path):
+    with StatusLog(tmp_path / "status.db") as log:
+        log.record("BR1", (True, 200, "u"))
+        log.record("BR2", (True, 200, "u"))
+        log.record("BR2", (False, 404, "u"))
+        log.record("BR3", (False, 503, "u"))
+        log.record("BR3", (True, 304, "u"))
+        assert log.succeeded_ids() == {"BR1", "BR3"}
+
+
+# --- Results survive closing and reopening the log ---
+def test_results_persist_across_runs(tmp_path):
+    path = tmp_path / "logs" / "status.db"
+    with StatusLog(path) as log:
+        log.record(123, (True, 200, "https://a.com/1.pdf"))
+    with StatusLog(path) as log:
+        assert log.processed_ids() == {"123"}
+
+
+# --- Many threads can record at once ---
+def test_concurrent_records(tmp_path):
+    with StatusLog(tmp_path / "status.db") as log:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for i in range(200):
+                executor.submit(log.record, f"BR{i}", (True, 200, "u"))
+        assert len(log.processed_ids()) == 200
+
+
+# --- An old log.json is imported the first time the log is opened ---
+def test_open_status_log_imports_legacy_json(tmp_path):
+    (tmp_path / "log.json").write_text(json.dumps({"BR1": [False, 404, "https://a.com/1.pdf"]}))
+    cfg = SimpleNamespace(log_file=tmp_path / "status.db")
+
+    with open_status_log(cfg) as log:
+        assert log.latest() == {"BR1": (False, 404, "https://a.com/1.pdf")}
+        log.record("BR2", (True, 200, "https://a.com/2.pdf"))
+
+    # Not imported a second time
+    with open_status_log(cfg) as log:
+        assert len(log) == 2
+        assert log.latest()["BR1"] == (False, 404, "https://a.com/1.pdf")
+
+
+# --- Status codes of the most recent attempt per row are counted in SQLite ---
+def test_code_counts(tmp_path):
+    with StatusLog(tmp_path / "status.db") as log:
+        log.record("BR1", (False, 408, "https://a.com/1.pdf"))
+        log.record("BR1", (True, 200, "https://a.com/1.pdf"))
+        log.record("BR2", (True, 200, "https://a.com/2.pdf"))
+        log.record("BR3", (False, 404, "https://a.com/3.pdf"))
+        assert log.code_counts() == {200: 2, 404: 1}
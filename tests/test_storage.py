@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from storage import LocalStorage, S3Storage, atomic_write_bytes, row_path, shard_dir
+
+
+# ---------- In-process stand-in for an S3 client ----------
+class FakeS3:
+    def __init__(self, fail=False):
+        self.objects = {}
+        self.fail = fail
+
+    def upload_file(self, filename, bucket, key):
+        if self.fail:
+            raise OSError("upload refused")
+        self.objects[(bucket, key)] = Path(filename).read_bytes()
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    """Counts the calls to os.fsync."""
+    calls = []
+    real_fsync = os.fsync
+
+    def fsync(fd):
+        calls.append(fd)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    return calls
+
+
+# --- Rows are spread over two-hex-digit subdirectories, the flat layout is unchanged ---
+def test_row_path(tmp_path):
+    assert row_path(tmp_path, "R1") == tmp_path / "R1.pdf"
+    sharded = row_path(tmp_path, "R1", sharded=True)
+    assert sharded == tmp_path / shard_dir("R1") / "R1.pdf"
+    assert len(shard_dir("R1")) == 2 and int(shard_dir("R1"), 16) < 256
+    assert shard_dir(1) == shard_dir("1")
+
+
+# --- Atomic writes replace the file and leave no temp file behind ---
+def test_atomic_write_bytes(tmp_path):
+    path = tmp_path / "R1.pdf"
+    path.write_bytes(b"old")
+    atomic_write_bytes(path, b"%PDF-new")
+    assert path.read_bytes() == b"%PDF-new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+# --- Without fsync commit is free, with fsync files are flushed in batches plus once per directory ---
+@pytest.mark.parametrize("writers", [0, 2])
+def test_local_storage_batches_fsync(tmp_path, fsyncs, writers):
+    with LocalStorage(tmp_path, sharded=True, writers=writers) as store:
+        path = store.path("R1")
+        path.write_bytes(b"%PDF-")
+        store.commit("R1", path)
+        assert store.flush() == []
+    assert fsyncs == []
+    assert path.parent.name == shard_dir("R1")
+
+    store = LocalStorage(tmp_path, writers=writers, fsync=True, fsync_batch=3)
+    for i in range(4):
+        path = store.path(f"R{i}")
+        path.write_bytes(b"%PDF-")
+        store.commit(f"R{i}", path)
+    assert store.close() == []
+    # A full batch of three files and their directory, then the last file and its directory on close
+    assert len(fsyncs) == 3 + 1 + 1 + 1
+
+
+# --- A failed fsync is returned by flush with the row and URL ---
+def test_local_storage_reports_fsync_failures(tmp_path):
+    store = LocalStorage(tmp_path, writers=1, fsync=True)
+    path = store.path("R1")
+    store.commit("R1", path, "http://a.com/1.pdf")  # never written
+    failures = store.close()
+    assert [(row_id, url) for row_id, url, _ in failures] == [("R1", "http://a.com/1.pdf")]
+    assert isinstance(failures[0][2], FileNotFoundError)
+
+
+# --- S3: files are uploaded under the sharded key and removed from the staging directory ---
+def test_s3_storage_uploads(tmp_path):
+    client = FakeS3()
+    with S3Storage(client, "bucket", tmp_path, prefix="pdfs/", writers=2) as store:
+        for row_id in ("R1", "R2"):
+            path = store.path(row_id)
+            path.write_bytes(b"%PDF-" + row_id.encode())
+            store.commit(row_id, path)
+        assert store.flush() == []
+
+    assert client.objects == {
+        ("bucket", f"pdfs/{shard_dir('R1')}/R1.pdf"): b"%PDF-R1",
+        ("bucket", f"pdfs/{shard_dir('R2')}/R2.pdf"): b"%PDF-R2",
+    }
+    assert not list(tmp_path.rglob("*.pdf"))
+
+
+# --- S3: a failed upload is reported and the local copy is kept ---
+def test_s3_storage_upload_failure(tmp_path):
+    store = S3Storage(FakeS3(fail=True), "bucket", tmp_path)
+    path = store.path("R1")
+    path.write_bytes(b"%PDF-")
+    store.commit("R1", path, "http://a.com/1.pdf")
+    failures = store.close()
+    assert [(row_id, url, str(error)) for row_id, url, error in failures] == [("R1", "http://a.com/1.pdf", "upload refused")]
+    assert path.exists()
@@ -0,0 +1,61 @@
+import pytest
+
+from validation import CORRUPT_CODE, TRAILER_WINDOW, TRUNCATED_CODE, InvalidPdf, PdfValidator, expected_length
+
+
+# ============================================================
+# expected_length()
+# ============================================================
+@pytest.mark.parametrize("headers, expected", [
+    ({"Content-Length": "123"}, 123),
+    ({"Content-Length": "123", "Content-Encoding": "identity"}, 123),
+    ({"Content-Length": "123", "Content-Encoding": "gzip"}, None),
+    ({"Content-Length": "abc"}, None),
+    ({"Content-Length": "-1"}, None),
+    ({}, None),
+])
+def test_expected_length(headers, expected):
+    assert expected_length(headers) == expected
+
+
+# ============================================================
+# PdfValidator
+# ============================================================
+def feed(validator, body, chunk_size):
+    for start in range(0, len(body), chunk_size):
+        validator.update(body[start:start + chunk_size])
+    return validator
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, TRAILER_WINDOW, 10_000])
+def test_complete_pdf_passes(chunk_size):
+    body = b"%PDF-1.7\n" + b"x" * 5000 + b"\n%%EOF\n"
+    validator = feed(PdfValidator(len(body)), body, chunk_size)
+    validator.finish()
+    assert validator.received == len(body)
+
+
+# The marker may be split across chunks and followed by a little padding
+def test_trailer_split_across_chunks_and_padded():
+    feed(PdfValidator(), b"%PDF-1.4\n...%%EOF" + b" " * 100, 15).finish()
+
+
+def test_truncated_body():
+    body = b"%PDF-1.4\n" + b"x" * 100
+    with pytest.raises(InvalidPdf) as e:
+        feed(PdfValidator(len(body) + 50), body, 16).finish()
+    assert e.value.code == TRUNCATED_CODE
+
+
+@pytest.mark.parametrize("body", [
+    b"%PDF-<html><body>Error</body></html>",
+    b"%PDF-1.4\n%%EOF" + b"x" * TRAILER_WINDOW,
+])
+def test_missing_trailer(body):
+    with pytest.raises(InvalidPdf) as e:
+        feed(PdfValidator(len(body)), body, 64).finish()
+    assert e.value.code == CORRUPT_CODE
+
+
+def test_trailer_check_can_be_skipped():
+    feed(PdfValidator(check_trailer=False), b"%PDF-1.4\n...", 4).finish()
@@ -0,0 +1,81 @@
+from collections.abc import Mapping
+
+
+# Status codes for responses that start like a PDF but fail the checks at the end of the body.
+# Outside the HTTP range, so a server's own 417 or 422 response keeps its meaning in the status log.
+TRUNCATED_CODE = 917  # fewer bytes than Content-Length, or the connection was cut mid-body
+CORRUPT_CODE = 922  # no %%EOF trailer, e.g. an HTML error page or a file cut off at a clean boundary
+
+EOF_MARKER = b"%%EOF"
+# Readers look for the %%EOF marker within the last 1024 bytes of the file
+TRAILER_WINDOW = 1024
+
+
+class InvalidPdf(Exception):
+    """Raised when a downloaded body is not a complete PDF.
+
+    Attributes:
+        code: TRUNCATED_CODE or CORRUPT_CODE.
+    """
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def expected_length(headers: Mapping[str, str]) -> int | None:
+    """Returns the number of body bytes a response announces.
+
+    Args:
+        headers: The response headers, with case-insensitive lookup.
+
+    Returns:
+        int | None: The Content-Length, or None if it is missing, invalid, or counts
+            compressed bytes while the body is read decoded.
+    """
+    if headers.get("Content-Encoding", "identity").strip().lower() != "identity":
+        return None
+    try:
+        length = int(headers.get("Content-Length", ""))
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+class PdfValidator:
+    """Checks a PDF body chunk by chunk while it is written, without a second read of the file.
+
+    Only a count of the bytes and the last TRAILER_WINDOW bytes are kept, so memory does
+    not grow with the file. The %PDF- header is checked before anything is written, see
+    download_files.verify_pdf.
+    """
+
+    def __init__(self, expected_length: int | None = None, check_trailer: bool = True):
+        self.expected_length = expected_length
+        self.check_trailer = check_trailer
+        self.received = 0
+        self._tail = b""
+
+    def update(self, chunk: bytes) -> None:
+        """Adds the next chunk of the body.
+
+        Args:
+            chunk: Body bytes, in the order they were received.
+        """
+        self.received += len(chunk)
+        if len(chunk) >= TRAILER_WINDOW:
+            self._tail = chunk[-TRAILER_WINDOW:]
+        else:
+            self._tail = (self._tail + chunk)[-TRAILER_WINDOW:]
+
+    def finish(self) -> None:
+        """Checks the body once it was received completely.
+
+        Raises:
+            InvalidPdf: With TRUNCATED_CODE if the byte count differs from expected_length,
+                or with CORRUPT_CODE if there is no %%EOF marker near the end.
+        """
+        if self.expected_length is not None and self.received != self.expected_length:
+            raise InvalidPdf(TRUNCATED_CODE, f"received {self.received} of {self.expected_length} bytes")
+        if self.check_trailer and EOF_MARKER not in self._tail:
+            raise InvalidPdf(CORRUPT_CODE, f"no {EOF_MARKER.decode()} trailer in the last {TRAILER_WINDOW} bytes")